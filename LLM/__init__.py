@@ -1,4 +1,6 @@
-from .openai import OpenAI as OpenAIClient
+from .openai import (OpenAI as OpenAIClient, ResponseCache, StructuredOutputError, RequestScheduler, RateLimit,
+                     SharedRateLimitStore, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, request_priority)
 from .exceptions import OpenAIError, APIError, AuthenticationError
 
-__all__ = ['OpenAIClient', 'OpenAIError', 'APIError', 'AuthenticationError']
\ No newline at end of file
+__all__ = ['OpenAIClient', 'ResponseCache', 'StructuredOutputError', 'RequestScheduler', 'RateLimit', 'SharedRateLimitStore',
+           'PRIORITY_INTERACTIVE', 'PRIORITY_BACKGROUND', 'request_priority', 'OpenAIError', 'APIError', 'AuthenticationError']
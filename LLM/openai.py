@@ -1,16 +1,32 @@
 import os
 import time
 import json
+import heapq
+import httpx
+import random
+import asyncio
+import sqlite3
+import hashlib
 import requests
-from typing import List, Dict, Optional, Union, Any, Iterator
-from dataclasses import dataclass, field
+import threading
+import itertools
+import contextvars
+from email.utils import parsedate_to_datetime
+from pydantic import BaseModel, ValidationError
+from typing import List, Dict, Optional, Union, Any, Iterator, AsyncIterator
+from dataclasses import dataclass, field, asdict
 from datetime import datetime
 
+from cache import DEFAULT_CACHE_DIR, TieredCache, SingleFlight
+from telemetry import CACHE_LOOKUPS, LLM_REQUESTS, LLM_RETRIES, LLM_TOKENS, logger
+
 @dataclass
 class Message:
     """消息对象"""
     content: str
     role: str
+    # 结构化输出（parse）校验后的pydantic对象
+    parsed: Optional[Any] = None
 
 @dataclass
 class Delta:
@@ -44,6 +60,7 @@ class ChatCompletion:
     model: str
     choices: List[Choice]
     usage: Optional[Usage] = None
+    attempts: int = 1  # 得到该回复所发的请求数，parse包含修复重试
 
 class APIError(Exception):
     """API错误基类"""
@@ -65,11 +82,402 @@ class BadRequestError(APIError):
     """请求错误"""
     pass
 
+class StructuredOutputError(APIError):
+    """结构化输出在修复重试后仍未通过校验"""
+    def __init__(self, message=None, attempts: int = 1, usage: Optional["Usage"] = None):
+        super().__init__(message)
+        self.attempts = attempts  # 已发出的请求数
+        self.usage = usage  # 所有尝试的累计用量
+
+def _extract_json(content: str) -> str:
+    """从回复中取出JSON对象文本，兼容```json代码块和前后多余文字"""
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.split("\n", 1)[-1].rsplit("```", 1)[0].strip()
+    if not content.startswith("{"):
+        start, end = content.find("{"), content.rfind("}")
+        if start != -1 and end > start:
+            content = content[start:end + 1]
+    return content
+
+# 请求优先级，数值越小越先调度：交互式请求（MCP）抢占后台任务
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+# 当前上下文中发出的请求的默认优先级，子任务继承；未显式传priority时使用
+request_priority: contextvars.ContextVar[int] = contextvars.ContextVar("request_priority", default=PRIORITY_BACKGROUND)
+
+@dataclass
+class RateLimit:
+    """单个模型的客户端限额，0表示不限"""
+    rpm: float = 0
+    tpm: float = 0
+
+class TokenBucket:
+    """令牌桶：容量为每分钟额度，按速率连续补充；可被实际用量扣成负数（欠账），欠账还清前不放行"""
+    def __init__(self, per_minute: float, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """取出amount需要等待的秒数，超过容量的请求按容量计算"""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(amount - self.level, 0.0) / self.rate
+
+    def consume(self, amount: float):
+        if self.capacity <= 0:
+            return
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """按实际用量修正已扣除的额度，amount为实际减预估"""
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level - amount)
+
+class SharedRateLimitStore:
+    """
+    多进程共享的限额状态：每个模型的RPM/TPM令牌桶和429暂停时间保存在SQLite文件中，
+    同一台机器上的多个worker进程共用一份API额度。每次放行在一个写事务中完成检查和扣除。
+    """
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite文件路径，所有共享限额的进程使用同一个文件
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS pauses (model TEXT PRIMARY KEY, until REAL NOT NULL)")
+
+    def _buckets(self, model: str, limit: RateLimit) -> List[TokenBucket]:
+        buckets = []
+        for kind, per_minute in (("rpm", limit.rpm), ("tpm", limit.tpm)):
+            bucket = TokenBucket(per_minute, clock=time.time)
+            row = self._conn.execute("SELECT level, updated FROM buckets WHERE key = ?", (f"{model}/{kind}",)).fetchone()
+            if row is not None:
+                bucket.level, bucket.updated = row
+            buckets.append(bucket)
+        return buckets
+
+    def _save(self, model: str, buckets: List[TokenBucket]):
+        for kind, bucket in zip(("rpm", "tpm"), buckets):
+            if bucket.capacity > 0:
+                self._conn.execute("INSERT OR REPLACE INTO buckets (key, level, updated) VALUES (?, ?, ?)",
+                                   (f"{model}/{kind}", bucket.level, bucket.updated))
+
+    def try_acquire(self, model: str, limit: RateLimit, tokens: int) -> float:
+        """
+        额度足够且模型未暂停时扣除1个请求和tokens个token
+
+        Returns:
+            float: 0表示已放行，否则为还需等待的秒数
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests_bucket, tokens_bucket = buckets = self._buckets(model, limit)
+                row = self._conn.execute("SELECT until FROM pauses WHERE model = ?", (model,)).fetchone()
+                wait = max(requests_bucket.wait_time(1), tokens_bucket.wait_time(tokens),
+                           (row[0] - time.time()) if row else 0.0)
+                if wait <= 0:
+                    requests_bucket.consume(1)
+                    tokens_bucket.consume(tokens)
+                    self._save(model, buckets)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return max(wait, 0.0)
+
+    def adjust(self, model: str, limit: RateLimit, amount: float):
+        """按实际用量修正TPM令牌桶，amount为实际减预估"""
+        if limit.tpm <= 0:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                buckets = self._buckets(model, limit)
+                buckets[1].adjust(amount)
+                self._save(model, buckets)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def pause(self, model: str, seconds: float):
+        """收到429后让所有进程中该模型的请求暂停seconds秒"""
+        until = time.time() + seconds
+        with self._lock:
+            self._conn.execute("INSERT INTO pauses (model, until) VALUES (?, ?) "
+                               "ON CONFLICT(model) DO UPDATE SET until = MAX(until, excluded.until)", (model, until))
+
+    def close(self):
+        self._conn.close()
+
+class _ModelState:
+    """单个模型的令牌桶、等待队列和429后的暂停时间"""
+    def __init__(self, limit: RateLimit):
+        self.requests = TokenBucket(limit.rpm)
+        self.tokens = TokenBucket(limit.tpm)
+        self.waiters: List[tuple] = []
+        self.condition: Optional[asyncio.Condition] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.paused_until = 0.0
+
+    def bind(self):
+        """等待队列绑定到当前事件循环，客户端被多个asyncio.run复用时重新创建"""
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.condition = asyncio.Condition()
+            self.waiters = []
+
+class RequestScheduler:
+    """
+    LLM请求调度：按模型的RPM/TPM令牌桶限流、按优先级排队，失败时指数退避重试。
+
+    同一模型的等待请求按(优先级, 到达顺序)放行，交互式请求排在后台请求之前。
+    429和5xx、连接错误会重试，等待时间优先取Retry-After，否则为带全抖动的指数退避；
+    收到429时该模型的所有请求一起暂停，避免在限额边缘反复触发限流。
+    配置了SharedRateLimitStore时令牌桶和暂停由多个进程共享，排队顺序仍在各进程内部。
+    """
+    def __init__(
+        self,
+        limits: Optional[Dict[str, RateLimit]] = None,
+        default_limit: Optional[RateLimit] = None,
+        max_retries: int = int(os.environ.get("LLM_MAX_RETRIES", 5)),
+        base_delay: float = 0.5,
+        max_delay: float = 60.0,
+        completion_tokens: int = 512,
+        store: Optional[SharedRateLimitStore] = None
+    ):
+        """
+        Args:
+            limits: 每个模型的限额，默认从环境变量LLM_RATE_LIMITS读取，格式"gpt-4.1=500/30000,gpt-4.1-mini=1000/200000"
+            default_limit: 未配置模型的限额，默认为环境变量LLM_RPM/LLM_TPM，未设置则不限
+            max_retries: 最大重试次数
+            base_delay: 退避的初始等待秒数
+            max_delay: 单次等待的上限秒数
+            completion_tokens: 未指定max_tokens时预估的生成token数
+            store: 多进程共享的限额状态，默认在设置了环境变量LLM_RATE_LIMIT_DB（SQLite文件路径）时创建，否则只在本进程内限流
+        """
+        self.limits = self._parse_limits(os.environ.get("LLM_RATE_LIMITS", ""))
+        self.limits.update(limits or {})
+        self.default_limit = default_limit or RateLimit(float(os.environ.get("LLM_RPM", 0)), float(os.environ.get("LLM_TPM", 0)))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.completion_tokens = completion_tokens
+        if store is None and os.environ.get("LLM_RATE_LIMIT_DB"):
+            store = SharedRateLimitStore(os.environ["LLM_RATE_LIMIT_DB"])
+        self.store = store
+        self.retries = 0
+        self._states: Dict[str, _ModelState] = {}
+        self._sequence = itertools.count()
+
+    @staticmethod
+    def _parse_limits(spec: str) -> Dict[str, RateLimit]:
+        limits = {}
+        for item in spec.split(","):
+            if "=" not in item:
+                continue
+            model, values = item.split("=", 1)
+            rpm, _, tpm = values.partition("/")
+            limits[model.strip()] = RateLimit(float(rpm or 0), float(tpm or 0))
+        return limits
+
+    def _state(self, model: str) -> _ModelState:
+        state = self._states.get(model)
+        if state is None:
+            state = self._states[model] = _ModelState(self.limits.get(model, self.default_limit))
+        return state
+
+    def estimate_tokens(self, data: Dict[str, Any]) -> int:
+        """请求的预估token数：消息字符数/4加上max_tokens（或默认生成长度）"""
+        chars = sum(len(str(message.get("content") or "")) for message in data.get("messages", []))
+        return chars // 4 + (data.get("max_tokens") or self.completion_tokens)
+
+    async def acquire(self, model: str, tokens: int, priority: Optional[int] = None):
+        """
+        等待轮到该请求且模型的RPM/TPM额度足够，然后扣除额度
+
+        Args:
+            model: 模型名称
+            tokens: 预估token数
+            priority: 优先级，默认取request_priority
+        """
+        state = self._state(model)
+        state.bind()
+        entry = (request_priority.get() if priority is None else priority, next(self._sequence))
+        async with state.condition:
+            heapq.heappush(state.waiters, entry)
+            state.condition.notify_all()
+            try:
+                while True:
+                    timeout = None
+                    if state.waiters[0] == entry:
+                        timeout = self._try_consume(model, state, tokens)
+                        if timeout <= 0:
+                            return
+                    try:
+                        await asyncio.wait_for(state.condition.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                state.waiters.remove(entry)
+                heapq.heapify(state.waiters)
+                state.condition.notify_all()
+
+    def _try_consume(self, model: str, state: _ModelState, tokens: int) -> float:
+        """额度足够时扣除并返回0，否则返回需要等待的秒数"""
+        if self.store is not None:
+            return self.store.try_acquire(model, self.limits.get(model, self.default_limit), tokens)
+        timeout = max(state.requests.wait_time(1), state.tokens.wait_time(tokens), state.paused_until - time.monotonic())
+        if timeout <= 0:
+            state.requests.consume(1)
+            state.tokens.consume(tokens)
+        return timeout
+
+    def waiting(self) -> Dict[str, int]:
+        """每个模型正在排队等待额度的请求数"""
+        return {model: len(state.waiters) for model, state in self._states.items()}
+
+    def settle(self, model: str, estimated: int, usage: Optional[Usage]):
+        """用响应中的实际用量修正TPM令牌桶"""
+        if usage is not None and usage.total_tokens:
+            if self.store is not None:
+                self.store.adjust(model, self.limits.get(model, self.default_limit), usage.total_tokens - estimated)
+            else:
+                self._state(model).tokens.adjust(usage.total_tokens - estimated)
+
+    def retry_delay(self, model: str, error: Exception, attempt: int) -> Optional[float]:
+        """
+        失败后的等待秒数，不应重试时返回None
+
+        Args:
+            model: 模型名称
+            error: 请求抛出的异常
+            attempt: 已重试次数
+
+        Returns:
+            Optional[float]: 等待秒数；不可重试的错误或重试次数用完时为None
+        """
+        if attempt >= self.max_retries or not isinstance(error, APIError) or isinstance(error, StructuredOutputError):
+            return None
+        status = error.http_status
+        if status is not None and status != 429 and status < 500:
+            return None
+        delay = self._retry_after(error.response)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        delay = min(delay, self.max_delay)
+        if status == 429:
+            if self.store is not None:
+                self.store.pause(model, delay)
+            else:
+                state = self._state(model)
+                state.paused_until = max(state.paused_until, time.monotonic() + delay)
+        self.retries += 1
+        return delay
+
+    @staticmethod
+    def _retry_after(response) -> Optional[float]:
+        """解析retry-after-ms / Retry-After（秒数或HTTP日期）"""
+        if response is None:
+            return None
+        headers = response.headers
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            value = headers.get("retry-after")
+            if not value:
+                return None
+            try:
+                return max(float(value), 0.0)
+            except ValueError:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+class ResponseCache(TieredCache):
+    """
+    LLM响应缓存（内存LRU + 可选SQLite磁盘层），键为(model, messages, temperature, tools, 其他参数)的规范化哈希。
+
+    默认只缓存temperature为0的确定性请求，allow_temperature=True时所有温度都缓存。
+    相同的并发请求通过single_flight共享同一个在途调用。
+    """
+    def __init__(
+        self,
+        ttl: float = 24 * 3600,
+        memory_bytes: int = 32_000_000,
+        disk_path: Optional[str] = os.path.join(DEFAULT_CACHE_DIR, "llm.sqlite"),
+        disk_bytes: int = 256_000_000,
+        allow_temperature: bool = False
+    ):
+        super().__init__(ttl=ttl, memory_bytes=memory_bytes, disk_path=disk_path, disk_bytes=disk_bytes)
+        self.allow_temperature = allow_temperature
+        self.single_flight = SingleFlight(self.stats)
+
+    def cacheable(self, data: Dict[str, Any]) -> bool:
+        """流式请求不缓存；temperature>0的请求除非allow_temperature否则不缓存"""
+        if data.get("stream"):
+            return False
+        return self.allow_temperature or not data.get("temperature")
+
+    @staticmethod
+    def key(data: Dict[str, Any]) -> str:
+        """请求体的规范化哈希，None值参数视为未传"""
+        canonical = {k: v for k, v in data.items() if v is not None and k != "stream"}
+        payload = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
 class Completions:
     """补全API类"""
     def __init__(self, client):
         self.client = client
 
+    def _build_request(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        stream: bool,
+        **kwargs
+    ):
+        """构造请求的url、headers和body"""
+        url = f"{self.client.base_url}/chat/completions"
+        
+        headers = {
+            "Authorization": f"Bearer {self.client.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": stream,
+            **kwargs
+        }
+        
+        if max_tokens is not None:
+            data["max_tokens"] = max_tokens
+        return url, headers, data
+
     def create(
         self,
         messages: List[Dict[str, str]],
@@ -93,23 +501,7 @@ class Completions:
         Returns:
             ChatCompletion或Iterator[ChatCompletion]: 聊天补全响应或流式响应迭代器
         """
-        url = f"{self.client.base_url}/chat/completions"
-        
-        headers = {
-            "Authorization": f"Bearer {self.client.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": model,
-            "messages": messages,
-            "temperature": temperature,
-            "stream": stream,
-            **kwargs
-        }
-        
-        if max_tokens is not None:
-            data["max_tokens"] = max_tokens
+        url, headers, data = self._build_request(messages, model, temperature, max_tokens, stream, **kwargs)
             
         try:
             if stream:
@@ -124,9 +516,10 @@ class Completions:
         response = requests.post(url, headers=headers, json=data, proxies={"https":"http://192.168.28.46:8118"})
         self._check_response_error(response)
         
-        response_data = response.json()
-        
-        # 构造响应对象
+        return self._parse_completion(response.json(), data["model"])
+
+    def _parse_completion(self, response_data, model) -> ChatCompletion:
+        """将响应json构造为ChatCompletion"""
         choices = []
         for choice_data in response_data.get("choices", []):
             message_data = choice_data.get("message", {})
@@ -153,10 +546,53 @@ class Completions:
             id=response_data.get("id", ""),
             object=response_data.get("object", "chat.completion"),
             created=response_data.get("created", int(time.time())),
-            model=response_data.get("model", data["model"]),
+            model=response_data.get("model", model),
             choices=choices,
             usage=usage
         )
+
+    def _parse_chunk(self, line, model) -> Optional[ChatCompletion]:
+        """解析一行SSE数据，返回增量响应对象；结束或无法解析时返回None"""
+        if line.startswith('data: '):
+            line = line[6:]  # 移除 'data: ' 前缀
+        if line == "[DONE]":
+            return None
+        try:
+            response_data = json.loads(line)
+        except json.JSONDecodeError:
+            return None
+
+        # 构造增量响应对象
+        choices = []
+        for choice_data in response_data.get("choices", []):
+            delta_data = choice_data.get("delta", {})
+            delta = Delta(
+                content=delta_data.get("content"),
+                role=delta_data.get("role")
+            )
+            
+            # 为了保持与非流式API一致的接口，我们也创建一个message
+            message = Message(
+                content=delta_data.get("content", ""),
+                role=delta_data.get("role", "assistant")
+            )
+            
+            choice = Choice(
+                message=message,
+                delta=delta,
+                index=choice_data.get("index", 0),
+                finish_reason=choice_data.get("finish_reason")
+            )
+            choices.append(choice)
+            
+        return ChatCompletion(
+            id=response_data.get("id", ""),
+            object=response_data.get("object", "chat.completion.chunk"),
+            created=response_data.get("created", int(time.time())),
+            model=response_data.get("model", model),
+            choices=choices,
+            usage=None
+        )
     
     def _handle_streaming_response(self, url, headers, data) -> Iterator[ChatCompletion]:
         """处理流式响应"""
@@ -166,48 +602,11 @@ class Completions:
         for line in response.iter_lines():
             if line:
                 line = line.decode('utf-8')
-                if line.startswith('data: '):
-                    line = line[6:]  # 移除 'data: ' 前缀
-                    
-                if line == "[DONE]":
+                if line.strip() in ("[DONE]", "data: [DONE]"):
                     break
-                    
-                try:
-                    response_data = json.loads(line)
-                    
-                    # 构造增量响应对象
-                    choices = []
-                    for choice_data in response_data.get("choices", []):
-                        delta_data = choice_data.get("delta", {})
-                        delta = Delta(
-                            content=delta_data.get("content"),
-                            role=delta_data.get("role")
-                        )
-                        
-                        # 为了保持与非流式API一致的接口，我们也创建一个message
-                        message = Message(
-                            content=delta_data.get("content", ""),
-                            role=delta_data.get("role", "assistant")
-                        )
-                        
-                        choice = Choice(
-                            message=message,
-                            delta=delta,
-                            index=choice_data.get("index", 0),
-                            finish_reason=choice_data.get("finish_reason")
-                        )
-                        choices.append(choice)
-                        
-                    yield ChatCompletion(
-                        id=response_data.get("id", ""),
-                        object=response_data.get("object", "chat.completion.chunk"),
-                        created=response_data.get("created", int(time.time())),
-                        model=response_data.get("model", data["model"]),
-                        choices=choices
-                    )
-                    
-                except json.JSONDecodeError:
-                    continue
+                chunk = self._parse_chunk(line, data["model"])
+                if chunk is not None:
+                    yield chunk
     
     def _check_response_error(self, response):
         """检查响应错误"""
@@ -235,34 +634,300 @@ class Completions:
             self._check_response_error(exception.response)
         raise APIError(str(exception))
 
+class AsyncCompletions(Completions):
+    """异步补全API类，复用客户端上的连接池（keep-alive），不会阻塞事件循环"""
+
+    async def create(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "OpenAI-chat",
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        stream: bool = False,
+        **kwargs
+    ) -> Union[ChatCompletion, AsyncIterator[ChatCompletion]]:
+        """
+        异步创建聊天补全
+        
+        Args:
+            messages: 消息列表
+            model: 模型名称
+            temperature: 温度参数(0-1)
+            max_tokens: 最大生成token数
+            stream: 是否启用流式输出
+            **kwargs: 其他参数；cache_if(completion)返回False时响应不写入缓存
+            
+        Returns:
+            ChatCompletion或AsyncIterator[ChatCompletion]: 聊天补全响应或异步流式响应迭代器
+        """
+        priority = kwargs.pop("priority", None)
+        cache_if = kwargs.pop("cache_if", None)
+        url, headers, data = self._build_request(messages, model, temperature, max_tokens, stream, **kwargs)
+
+        if stream:
+            return self._handle_streaming_response(url, headers, data, priority)
+
+        cache = self.client.response_cache
+        if cache is None or not cache.cacheable(data):
+            return await self._handle_standard_response(url, headers, data, priority)
+
+        key = cache.key(data)
+        cached = await cache.aget(key)
+        CACHE_LOOKUPS.inc(cache="llm", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            return self._parse_completion(cached, model)
+
+        async def request():
+            completion = await self._handle_standard_response(url, headers, data, priority)
+            if cache_if is None or cache_if(completion):
+                await cache.aset(key, asdict(completion))
+            return completion
+
+        return await cache.single_flight.do(key, request)
+
+    async def _handle_standard_response(self, url, headers, data, priority=None) -> ChatCompletion:
+        """处理标准响应，经调度器限流，可重试的错误退避后重试"""
+        scheduler = self.client.scheduler
+        model = data["model"]
+        estimated = scheduler.estimate_tokens(data)
+        for attempt in itertools.count():
+            await scheduler.acquire(model, estimated, priority)
+            try:
+                try:
+                    response = await self.client.async_http.post(url, headers=headers, json=data)
+                except httpx.HTTPError as e:
+                    raise APIError(str(e)) from e
+                self._check_response_error(response)
+            except APIError as e:
+                LLM_REQUESTS.inc(model=model, status=e.http_status or "error")
+                delay = scheduler.retry_delay(model, e, attempt)
+                if delay is None:
+                    logger.warning("llm request failed", extra={"model": model, "status": e.http_status, "error": str(e)})
+                    raise
+                LLM_RETRIES.inc(model=model)
+                logger.info("llm request retried", extra={"model": model, "status": e.http_status, "delay": round(delay, 3)})
+                await asyncio.sleep(delay)
+                continue
+
+            LLM_REQUESTS.inc(model=model, status=response.status_code)
+            completion = self._parse_completion(response.json(), model)
+            scheduler.settle(model, estimated, completion.usage)
+            if completion.usage is not None:
+                LLM_TOKENS.inc(completion.usage.prompt_tokens, model=model, kind="prompt")
+                LLM_TOKENS.inc(completion.usage.completion_tokens, model=model, kind="completion")
+            return completion
+
+    async def _handle_streaming_response(self, url, headers, data, priority=None) -> AsyncIterator[ChatCompletion]:
+        """处理流式响应；开始输出前的错误退避后重试，输出中途的错误直接抛出"""
+        scheduler = self.client.scheduler
+        model = data["model"]
+        for attempt in itertools.count():
+            await scheduler.acquire(model, scheduler.estimate_tokens(data), priority)
+            started = False
+            try:
+                try:
+                    async with self.client.async_http.stream("POST", url, headers=headers, json=data) as response:
+                        LLM_REQUESTS.inc(model=model, status=response.status_code)
+                        if response.status_code != 200:
+                            await response.aread()
+                            self._check_response_error(response)
+
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+                            if line.strip() in ("[DONE]", "data: [DONE]"):
+                                break
+                            chunk = self._parse_chunk(line, model)
+                            if chunk is not None:
+                                started = True
+                                yield chunk
+                except httpx.HTTPError as e:
+                    raise APIError(str(e)) from e
+                return
+            except APIError as e:
+                delay = None if started else scheduler.retry_delay(model, e, attempt)
+                if delay is None:
+                    logger.warning("llm stream failed", extra={"model": model, "status": e.http_status, "error": str(e)})
+                    raise
+                LLM_RETRIES.inc(model=model)
+                logger.info("llm stream retried", extra={"model": model, "status": e.http_status, "delay": round(delay, 3)})
+                await asyncio.sleep(delay)
+
+    async def parse(
+        self,
+        messages: List[Dict[str, str]],
+        response_model: type[BaseModel],
+        model: str = "OpenAI-chat",
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_repairs: int = 2,
+        **kwargs
+    ) -> ChatCompletion:
+        """
+        结构化输出：按pydantic模型的JSON Schema请求回复并校验
+
+        校验失败时把错误反馈给模型要求修正，最多重试max_repairs次。
+        json_schema模式使用response_format的JSON Schema；json_object模式使用JSON模式并在提示中附上Schema；
+        prompt模式只在提示中附上Schema，适用于不支持response_format的兼容接口。
+
+        Args:
+            messages: 消息列表
+            response_model: 回复需要满足的pydantic模型
+            model: 模型名称
+            temperature: 温度参数(0-1)
+            max_tokens: 最大生成token数
+            max_repairs: 校验失败后的最大修复重试次数
+            **kwargs: 其他参数
+
+        Returns:
+            ChatCompletion: choices[0].message.parsed为校验后的模型对象，usage为所有尝试的累计用量，attempts为请求次数
+
+        Raises:
+            StructuredOutputError: 修复重试后回复仍未通过校验，带有请求次数和累计用量
+        """
+        schema = response_model.model_json_schema()
+        messages = list(messages)
+        mode = self.client.structured_mode
+        if mode == "json_schema":
+            kwargs["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": response_model.__name__, "schema": schema}
+            }
+        else:
+            messages.append({
+                "role": "system",
+                "content": "Reply with a single JSON object matching this JSON schema:\n" + json.dumps(schema, ensure_ascii=False)
+            })
+            if mode == "json_object":
+                kwargs["response_format"] = {"type": "json_object"}
+
+        def valid(completion: ChatCompletion) -> bool:
+            content = (completion.choices[0].message.content or "") if completion.choices else ""
+            try:
+                response_model.model_validate_json(_extract_json(content))
+            except ValidationError:
+                return False
+            return True
+
+        usage = Usage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+        error = None
+        for attempt in range(1, max_repairs + 2):
+            # 未通过校验的回复不缓存，否则修复前的错误回复会被后续相同请求命中
+            completion = await self.create(messages, model, temperature, max_tokens, stream=False, cache_if=valid, **kwargs)
+            if completion.usage:
+                usage.prompt_tokens += completion.usage.prompt_tokens
+                usage.completion_tokens += completion.usage.completion_tokens
+                usage.total_tokens += completion.usage.total_tokens
+            content = (completion.choices[0].message.content or "") if completion.choices else ""
+            try:
+                parsed = response_model.model_validate_json(_extract_json(content))
+            except ValidationError as e:
+                logger.debug("structured reply invalid, repairing", extra={"model": model, "schema": response_model.__name__})
+                error = e
+                messages = messages + [
+                    {"role": "assistant", "content": content},
+                    {"role": "user", "content": f"The reply does not match the JSON schema:\n{e}\nReply again with only the corrected JSON object."}
+                ]
+                continue
+            completion.choices[0].message.parsed = parsed
+            completion.usage = usage
+            completion.attempts = attempt
+            return completion
+        raise StructuredOutputError(f"{response_model.__name__} reply still invalid after {max_repairs} repairs: {error}",
+                                    attempts=max_repairs + 1, usage=usage)
+
 class Chat:
     """聊天API类"""
     def __init__(self, client):
         self.completions = Completions(client)
 
+class AsyncChat:
+    """异步聊天API类"""
+    def __init__(self, client):
+        self.completions = AsyncCompletions(client)
+
 class OpenAI:
     """OpenAI客户端（OpenAI风格）"""
     def __init__(
         self,
         api_key: Optional[str] = None,
-        base_url: str = "https://api.deepseek.com/v1"
+        base_url: str = "https://api.deepseek.com/v1",
+        timeout: float = 120.0,
+        max_connections: int = 100,
+        proxy: Optional[str] = None,
+        response_cache: Optional[ResponseCache] = None,
+        structured_mode: Optional[str] = None,
+        scheduler: Optional[RequestScheduler] = None
     ):
         self.api_key = api_key or os.environ.get("OPEN_AI_KEY")
         if not self.api_key:
             raise ValueError("API key must be provided either as an argument or via OpenAI_API_KEY environment variable")
             
         self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.proxy = proxy or os.environ.get("LLM_PROXY")
+        self.response_cache = response_cache  # 可选的响应缓存，None表示不缓存
+        # 结构化输出方式：json_schema / json_object / prompt，见AsyncCompletions.parse
+        self.structured_mode = structured_mode or os.environ.get("LLM_STRUCTURED_MODE", "json_schema")
+        # 异步请求的限流、优先级和重试，见RequestScheduler
+        self.scheduler = scheduler or RequestScheduler()
         self.chat = Chat(self)
+        self.achat = AsyncChat(self)
+        self._async_http: Optional[httpx.AsyncClient] = None
+
+    @property
+    def async_http(self) -> httpx.AsyncClient:
+        """当前实例共享的异步HTTP连接池，首次使用时创建"""
+        if self._async_http is None or self._async_http.is_closed:
+            self._async_http = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60.0
+                ),
+                proxy=self.proxy
+            )
+        return self._async_http
+
+    async def aclose(self):
+        """关闭异步连接池"""
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
     
+    async def parse(self,
+                    messages: List[Message],
+                    response_model: type[BaseModel],
+                    model: str = "OpenAI-chat",
+                    temperature: float = 0.5,
+                    max_tokens: int = None, **kwargs) -> ChatCompletion:
+        """结构化输出调用，见AsyncCompletions.parse"""
+        return await self.achat.completions.parse(
+            messages=messages,
+            response_model=response_model,
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+
     # 创建__call__方法，用于实现客户端的调用行为，支持Fucntion callable 协议
     async def __call__(self, 
                         messages: List[Message], 
                         functions: List[Dict[str, Any]] = None, 
                         model: str = "OpenAI-chat", 
                         temperature: float = 0.5, 
-                        max_tokens: int = None, **kwargs) -> Union[ChatCompletion, Iterator[ChatCompletion]]:
+                        max_tokens: int = None, **kwargs) -> Union[ChatCompletion, AsyncIterator[ChatCompletion]]:
         
-        return self.chat.completions.create(
+        return await self.achat.completions.create(
             messages=messages,
             functions=functions,
             model=model,
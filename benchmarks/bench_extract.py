@@ -0,0 +1,77 @@
+"""
+Benchmark HTML-to-text extraction: parse time and peak memory per page.
+
+Usage:
+    python benchmarks/bench_extract.py [page.html ...]
+
+Without arguments a set of synthetic pages (navigation, sidebar, long article) is used.
+Both the old whole-page get_text() and extract.html_to_text are measured, with every
+parser backend that is installed. Peak memory is what tracemalloc sees, so allocations
+inside lxml's C code are not included.
+"""
+import os
+import sys
+import time
+import tracemalloc
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extract
+from extract import html_to_text
+
+def synthetic_page(paragraphs: int) -> str:
+    nav = "<nav><ul>" + "".join(f'<li><a href="/p{i}">Link {i}</a></li>' for i in range(80)) + "</ul></nav>"
+    sidebar = "<aside>" + "".join(f'<a href="/t{i}">tag{i}</a> ' for i in range(200)) + "</aside>"
+    body = "".join(
+        f"<p>Paragraph {i}: large language model inference engines such as vLLM, SGLang and TensorRT-LLM "
+        f"use paged attention, continuous batching and speculative decoding. 推理引擎加速第{i}段。</p>"
+        for i in range(paragraphs)
+    )
+    script = "<script>" + "var x = 1;" * 2000 + "</script>"
+    return f"<html><head>{script}</head><body>{nav}<main><article>{body}</article></main>{sidebar}</body></html>"
+
+def whole_page_text(html: str) -> str:
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, "html.parser").get_text().strip()
+
+def measure(fn, html: str, repeat: int = 5) -> tuple[float, float, int]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = fn(html)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak / 1e6, len(text)
+
+def main():
+    if len(sys.argv) > 1:
+        pages = {}
+        for path in sys.argv[1:]:
+            with open(path, "rb") as f:
+                pages[os.path.basename(path)] = extract.decode_body(f.read())
+    else:
+        pages = {f"synthetic-{n}p": synthetic_page(n) for n in (20, 200, 2000)}
+
+    parsers = ["html.parser"]
+    try:
+        import lxml  # noqa: F401
+        parsers.append("lxml")
+    except ImportError:
+        pass
+
+    print(f"{'page':<20} {'KB':>7} {'extractor':<24} {'ms':>9} {'peak MB':>8} {'chars':>8}")
+    for name, html in pages.items():
+        size = len(html.encode("utf-8")) / 1024
+        ms, peak, chars = measure(whole_page_text, html)
+        print(f"{name:<20} {size:>7.0f} {'get_text (html.parser)':<24} {ms * 1000:>9.1f} {peak:>8.1f} {chars:>8}")
+        for parser in parsers:
+            extract.HTML_PARSER = parser
+            ms, peak, chars = measure(html_to_text, html)
+            print(f"{name:<20} {size:>7.0f} {'html_to_text (' + parser + ')':<24} {ms * 1000:>9.1f} {peak:>8.1f} {chars:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+End-to-end research benchmark against a local fake backend (see fake_backend.py).
+
+Usage:
+    python benchmarks/bench_research.py [--queries 20] [--concurrency 1,4,16] [--llm-latency 0.3] ...
+    python benchmarks/bench_research.py --scenario stream --concurrency 1,32
+
+The research scenario runs WebSearchTool.research for --queries distinct questions at each
+concurrency level and reports end-to-end latency percentiles, throughput, LLM calls, tokens,
+searches and bytes fetched per query. The stream scenario sends streaming chat completions
+through the LLM client and reports time to first token and total latency.
+
+Nothing leaves the machine: the LLM client, Bing endpoint and every fetched page point at the
+fake backend. Caches are in memory and start empty at each concurrency level; pass --warm to
+keep them across levels. --json writes the results for comparing runs.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from dataclasses import asdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("OPEN_AI_KEY", "bench")
+os.environ.setdefault("Bing_API_KEY", "bench")
+# The benchmark queries are paraphrases of each other; measure the research itself, not the result cache
+os.environ.setdefault("DEEPSEARCH_RESEARCH_CACHE", "0")
+
+from fake_backend import BackendConfig, FakeBackend
+from LLM import OpenAIClient
+from cache import ContentCache, SearchCache
+from fetcher import PageFetcher
+from deepsearch import WebSearchTool, DeepResearchParams
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))]
+
+def latency_summary(latencies: list[float]) -> dict[str, float]:
+    return {f"p{q}": round(percentile(latencies, q), 3) for q in (50, 90, 99)} | {"max": round(max(latencies, default=0.0), 3)}
+
+async def run_research(backend: FakeBackend, queries: list[str], concurrency: int, tools: dict) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors, reports = [], 0, []
+
+    async def one(query: str):
+        nonlocal errors
+        async with semaphore:
+            tool = WebSearchTool(fetcher=tools["fetcher"], content_cache=tools["content_cache"],
+                                 search_cache=tools["search_cache"])
+            start = time.perf_counter()
+            final = None
+            async for event in tool.research(DeepResearchParams(searchQuery=query)):
+                if event.type in ("result", "error"):
+                    final = event
+            latencies.append(time.perf_counter() - start)
+            if final is None or final.type == "error":
+                errors += 1
+            else:
+                reports.append(final.data)
+
+    backend.reset_stats()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    wall = time.perf_counter() - start
+    stats = backend.stats
+    n = len(queries)
+    return {
+        "concurrency": concurrency,
+        "queries": n,
+        "errors": errors,
+        "latency": latency_summary(latencies),
+        "throughput_qps": round(n / wall, 3),
+        "llm_calls_per_query": round(stats.llm_calls / n, 2),
+        "tokens_per_query": round((stats.prompt_tokens + stats.completion_tokens) / n),
+        "searches_per_query": round(stats.searches / n, 2),
+        "pages_per_query": round(stats.page_requests / n, 2),
+        "mb_fetched": round(stats.page_bytes / 1e6, 2),
+        "client_tokens": sum(report["budget"]["tokens"] for report in reports),
+        "evidence": {key: sum(report["evidence"][key] for report in reports) for key in reports[0]["evidence"]} if reports else {},
+        "backend": asdict(stats),
+    }
+
+async def run_stream(backend: FakeBackend, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    first_token, totals = [], []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            stream = await WebSearchTool.llm([{"role": "user", "content": f"stream request {i}"}], model="bench", stream=True)
+            first = None
+            async for _ in stream:
+                if first is None:
+                    first = time.perf_counter() - start
+            first_token.append(first or 0.0)
+            totals.append(time.perf_counter() - start)
+
+    backend.reset_stats()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "ttft": latency_summary(first_token),
+        "latency": latency_summary(totals),
+        "throughput_rps": round(requests / wall, 3),
+        "completion_tokens_per_second": round(backend.stats.completion_tokens / wall),
+    }
+
+def print_research(rows: list[dict]):
+    print(f"{'conc':>5} {'queries':>7} {'err':>4} {'p50 s':>7} {'p90 s':>7} {'p99 s':>7} {'max s':>7} {'q/s':>7}"
+          f" {'llm/q':>6} {'tok/q':>7} {'srch/q':>7} {'pages/q':>7} {'MB':>7}")
+    for row in rows:
+        lat = row["latency"]
+        print(f"{row['concurrency']:>5} {row['queries']:>7} {row['errors']:>4} {lat['p50']:>7.2f} {lat['p90']:>7.2f}"
+              f" {lat['p99']:>7.2f} {lat['max']:>7.2f} {row['throughput_qps']:>7.2f} {row['llm_calls_per_query']:>6.1f}"
+              f" {row['tokens_per_query']:>7} {row['searches_per_query']:>7.1f} {row['pages_per_query']:>7.1f} {row['mb_fetched']:>7.2f}")
+
+def print_stream(rows: list[dict]):
+    print(f"{'conc':>5} {'requests':>8} {'ttft p50':>9} {'ttft p99':>9} {'p50 s':>7} {'p99 s':>7} {'req/s':>7} {'tok/s':>7}")
+    for row in rows:
+        print(f"{row['concurrency']:>5} {row['requests']:>8} {row['ttft']['p50']:>9.3f} {row['ttft']['p99']:>9.3f}"
+              f" {row['latency']['p50']:>7.2f} {row['latency']['p99']:>7.2f} {row['throughput_rps']:>7.2f}"
+              f" {row['completion_tokens_per_second']:>7}")
+
+async def main(args: argparse.Namespace):
+    config = BackendConfig(llm_latency=args.llm_latency, llm_tokens_per_second=args.llm_tps,
+                           summary_tokens=args.summary_tokens, sub_questions=args.sub_questions,
+                           search_latency=args.search_latency, page_latency=args.page_latency,
+                           pages=args.pages)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    with FakeBackend(config) as backend:
+        os.environ["BING_ENDPOINT"] = f"{backend.url}/v7.0/search"
+        WebSearchTool.llm = OpenAIClient(base_url=f"{backend.url}/v1", api_key="bench")
+        rows = []
+        tools = None
+        for level in levels:
+            if args.scenario == "stream":
+                rows.append(await run_stream(backend, args.queries, level))
+                continue
+            if tools is not None and not args.warm:
+                await tools["fetcher"].aclose()
+            if tools is None or not args.warm:
+                tools = {"fetcher": PageFetcher(per_host_limit=args.per_host_limit),
+                         "content_cache": ContentCache(disk_path=None), "search_cache": SearchCache(disk_path=None)}
+            queries = [f"benchmark question {i} about llm serving" for i in range(args.queries)]
+            rows.append(await run_research(backend, queries, level, tools))
+        if tools is not None:
+            await tools["fetcher"].aclose()
+        await WebSearchTool.llm.aclose()
+
+    (print_stream if args.scenario == "stream" else print_research)(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"scenario": args.scenario, "config": asdict(config), "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--scenario", choices=["research", "stream"], default="research")
+    parser.add_argument("--queries", type=int, default=20, help="queries (or stream requests) per concurrency level")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--llm-tps", type=float, default=200.0, help="generated tokens per second per call")
+    parser.add_argument("--summary-tokens", type=int, default=200, help="words in free-text replies")
+    parser.add_argument("--sub-questions", type=int, default=3, help="sub-questions per plan")
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    parser.add_argument("--page-latency", type=float, default=0.05)
+    parser.add_argument("--pages", type=int, default=500, help="corpus size")
+    parser.add_argument("--per-host-limit", type=int, default=64,
+                        help="fetcher per-host concurrency; the whole corpus is served from one host")
+    parser.add_argument("--warm", action="store_true", help="keep caches across concurrency levels")
+    parser.add_argument("--json", help="write results to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,221 @@
+"""
+Local stand-ins for everything a research talks to, for offline benchmarks.
+
+One FastAPI app served by uvicorn in a background thread provides:
+    POST /v1/chat/completions   OpenAI-compatible chat completions, with configurable latency,
+                                generation speed and SSE streaming. Structured-output requests
+                                (plan, keywords, rerank, judge) get replies valid for their schema.
+    GET  /v7.0/search           Bing Web Search v7 shaped results pointing at the corpus.
+    GET  /pages/{id}            A static corpus of synthetic HTML pages, with ETag revalidation.
+
+Replies are deterministic for a given request, so runs are comparable. Counters of what was
+served are kept on FakeBackend.stats.
+"""
+import json
+import time
+import socket
+import random
+import asyncio
+import hashlib
+import threading
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TOPICS = ["inference", "attention", "batching", "quantization", "speculative", "decoding", "kernel", "cache",
+          "scheduler", "throughput", "latency", "memory", "tensor", "parallelism", "compiler", "serving",
+          "benchmark", "gpu", "token", "pipeline", "retrieval", "embedding", "index", "ranking"]
+
+@dataclass
+class BackendConfig:
+    """Behaviour of the fake backend."""
+    llm_latency: float = 0.3        # seconds before the first token
+    llm_tokens_per_second: float = 200.0
+    summary_tokens: int = 200       # length of free-text replies
+    sub_questions: int = 3          # sub-questions per plan
+    keywords: int = 2               # keywords per sub-question
+    search_latency: float = 0.1
+    page_latency: float = 0.05
+    pages: int = 500                # corpus size
+    page_paragraphs: int = 40       # paragraphs per page, ~300 bytes each
+
+@dataclass
+class BackendStats:
+    """What the fake backend served."""
+    llm_calls: int = 0
+    llm_streams: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    searches: int = 0
+    page_requests: int = 0
+    pages_not_modified: int = 0
+    page_bytes: int = 0
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+def _tokens(text: str) -> int:
+    return max(len(text) // 4, 1)
+
+def _page(page_id: int, paragraphs: int) -> bytes:
+    rng = random.Random(page_id)
+    topic = " ".join(rng.sample(TOPICS, 3))
+    nav = "<nav><ul>" + "".join(f'<li><a href="/pages/{i}">Page {i}</a></li>' for i in range(30)) + "</ul></nav>"
+    body = "".join(
+        f"<p>{topic} paragraph {i}: " + " ".join(rng.choice(TOPICS) for _ in range(40)) + ".</p>"
+        for i in range(paragraphs)
+    )
+    return (f"<html><head><title>{topic} {page_id}</title><script>var page = {page_id};</script></head>"
+            f"<body>{nav}<main><article><h1>{topic}</h1>{body}</article></main>"
+            f"<footer>Corpus page {page_id}</footer></body></html>").encode("utf-8")
+
+class FakeBackend:
+    """
+    Fake OpenAI, Bing and web corpus on one local port.
+
+    Usage:
+        with FakeBackend(BackendConfig(llm_latency=0.5)) as backend:
+            backend.url  # http://127.0.0.1:<port>
+    """
+
+    def __init__(self, config: BackendConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or BackendConfig()
+        self.stats = BackendStats()
+        self.host = host
+        self.port = port or self._free_port(host)
+        self.pages = [_page(i, self.config.page_paragraphs) for i in range(self.config.pages)]
+        self.app = self._build_app()
+        self._server: uvicorn.Server | None = None
+        self._thread: threading.Thread | None = None
+
+    @staticmethod
+    def _free_port(host: str) -> int:
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            return sock.getsockname()[1]
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def reset_stats(self):
+        self.stats = BackendStats()
+
+    def start(self):
+        config = uvicorn.Config(self.app, host=self.host, port=self.port, log_level="warning",
+                                access_log=False, limit_concurrency=10_000, backlog=4096)
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="fake-backend", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("fake backend did not start")
+            time.sleep(0.01)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reply(self, data: dict) -> str:
+        """Reply text for a chat request: schema-valid JSON for structured outputs, prose otherwise."""
+        messages = data.get("messages", [])
+        schema_name = (data.get("response_format") or {}).get("json_schema", {}).get("name")
+        if schema_name is None:
+            # json_object / prompt structured modes put the schema into a system message
+            for message in messages:
+                content = str(message.get("content") or "")
+                if content.startswith("Reply with a single JSON object"):
+                    schema_name = json.loads(content.split("\n", 1)[1]).get("title")
+        question = str(messages[-1].get("content") or "") if messages else ""
+        rng = random.Random(_seed(question))
+
+        if schema_name == "ResearchPlan":
+            plan = [{"step": i + 1, "sub_question": f"{question[:80]} - {' '.join(rng.sample(TOPICS, 2))}"}
+                    for i in range(self.config.sub_questions)]
+            return json.dumps({"plan": plan})
+        if schema_name == "SearchKeywords":
+            return json.dumps({"keywords": [" ".join(rng.sample(TOPICS, 3)) for _ in range(self.config.keywords)]})
+        if schema_name == "RelevantTitles":
+            return json.dumps({"releative_titles": [0, 1, 2]})
+        if schema_name == "Judgement":
+            return json.dumps({"finished": True})
+        return " ".join(rng.choice(TOPICS) for _ in range(self.config.summary_tokens))
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+        config, backend = self.config, self
+
+        @app.post("/v1/chat/completions")
+        async def chat_completions(request: Request):
+            data = await request.json()
+            content = backend.reply(data)
+            prompt_tokens = sum(_tokens(str(message.get("content") or "")) for message in data.get("messages", []))
+            completion_tokens = _tokens(content)
+            backend.stats.llm_calls += 1
+            backend.stats.prompt_tokens += prompt_tokens
+            backend.stats.completion_tokens += completion_tokens
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            await asyncio.sleep(config.llm_latency)
+
+            if data.get("stream"):
+                backend.stats.llm_streams += 1
+
+                async def events():
+                    pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+                    delay = 4 / config.llm_tokens_per_second if config.llm_tokens_per_second else 0
+                    for piece in pieces:
+                        chunk = {"id": "fake", "object": "chat.completion.chunk", "model": data["model"],
+                                 "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                        yield f"data: {json.dumps(chunk)}\n\n"
+                        await asyncio.sleep(delay)
+                    yield "data: [DONE]\n\n"
+                return StreamingResponse(events(), media_type="text/event-stream")
+
+            if config.llm_tokens_per_second:
+                await asyncio.sleep(completion_tokens / config.llm_tokens_per_second)
+            return JSONResponse({
+                "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": data["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        @app.get("/v7.0/search")
+        async def search(q: str, count: int = 10, mkt: str = "en-US"):
+            backend.stats.searches += 1
+            await asyncio.sleep(config.search_latency)
+            rng = random.Random(_seed(q))
+            ids = rng.sample(range(config.pages), min(count, config.pages))
+            return {"webPages": {"value": [
+                {"url": f"{backend.url}/pages/{i}", "name": f"{q} - page {i}",
+                 "snippet": " ".join(random.Random(i).sample(TOPICS, 6))}
+                for i in ids
+            ]}}
+
+        @app.get("/pages/{page_id}")
+        async def page(page_id: int, request: Request):
+            backend.stats.page_requests += 1
+            await asyncio.sleep(config.page_latency)
+            if not 0 <= page_id < len(backend.pages):
+                return Response(status_code=404)
+            etag = f'"page-{page_id}"'
+            if request.headers.get("if-none-match") == etag:
+                backend.stats.pages_not_modified += 1
+                return Response(status_code=304, headers={"ETag": etag})
+            body = backend.pages[page_id]
+            backend.stats.page_bytes += len(body)
+            return Response(body, media_type="text/html; charset=utf-8", headers={"ETag": etag})
+
+        return app
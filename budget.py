@@ -0,0 +1,103 @@
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+class BudgetExhausted(Exception):
+    """Raised when a research has used up its deadline, token or LLM-call budget."""
+    def __init__(self, reason: str):
+        super().__init__(f"research budget exhausted: {reason}")
+        self.reason = reason
+
+@dataclass
+class BudgetLimits:
+    """Limits of one research run."""
+    deadline: float = float(os.environ.get("DEEPSEARCH_DEADLINE", 50))
+    max_tokens: int = int(os.environ.get("DEEPSEARCH_MAX_TOKENS", 200_000))
+    max_llm_calls: int = int(os.environ.get("DEEPSEARCH_MAX_LLM_CALLS", 40))
+    max_iterations: int = int(os.environ.get("DEEPSEARCH_MAX_ITERATIONS", 3))
+
+@dataclass
+class ResearchBudget:
+    """
+    Tracks wall-clock time, tokens and LLM calls of one research against its limits.
+
+    Besides checking hard limits it estimates whether another iteration fits, from what the
+    iterations so far have cost.
+    """
+    limits: BudgetLimits = field(default_factory=BudgetLimits)
+    started: float = field(default_factory=time.monotonic)
+    tokens: int = 0
+    llm_calls: int = 0
+    iterations: int = 0
+    stop_reason: Optional[str] = None
+    _iteration_started: tuple[float, int, int] = (0.0, 0, 0)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining_seconds(self) -> float:
+        return max(self.limits.deadline - self.elapsed(), 0.0)
+
+    def record(self, completion: Any):
+        """
+        Count the LLM requests of a call, repair retries included, and the tokens reported in
+        its usage. completion can also be the StructuredOutputError of a call that never got a
+        valid reply, whose requests were spent all the same.
+        """
+        self.llm_calls += getattr(completion, "attempts", 1)
+        usage = getattr(completion, "usage", None)
+        if usage is not None:
+            self.tokens += usage.total_tokens
+
+    def exhausted(self) -> Optional[str]:
+        """The limit that has been reached, or None."""
+        if self.remaining_seconds() <= 0:
+            return "deadline"
+        if self.tokens >= self.limits.max_tokens:
+            return "tokens"
+        if self.llm_calls >= self.limits.max_llm_calls:
+            return "llm_calls"
+        return None
+
+    def check(self):
+        """Raise BudgetExhausted if a limit has been reached."""
+        reason = self.exhausted()
+        if reason is not None:
+            raise BudgetExhausted(reason)
+
+    def start_iteration(self):
+        self._iteration_started = (self.elapsed(), self.tokens, self.llm_calls)
+
+    def end_iteration(self):
+        self.iterations += 1
+
+    def next_iteration_fits(self) -> Optional[str]:
+        """
+        Whether another iteration is expected to fit, assuming it costs as much as the last one.
+
+        Returns:
+            str | None: The limit the next iteration would exceed, or None if it fits.
+        """
+        if self.iterations >= self.limits.max_iterations:
+            return "iterations"
+        reason = self.exhausted()
+        if reason is not None:
+            return reason
+        seconds, tokens, calls = self._iteration_started
+        if self.elapsed() + (self.elapsed() - seconds) > self.limits.deadline:
+            return "deadline"
+        if self.tokens + (self.tokens - tokens) > self.limits.max_tokens:
+            return "tokens"
+        if self.llm_calls + (self.llm_calls - calls) > self.limits.max_llm_calls:
+            return "llm_calls"
+        return None
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "elapsed": round(self.elapsed(), 3),
+            "tokens": self.tokens,
+            "llm_calls": self.llm_calls,
+            "iterations": self.iterations,
+            "stop_reason": self.stop_reason,
+        }
@@ -0,0 +1,636 @@
+import os
+import re
+import json
+import uuid
+import random
+import hashlib
+import asyncio
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from context import text_terms
+
+DEFAULT_CACHE_DIR = os.environ.get("DEEPSEARCH_CACHE_DIR", ".deepsearch_cache")
+# Words capitalized anywhere but at the start of a sentence are taken for names (Tesla, NVIDIA, iPhone)
+_WORD = re.compile(r"\w[\w'-]*")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+TRACKING_PARAMS = ("utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content", "gclid", "fbclid")
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize a URL for use as a cache key.
+
+    Lower-cases scheme and host, drops default ports, fragments and tracking parameters,
+    and sorts the remaining query parameters.
+
+    Args:
+        url (str): URL to normalize.
+
+    Returns:
+        str: Normalized URL.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not (scheme == "http" and parts.port == 80 or scheme == "https" and parts.port == 443):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                             if k.lower() not in TRACKING_PARAMS))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+@dataclass
+class CacheStats:
+    """Counters for sizing a cache."""
+    hits: int = 0
+    misses: int = 0
+    stale_hits: int = 0
+    revalidations: int = 0
+    memory_evictions: int = 0
+    disk_evictions: int = 0
+    coalesced: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+@dataclass
+class CacheEntry:
+    """A cached value with the time it was stored."""
+    value: Any
+    stored_at: float
+    size: int
+
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+class SingleFlight:
+    """
+    Share one in-flight call between concurrent callers asking for the same key.
+
+    One caller giving up does not cancel the call for the others; when every caller waiting
+    for it has been cancelled the call is cancelled too.
+    """
+
+    def __init__(self, stats: Optional[CacheStats] = None):
+        self.stats = stats or CacheStats()
+        self._inflight: dict[str, list] = {}  # [task, waiting callers]
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Args:
+            key (str): Identity of the call.
+            fn (Callable[[], Awaitable[Any]]): Starts the call if none is in flight for key.
+
+        Returns:
+            Any: Result of the shared call.
+        """
+        entry = self._inflight.get(key)
+        if entry is None:
+            entry = self._inflight[key] = [asyncio.ensure_future(fn()), 0]
+        else:
+            self.stats.coalesced += 1
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if entry[1] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            entry[1] -= 1
+            if (task.done() or entry[1] == 0) and self._inflight.get(key) is entry:
+                del self._inflight[key]
+
+class MemoryStore:
+    """In-memory LRU tier bounded by the total size of its values."""
+
+    def __init__(self, max_bytes: int, stats: CacheStats):
+        self.max_bytes = max_bytes
+        self.stats = stats
+        self.size = 0
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._pop(key)
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._pop(oldest)
+                self.stats.memory_evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._pop(key)
+
+    def _pop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+class SQLiteStore:
+    """
+    On-disk tier in a SQLite file, evicting least recently used rows over the byte budget.
+
+    Calls block on SQLite; async code goes through TieredCache's async methods, which run them
+    in a worker thread.
+    """
+
+    def __init__(self, path: str, max_bytes: int, stats: CacheStats):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.stats = stats
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, "
+            "accessed_at REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tags (tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key))")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+        # Byte total of the cache table, updated by every write instead of summed on each insert
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO meta (name, value) SELECT 'bytes', COALESCE(SUM(size), 0) FROM cache")
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at, size FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return CacheEntry(value=json.loads(row[0]), stored_at=row[1], size=row[2])
+
+    def set(self, key: str, entry: CacheEntry):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock, self._transaction():
+            total = self._remove(key) + entry.size
+            self._conn.execute(
+                "INSERT INTO cache (key, value, stored_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(entry.value, ensure_ascii=False), entry.stored_at, time.time(), entry.size))
+            self._conn.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'", (entry.size,))
+            while total > self.max_bytes:
+                row = self._conn.execute("SELECT key FROM cache ORDER BY accessed_at LIMIT 1").fetchone()
+                total = self._remove(row[0])
+                self.stats.disk_evictions += 1
+
+    def delete(self, key: str):
+        with self._lock, self._transaction():
+            self._remove(key)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _remove(self, key: str) -> int:
+        """Delete key's row and tags within a transaction; returns the byte total left."""
+        row = self._conn.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.execute("DELETE FROM tags WHERE key = ?", (key,))
+            self._conn.execute("UPDATE meta SET value = value - ? WHERE name = 'bytes'", (row[0],))
+        return self._conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+
+    def tag(self, key: str, tags: list[str]):
+        """Index key under tags, for finding it with tagged; dropped with the row."""
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO tags (tag, key) VALUES (?, ?)", [(tag, key) for tag in tags])
+
+    def tagged(self, tags: list[str]) -> list[str]:
+        """Keys indexed under any of tags."""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT DISTINCT key FROM tags WHERE tag IN ({','.join('?' * len(tags))})",
+                                      tags).fetchall()
+        return [row[0] for row in rows]
+
+    def claim(self, key: str, owner: str, ttl: float) -> bool:
+        """Take the lease on key for ttl seconds unless another owner holds an unexpired one."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE key = ? AND expires <= ?", (key, now))
+            cursor = self._conn.execute("INSERT OR IGNORE INTO leases (key, owner, expires) VALUES (?, ?, ?)",
+                                        (key, owner, now + ttl))
+            return cursor.rowcount == 1
+
+    def release(self, key: str, owner: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def close(self):
+        self._conn.close()
+
+class TieredCache:
+    """
+    Two-tier cache: an in-memory LRU in front of an optional SQLite file.
+
+    Values must be JSON-serializable. Entries older than ttl are not returned by get; with
+    keep_stale they stay stored (until evicted) so callers can revalidate them via peek.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 24 * 3600,
+        memory_bytes: int = 64_000_000,
+        disk_path: Optional[str] = None,
+        disk_bytes: int = 512_000_000,
+        keep_stale: bool = False,
+    ):
+        """
+        Args:
+            ttl (float): Seconds an entry stays fresh.
+            memory_bytes (int): Byte budget of the in-memory tier.
+            disk_path (str, optional): SQLite file of the on-disk tier, no disk tier if None.
+            disk_bytes (int): Byte budget of the on-disk tier.
+            keep_stale (bool): Keep expired entries for revalidation instead of dropping them.
+        """
+        self.ttl = ttl
+        self.keep_stale = keep_stale
+        self.stats = CacheStats()
+        self.memory = MemoryStore(memory_bytes, self.stats)
+        self.disk = SQLiteStore(disk_path, disk_bytes, self.stats) if disk_path else None
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """Return the stored entry regardless of its age, without touching the counters."""
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.set(key, entry)
+        return entry
+
+    def get(self, key: str) -> Any:
+        """
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            Any: The fresh cached value, or None on a miss.
+        """
+        entry = self.peek(key)
+        if entry is not None and entry.age() <= self.ttl:
+            self.stats.hits += 1
+            return entry.value
+        if entry is not None and not self.keep_stale:
+            self.delete(key)
+        self.stats.misses += 1
+        return None
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None):
+        entry = CacheEntry(
+            value=value,
+            stored_at=stored_at or time.time(),
+            size=len(json.dumps(value, ensure_ascii=False).encode("utf-8")),
+        )
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            self.disk.set(key, entry)
+
+    def touch(self, key: str) -> bool:
+        """Mark an entry fresh again, e.g. after a successful revalidation."""
+        entry = self.peek(key)
+        if entry is None:
+            return False
+        self.set(key, entry.value)
+        return True
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    async def offload(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run a cache call that may touch the on-disk tier in a worker thread, off the event loop."""
+        if self.disk is None:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def aget(self, key: str) -> Any:
+        """get for async code: fresh memory-tier hits are answered at once, the rest off the loop."""
+        entry = self.memory.get(key)
+        if entry is not None and entry.age() <= self.ttl:
+            self.stats.hits += 1
+            return entry.value
+        return await self.offload(self.get, key)
+
+    async def aset(self, key: str, value: Any, stored_at: Optional[float] = None):
+        await self.offload(self.set, key, value, stored_at)
+
+    @asynccontextmanager
+    async def lease(self, key: str, ttl: float = 30.0, poll: float = 0.05) -> AsyncIterator[bool]:
+        """
+        Cross-process single flight over the on-disk tier.
+
+        Processes sharing the SQLite file take turns on key: while another one holds the lease,
+        wait until it is released (or expires after ttl seconds), then hold it for the body.
+        Without a disk tier the body runs at once.
+
+        Args:
+            key (str): Cache key about to be computed.
+            ttl (float): Seconds a lease is held at most, in case its holder dies.
+            poll (float): Seconds between attempts to take the lease.
+
+        Yields:
+            bool: True if another process held the lease first; the body should then look the
+                key up again, since that process has usually stored the value.
+        """
+        if self.disk is None:
+            yield False
+            return
+        owner = uuid.uuid4().hex
+        waited = not await asyncio.to_thread(self.disk.claim, key, owner, ttl)
+        if waited:
+            self.stats.coalesced += 1
+            deadline = time.monotonic() + ttl
+            while time.monotonic() < deadline:
+                await asyncio.sleep(poll)
+                if await asyncio.to_thread(self.disk.claim, key, owner, ttl):
+                    break
+        try:
+            yield waited
+        finally:
+            await asyncio.to_thread(self.disk.release, key, owner)
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+class ContentCache(TieredCache):
+    """
+    Cache of extracted page text keyed by normalized URL.
+
+    Values are dicts with "text", "etag" and "last_modified". Expired pages are kept so they
+    can be revalidated with a conditional request instead of downloaded again.
+    """
+
+    def __init__(
+        self,
+        ttl: float = float(os.environ.get("DEEPSEARCH_CONTENT_TTL", 24 * 3600)),
+        memory_bytes: int = 64_000_000,
+        disk_path: Optional[str] = os.path.join(DEFAULT_CACHE_DIR, "content.sqlite"),
+        disk_bytes: int = 512_000_000,
+    ):
+        super().__init__(ttl=ttl, memory_bytes=memory_bytes, disk_path=disk_path,
+                         disk_bytes=disk_bytes, keep_stale=True)
+
+    async def conditional_headers(self, url: str) -> dict[str, str]:
+        """
+        Headers for revalidating a stale page.
+
+        Args:
+            url (str): Page URL.
+
+        Returns:
+            dict[str, str]: If-None-Match / If-Modified-Since headers, empty if nothing to revalidate.
+        """
+        entry = await self.offload(self.peek, normalize_url(url))
+        if entry is None:
+            return {}
+        headers = {}
+        if entry.value.get("etag"):
+            headers["If-None-Match"] = entry.value["etag"]
+        if entry.value.get("last_modified"):
+            headers["If-Modified-Since"] = entry.value["last_modified"]
+        return headers
+
+    async def get_page(self, url: str) -> Optional[str]:
+        """Return the fresh cached text of a page, or None."""
+        value = await self.aget(normalize_url(url))
+        return None if value is None else value["text"]
+
+    async def revalidated(self, url: str) -> Optional[str]:
+        """Mark a page fresh after a 304 response and return its cached text."""
+        key = normalize_url(url)
+        if not await self.offload(self.touch, key):
+            return None
+        self.stats.revalidations += 1
+        self.stats.stale_hits += 1
+        return self.memory.get(key).value["text"]
+
+    async def set_page(self, url: str, text: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        await self.aset(normalize_url(url), {"text": text, "etag": etag, "last_modified": last_modified})
+
+class SearchCache(TieredCache):
+    """
+    Cache of search results keyed by (normalized query, market, count, search providers).
+
+    Concurrent identical queries are coalesced into one in-flight API call via single_flight.
+    """
+
+    def __init__(
+        self,
+        ttl: float = float(os.environ.get("DEEPSEARCH_SEARCH_TTL", 6 * 3600)),
+        memory_bytes: int = 16_000_000,
+        disk_path: Optional[str] = os.path.join(DEFAULT_CACHE_DIR, "search.sqlite"),
+        disk_bytes: int = 128_000_000,
+    ):
+        super().__init__(ttl=ttl, memory_bytes=memory_bytes, disk_path=disk_path, disk_bytes=disk_bytes)
+        self.single_flight = SingleFlight(self.stats)
+
+    @staticmethod
+    def key(query: str, mkt: str, count: int, providers: list[str] = ()) -> str:
+        return json.dumps([" ".join(query.casefold().split()), mkt.lower(), count, *providers], ensure_ascii=False)
+
+@dataclass
+class ResearchMatch:
+    """A cached research whose query is similar to the one looked up."""
+    query: str
+    result: Any
+    similarity: float
+    stored_at: float
+    # "hit": similar enough to answer the query, "seed": worth seeding a research, "miss": neither
+    mode: str = "miss"
+
+class ResearchCache(TieredCache):
+    """
+    Cache of final research results with near-duplicate query lookup.
+
+    Queries are compared by the Jaccard similarity of their terms (latin words and CJK
+    character bigrams, see context.text_terms), so paraphrases such as reordered words match.
+    Queries whose numbers or names differ (see conflicts) never match, however similar the rest:
+    "exports in 2023" is not "exports in 2024". Candidates are found with MinHash
+    locality-sensitive hashing: each query's signature is cut into bands of band_rows values,
+    and only queries sharing a band are compared. Bands are indexed next to the entries, so
+    processes sharing the SQLite file see each other's researches.
+
+    Matches of at least threshold, near-exact by default, are returned as hits, to answer the
+    query as they are; weaker matches of at least seed_threshold as seeds, whose sub-answers
+    a new research reuses only for the sub-questions it asks again (see same_question).
+    Calls block on the on-disk tier; async code runs them through offload.
+    """
+
+    def __init__(
+        self,
+        ttl: float = float(os.environ.get("DEEPSEARCH_RESEARCH_TTL", 24 * 3600)),
+        threshold: float = float(os.environ.get("DEEPSEARCH_RESEARCH_CACHE_THRESHOLD", 0.95)),
+        seed_threshold: float = float(os.environ.get("DEEPSEARCH_RESEARCH_SEED_THRESHOLD", 0.5)),
+        memory_bytes: int = 16_000_000,
+        disk_path: Optional[str] = os.path.join(DEFAULT_CACHE_DIR, "research.sqlite"),
+        disk_bytes: int = 128_000_000,
+        num_perm: int = 64,
+        band_rows: int = 2,
+    ):
+        """
+        Args:
+            ttl (float): Seconds a research result stays fresh.
+            threshold (float): Similarity from which a cached result answers the query, and a
+                cached sub-answer a sub-question.
+            seed_threshold (float): Similarity from which a cached result seeds a new research.
+            memory_bytes (int): Byte budget of the in-memory tier.
+            disk_path (str, optional): SQLite file of the on-disk tier, no disk tier if None.
+            disk_bytes (int): Byte budget of the on-disk tier.
+            num_perm (int): MinHash signature length.
+            band_rows (int): Signature values per LSH band; fewer rows find less similar candidates.
+        """
+        super().__init__(ttl=ttl, memory_bytes=memory_bytes, disk_path=disk_path, disk_bytes=disk_bytes)
+        self.threshold = threshold
+        self.seed_threshold = seed_threshold
+        self.band_rows = band_rows
+        rng = random.Random(0)  # the same permutations in every process
+        self._permutations = [(rng.randrange(1, self._PRIME), rng.randrange(self._PRIME)) for _ in range(num_perm)]
+        # Band index of the entries in the memory tier; pruned as they expire or are evicted
+        self._bands: dict[str, set[str]] = {}
+        self._key_bands: dict[str, list[str]] = {}
+        self._bands_lock = threading.Lock()
+
+    _PRIME = (1 << 61) - 1
+
+    @staticmethod
+    def key(query: str) -> str:
+        return " ".join(query.casefold().split())
+
+    @staticmethod
+    def similarity(a: set[str], b: set[str]) -> float:
+        """Jaccard similarity of two term sets."""
+        return len(a & b) / len(a | b) if a or b else 0.0
+
+    @staticmethod
+    def key_terms(query: str) -> set[str]:
+        """Terms of query (see context.text_terms) that are numbers or part of a name."""
+        terms = {term for term in text_terms(query) if any(c.isdigit() for c in term)}
+        for sentence in _SENTENCE_END.split(query.strip()):
+            for position, word in enumerate(_WORD.findall(sentence)):
+                # A capital after the first letter marks a name anywhere; a leading one only mid-sentence
+                if any(c.isupper() for c in word[1:]) or (position > 0 and word[0].isupper()):
+                    terms.update(text_terms(word))
+        return terms
+
+    @classmethod
+    def conflicts(cls, a: str, b: str, a_terms: set[str], b_terms: set[str]) -> bool:
+        """Whether a number or name of either query is missing from the other, e.g. 2023 and 2024."""
+        return bool((cls.key_terms(a) | cls.key_terms(b)) & (a_terms ^ b_terms))
+
+    def same_question(self, a: str, b: str) -> bool:
+        """Whether two questions are near-duplicates: no conflicting numbers or names and at least threshold similar."""
+        a_terms, b_terms = set(text_terms(a)), set(text_terms(b))
+        return not self.conflicts(a, b, a_terms, b_terms) and self.similarity(a_terms, b_terms) >= self.threshold
+
+    def bands(self, terms: set[str]) -> list[str]:
+        """LSH band hashes of the MinHash signature of terms."""
+        if not terms:
+            return []
+        hashes = [int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "big") for term in terms]
+        signature = [min((a * h + b) % self._PRIME for h in hashes) for a, b in self._permutations]
+        return [f"{start}:" + hashlib.blake2b(repr(signature[start:start + self.band_rows]).encode(), digest_size=8).hexdigest()
+                for start in range(0, len(signature), self.band_rows)]
+
+    def lookup(self, query: str) -> Optional[ResearchMatch]:
+        """
+        Find the fresh cached research most similar to query.
+
+        Args:
+            query (str): Research question.
+
+        Returns:
+            ResearchMatch | None: The best candidate without conflicting numbers or names, with its
+                mode set by the thresholds; None if there is none among the researches sharing an LSH band with query.
+        """
+        terms = set(text_terms(query))
+        bands = self.bands(terms)
+        with self._bands_lock:
+            candidates = {key for band in bands for key in self._bands.get(band, ())}
+        if self.disk is not None and bands:
+            candidates.update(self.disk.tagged(bands))
+        candidates.add(self.key(query))
+
+        best = None
+        for key in candidates:
+            entry = self.peek(key)
+            if entry is None or entry.age() > self.ttl:
+                if entry is not None:
+                    self.delete(key)
+                self._unindex(key)
+                continue
+            cached_terms = set(entry.value["terms"])
+            if self.conflicts(query, entry.value["query"], terms, cached_terms):
+                continue
+            similarity = 1.0 if key == self.key(query) else self.similarity(terms, cached_terms)
+            if best is None or similarity > best.similarity:
+                best = ResearchMatch(entry.value["query"], entry.value["result"], similarity, entry.stored_at)
+        if best is not None and best.similarity >= self.threshold:
+            best.mode = "hit"
+        elif best is not None and best.similarity >= self.seed_threshold:
+            best.mode = "seed"
+        if best is None or best.mode == "miss":
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return best
+
+    def store(self, query: str, result: Any):
+        """Cache the result of a research on query."""
+        key, terms = self.key(query), set(text_terms(query))
+        self.set(key, {"query": query, "terms": sorted(terms), "result": result})
+        bands = self.bands(terms)
+        with self._bands_lock:
+            self._unindex_locked(key)
+            self._key_bands[key] = bands
+            for band in bands:
+                self._bands.setdefault(band, set()).add(key)
+            # Entries evicted from the memory tier or expired leave the index; the disk tier keeps its own
+            for stale in [other for other in self._key_bands if other != key and not self._fresh_in_memory(other)]:
+                self._unindex_locked(stale)
+        if self.disk is not None and bands:
+            self.disk.tag(key, bands)
+
+    def _fresh_in_memory(self, key: str) -> bool:
+        entry = self.memory.get(key)
+        return entry is not None and entry.age() <= self.ttl
+
+    def _unindex(self, key: str):
+        with self._bands_lock:
+            self._unindex_locked(key)
+
+    def _unindex_locked(self, key: str):
+        for band in self._key_bands.pop(key, ()):
+            keys = self._bands.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._bands[band]
@@ -0,0 +1,313 @@
+import re
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+from telemetry import logger
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to an estimate when the offline tokenizer is not installed
+    tiktoken = None
+
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4.1": 1_000_000,
+    "gpt-4.1-mini": 1_000_000,
+    "gpt-4.1-nano": 1_000_000,
+    "gpt-4o": 128_000,
+    "gpt-4o-mini": 128_000,
+}
+DEFAULT_CONTEXT_WINDOW = 128_000
+# Token budget of the injected context per prompt
+DEFAULT_BUDGETS = {
+    "keyword": 4_000,
+    "plan": 8_000,
+    "judge": 8_000,
+    "summary": 16_000,
+    "condense": 4_000,
+    "page": 2_000,
+}
+
+# Function words that match almost any page, left out of queries (see query_terms)
+STOPWORDS = frozenset("""
+a about after all also an and any are as at be been before but by can could did do does for
+from had has have how i if in into is it its may more most no not of on or other our should so
+some such than that the their them then there these they this those to was we were what when
+where which who whom why will with would you your
+""".split())
+_TERM = re.compile(r"[a-z0-9]+|[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]+")
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]")
+
+def text_terms(text: str) -> list[str]:
+    """
+    Split text into lower-cased matching terms: latin words and CJK character bigrams.
+
+    Args:
+        text (str): Text to split.
+
+    Returns:
+        list[str]: Terms in order of occurrence.
+    """
+    terms = []
+    for match in _TERM.findall(text.lower()):
+        if match[0].isascii():
+            terms.append(match)
+        elif len(match) == 1:
+            terms.append(match)
+        else:
+            terms.extend(match[i:i + 2] for i in range(len(match) - 1))
+    return terms
+
+def query_terms(text: str) -> set[str]:
+    """
+    Distinct terms of a query without stopwords, so they do not match unrelated text.
+
+    Args:
+        text (str): Query text.
+
+    Returns:
+        set[str]: Terms, all of them if the query has nothing but stopwords.
+    """
+    terms = set(text_terms(text))
+    return terms - STOPWORDS or terms
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+@lru_cache(maxsize=1)
+def _warn_estimated():
+    logger.warning("tiktoken is not installed, token counts are estimated and prompts may not fit their budgets; "
+                   "pip install tiktoken (see requirements.txt)")
+
+def text_key(text: str) -> tuple[bytes, int]:
+    """Compact cache key for text: its digest and length, so caches do not keep whole pages alive as keys."""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest(), len(text)
+
+_TOKEN_COUNTS: OrderedDict[tuple[bytes, int, str], int] = OrderedDict()
+_TOKEN_COUNTS_SIZE = 8192
+_token_counts_lock = threading.Lock()
+
+def count_tokens(text: str, model: str = "gpt-4.1") -> int:
+    """
+    Count the tokens of text for model, using tiktoken when available.
+
+    Without tiktoken the count is estimated as one token per CJK character and one per four
+    other characters. Counts are remembered for the most recent texts, keyed by text_key.
+
+    Args:
+        text (str): Text to count.
+        model (str): Model whose tokenizer to use.
+
+    Returns:
+        int: Number of tokens.
+    """
+    key = (*text_key(text), model)
+    with _token_counts_lock:
+        tokens = _TOKEN_COUNTS.get(key)
+        if tokens is not None:
+            _TOKEN_COUNTS.move_to_end(key)
+            return tokens
+    if tiktoken is not None:
+        tokens = len(_encoding(model).encode(text, disallowed_special=()))
+    else:
+        _warn_estimated()
+        cjk = len(_CJK.findall(text))
+        tokens = cjk + math.ceil((len(text) - cjk) / 4)
+    with _token_counts_lock:
+        _TOKEN_COUNTS[key] = tokens
+        if len(_TOKEN_COUNTS) > _TOKEN_COUNTS_SIZE:
+            _TOKEN_COUNTS.popitem(last=False)
+    return tokens
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4.1") -> str:
+    """
+    Cut text down to at most max_tokens tokens.
+
+    Args:
+        text (str): Text to cut.
+        max_tokens (int): Token limit.
+        model (str): Model whose tokenizer to use.
+
+    Returns:
+        str: The text, or its longest prefix within the limit.
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    if tiktoken is not None:
+        encoding = _encoding(model)
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    end = len(text) * max_tokens // count_tokens(text, model)
+    while end > 0 and count_tokens(text[:end], model) > max_tokens:
+        end = end * 9 // 10
+    return text[:end]
+
+@dataclass
+class Chunk:
+    """A piece of a source text with its token count and matching terms."""
+    source: str
+    position: int
+    text: str
+    tokens: int
+    terms: frozenset[str]
+
+class ContextBuilder:
+    """
+    Build prompt context within a token budget.
+
+    Sources are split into chunks of about chunk_tokens tokens. When everything fits in the
+    budget the sources are passed through whole; otherwise chunks are ranked by term overlap
+    with the query and the best ones are kept, in their original order. Chunks are tokenized
+    once and reused across prompts.
+    """
+
+    def __init__(self, budgets: dict[str, int] | None = None, chunk_tokens: int = 256, cache_size: int = 1024):
+        """
+        Args:
+            budgets (dict[str, int], optional): Token budget per prompt ("keyword", "plan",
+                "judge", "summary", "condense") and per fetched page ("page"), merged over DEFAULT_BUDGETS.
+            chunk_tokens (int): Target chunk size in tokens.
+            cache_size (int): Number of chunked sources kept for reuse.
+        """
+        self.budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+        self.chunk_tokens = chunk_tokens
+        self.cache_size = cache_size
+        self._chunks: OrderedDict[tuple[str, bytes, int, str], list[Chunk]] = OrderedDict()
+
+    def budget(self, prompt: str, model: str) -> int:
+        """Token budget for prompt, capped at half the context window of model."""
+        window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+        return min(self.budgets[prompt], window // 2)
+
+    def chunks(self, source: str, text: str, model: str = "gpt-4.1") -> list[Chunk]:
+        """
+        Split a source into chunks, reusing the result for text seen before.
+
+        Args:
+            source (str): Name of the source, e.g. a sub-question or URL.
+            text (str): Source text.
+            model (str): Model whose tokenizer to use.
+
+        Returns:
+            list[Chunk]: Chunks in source order.
+        """
+        key = (source, *text_key(text), model)
+        if key in self._chunks:
+            self._chunks.move_to_end(key)
+            return self._chunks[key]
+
+        pieces, current, current_tokens = [], [], 0
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            tokens = count_tokens(line, model)
+            if tokens > self.chunk_tokens:
+                if current:
+                    pieces.append("\n".join(current))
+                    current, current_tokens = [], 0
+                # Split over-long lines into windows of roughly chunk_tokens tokens
+                width = max(1, len(line) * self.chunk_tokens // tokens)
+                pieces.extend(line[start:start + width] for start in range(0, len(line) - width, width))
+                line = line[(len(line) - 1) // width * width:]
+                tokens = count_tokens(line, model)
+            if current and current_tokens + tokens > self.chunk_tokens:
+                pieces.append("\n".join(current))
+                current, current_tokens = [], 0
+            if line:
+                current.append(line)
+                current_tokens += tokens
+        if current:
+            pieces.append("\n".join(current))
+
+        chunks = [
+            Chunk(source=source, position=position, text=piece, tokens=count_tokens(piece, model),
+                  terms=frozenset(text_terms(piece)))
+            for position, piece in enumerate(pieces)
+        ]
+        self._chunks[key] = chunks
+        if len(self._chunks) > self.cache_size:
+            self._chunks.popitem(last=False)
+        return chunks
+
+    def select(self, sources: dict[str, str], query: str, budget: int, model: str = "gpt-4.1") -> dict[str, str]:
+        """
+        Fit sources into budget, keeping the chunks most relevant to query.
+
+        Args:
+            sources (dict[str, str]): Source name to text.
+            query (str): Question the context is for.
+            budget (int): Token budget for all sources together.
+            model (str): Model whose tokenizer to use.
+
+        Returns:
+            dict[str, str]: Source name to (possibly shortened) text; sources with nothing
+                selected are left out.
+        """
+        if sum(count_tokens(text, model) for text in sources.values()) <= budget:
+            return dict(sources)
+
+        query_terms = set(text_terms(query))
+        chunks = [chunk for source, text in sources.items() for chunk in self.chunks(source, text, model)]
+        ranked = sorted(
+            chunks,
+            key=lambda chunk: (-len(chunk.terms & query_terms) / math.sqrt(1 + chunk.tokens), chunk.position),
+        )
+        selected, used = set(), 0
+        for chunk in ranked:
+            if used + chunk.tokens > budget:
+                continue
+            selected.add(id(chunk))
+            used += chunk.tokens
+
+        selected_sources = {}
+        for source, text in sources.items():
+            kept = [chunk.text for chunk in self.chunks(source, text, model) if id(chunk) in selected]
+            if kept:
+                selected_sources[source] = "\n...\n".join(kept)
+        return selected_sources
+
+    def results(self, result: dict[str, Any], query: str, prompt: str, model: str = "gpt-4.1") -> str:
+        """
+        Render accumulated results for a prompt within its budget.
+
+        Args:
+            result (dict[str, Any]): Sub-question to summary.
+            query (str): Question the prompt is about.
+            prompt (str): Prompt name, selects the budget.
+            model (str): Model the prompt is sent to.
+
+        Returns:
+            str: The results as a dict literal, like str(result).
+        """
+        sources = {str(key): str(value) for key, value in result.items()}
+        return str(self.select(sources, query, self.budget(prompt, model), model))
+
+    def references(self, references: list[dict[str, str]], query: str, prompt: str = "summary",
+                   model: str = "gpt-4.1") -> dict[str, str]:
+        """
+        Format references for a prompt within its budget.
+
+        Args:
+            references (list[dict[str, str]]): References with "url", "title" and "content".
+            query (str): Question the prompt is about.
+            prompt (str): Prompt name, selects the budget.
+            model (str): Model the prompt is sent to.
+
+        Returns:
+            dict[str, str]: Mapping of "Reference {idx}" to title, URL and selected content.
+        """
+        header_tokens = sum(count_tokens(reference["title"] + "\n" + reference["url"], model) for reference in references)
+        budget = max(self.budget(prompt, model) - header_tokens, 0)
+        contents = self.select({reference["url"]: reference["content"] for reference in references}, query, budget, model)
+        return {
+            f"Reference {idx}": reference["title"] + "\n" + reference["url"] + "\n" + contents[reference["url"]]
+            for idx, reference in enumerate(reference for reference in references if reference["url"] in contents)
+        }
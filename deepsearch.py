@@ -1,63 +1,214 @@
 import os
-import re
-import ast
-import json
-import httpx
+import time
+import asyncio
 from abc import ABC
-from typing import Any
+from functools import lru_cache
+from dataclasses import dataclass, field, asdict
+from typing import Any, AsyncIterator, Callable
 from pydantic import BaseModel, Field
-from concurrent.futures import ThreadPoolExecutor
 
-from LLM import OpenAIClient
-from prompts import EXPERT_PLANNING_SYSTEM, EXPERT_KEYWORD_SYSTEM, EXPERT_JUDEGE_SYSTEM, SUMMARY_SYSTEM
+from LLM import OpenAIClient, ResponseCache, StructuredOutputError
+from fetcher import PageFetcher
+from cache import CacheStats, ContentCache, ResearchCache, ResearchMatch, SearchCache, normalize_url
+from context import ContextBuilder
+from extract import html_to_text
+from rerank import Reranker, BM25Reranker, GPTReranker
+from retrieval import EvidenceStats, EvidenceStore, Passage, PassageIndex
+from budget import BudgetExhausted, BudgetLimits, ResearchBudget
+from routing import DETERMINISTIC_STEPS, ModelRouter
+from search import FederatedSearch
+from telemetry import CACHE_LOOKUPS, FETCH_BYTES, FETCHES, RESEARCH_SIMILARITY, Span, configure_logging, logger, span
+from prompts import EXPERT_PLANNING_SYSTEM, EXPERT_KEYWORD_SYSTEM, EXPERT_JUDEGE_SYSTEM, SUMMARY_SYSTEM, CONDENSE_SYSTEM
 
 class DeepResearchParams(BaseModel):
     searchQuery: str = Field(..., description="The question of the research")
 
+class PlanItem(BaseModel):
+    step: str | int = Field(..., description="Task step number")
+    sub_question: str = Field(..., description="What needs to be retrieved from the web")
+    depends_on: list[str | int] = Field(default_factory=list, description="Steps whose results this step needs")
+
+class ResearchPlan(BaseModel):
+    plan: list[PlanItem] = Field(..., min_length=1, description="The TODO list")
+
+class SearchKeywords(BaseModel):
+    keywords: list[str] = Field(..., min_length=1, description="One set of optimal search keywords per core point")
+
+class RelevantTitles(BaseModel):
+    releative_titles: list[int] = Field(..., description="Indices of the relevant titles")
+
+class Judgement(BaseModel):
+    finished: bool = Field(..., description="True if the results sufficiently answer the question")
+
+@dataclass
+class ResearchEvent:
+    """
+    Progress event emitted while a research runs.
+
+    type is one of "plan", "sub_question_started", "sources_found", "summary",
+    "sub_question_failed", "judge", "result" and "error"; data carries the payload of the event.
+    """
+    type: str
+    data: dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"type": self.type, **self.data}
+
+Emit = Callable[[ResearchEvent], None]
+
+def _ignore_event(event: ResearchEvent) -> None:
+    pass
+
+@lru_cache(maxsize=1)
+def default_llm() -> OpenAIClient:
+    """
+    The LLM client of this process, built on first use rather than at import, so that a worker
+    process picks up the environment (e.g. LLM_RATE_LIMIT_DB) it was started with.
+    """
+    return OpenAIClient(
+        base_url=os.environ.get("BASE_URL","https://api.openai.com/v1"), api_key=os.environ.get("OPEN_AI_KEY"),
+        # DEEPSEARCH_LLM_CACHE=1 caches deterministic (temperature 0) calls, "all" caches every temperature
+        response_cache=ResponseCache(allow_temperature=os.environ.get("DEEPSEARCH_LLM_CACHE") == "all")
+        if os.environ.get("DEEPSEARCH_LLM_CACHE", "0") != "0" else None)
+
+class _DefaultLLM:
+    """Class attribute reading as default_llm(); assigning WebSearchTool.llm replaces it."""
+
+    def __get__(self, instance, owner) -> OpenAIClient:
+        return default_llm()
+
 class WebSearchTool(ABC):
     name = "websearch"
     description = "Searching on the internet"
     param_anno: BaseModel = DeepResearchParams
-    llm = OpenAIClient(base_url=os.environ.get("BASE_URL","https://api.openai.com/v1"), api_key=os.environ.get("OPEN_AI_KEY"))
+    llm = _DefaultLLM()  # shared by every tool of the process
+    RETHINK_MARKER = "<|RETHINK AND PLANNING>|"
 
-    def web_search_bing(self, query: str, page_num: int = 3):
+    def __init__(self, concurrent: bool = True, max_concurrency: int | None = None, fetcher: PageFetcher | None = None,
+                 content_cache: ContentCache | None = None, search_cache: SearchCache | None = None,
+                 context_builder: ContextBuilder | None = None, reranker: Reranker | None = None,
+                 passages_per_summary: int = 12, budget_limits: BudgetLimits | None = None,
+                 router: ModelRouter | None = None, searcher: FederatedSearch | None = None,
+                 good_enough_sources: int | None = None, source_deadline: float | None = None,
+                 map_reduce_tokens: int | None = None, research_cache: ResearchCache | None = None):
+        """
+        Args:
+            concurrent (bool): Run independent sub-questions of a plan concurrently, defaults to True.
+            max_concurrency (int | None): Max sub-questions researched at once, defaults to the
+                DEEPSEARCH_MAX_CONCURRENCY environment variable or 4.
+            fetcher (PageFetcher | None): Shared page fetcher, defaults to a new PageFetcher.
+            content_cache (ContentCache | None): Cache of extracted page text, defaults to a new
+                ContentCache under DEEPSEARCH_CACHE_DIR.
+            search_cache (SearchCache | None): Cache of search results, defaults to a new
+                SearchCache under DEEPSEARCH_CACHE_DIR.
+            context_builder (ContextBuilder | None): Fits results and references into each prompt's
+                token budget, defaults to a new ContextBuilder.
+            reranker (Reranker | None): Picks the search hits worth fetching, defaults to local BM25,
+                or the GPT title reranker when DEEPSEARCH_RERANKER is "gpt".
+            passages_per_summary (int): Max passages sent to each summary prompt, defaults to 12.
+            budget_limits (BudgetLimits | None): Deadline, token, LLM-call and iteration limits of
+                each research, defaults to BudgetLimits() (configured by environment variables).
+            router (ModelRouter | None): Models per research step, defaults to ModelRouter().
+            searcher (FederatedSearch | None): Search providers, defaults to those configured by
+                DEEPSEARCH_SEARCH_PROVIDERS (Bing unless set).
+            good_enough_sources (int | None): Pages after which a sub-question stops waiting for
+                more, defaults to DEEPSEARCH_GOOD_ENOUGH_SOURCES or 8.
+            source_deadline (float | None): Seconds a sub-question waits for pages once it has
+                one, defaults to DEEPSEARCH_SOURCE_DEADLINE or 6.
+            map_reduce_tokens (int | None): Passage tokens above which a summary is map-reduced
+                (sources condensed concurrently, then merged), defaults to
+                DEEPSEARCH_MAP_REDUCE_TOKENS or 6000.
+            research_cache (ResearchCache | None): Results of earlier researches, answering
+                near-duplicate queries or seeding their research; opt-in, defaults to a new
+                ResearchCache under DEEPSEARCH_CACHE_DIR if DEEPSEARCH_RESEARCH_CACHE is "1", else none.
         """
-        Perform web search using Bing Search API.
+        self.concurrent = concurrent
+        self.max_concurrency = max_concurrency or int(os.environ.get("DEEPSEARCH_MAX_CONCURRENCY", "4"))
+        self.fetcher = fetcher or PageFetcher()
+        self.content_cache = content_cache or ContentCache()
+        self.search_cache = search_cache or SearchCache()
+        self.context_builder = context_builder or ContextBuilder()
+        if reranker is None:
+            reranker = GPTReranker(self.reranker_by_gpt) if os.environ.get("DEEPSEARCH_RERANKER") == "gpt" else BM25Reranker()
+        self.reranker = reranker
+        self.passages_per_summary = passages_per_summary
+        self.budget_limits = budget_limits or BudgetLimits()
+        self.router = router or ModelRouter()
+        self.searcher = searcher or FederatedSearch.from_env()
+        self.good_enough_sources = good_enough_sources or int(os.environ.get("DEEPSEARCH_GOOD_ENOUGH_SOURCES", "8"))
+        self.source_deadline = source_deadline or float(os.environ.get("DEEPSEARCH_SOURCE_DEADLINE", "6"))
+        self.map_reduce_tokens = map_reduce_tokens or int(os.environ.get("DEEPSEARCH_MAP_REDUCE_TOKENS", "6000"))
+        if research_cache is None and os.environ.get("DEEPSEARCH_RESEARCH_CACHE", "0") == "1":
+            research_cache = ResearchCache()
+        self.research_cache = research_cache
+
+    def cache_stats(self) -> dict[str, CacheStats]:
+        """Statistics of the caches this tool uses, by cache name; caches turned off are left out."""
+        caches = {"content": self.content_cache, "search": self.search_cache,
+                  "research": self.research_cache, "llm": self.llm.response_cache}
+        return {name: cache.stats for name, cache in caches.items() if cache is not None}
+
+    async def search_web(self, query: str, page_num: int = 3, mkt: str = 'en-US'):
+        """
+        Search the configured providers through search_cache, sharing one search between
+        concurrent identical queries.
 
         Args:
             query (str): Search keywords.
-            page_num (int): Number of result pages, defaults to 3.
+            page_num (int): Number of result pages of 10 hits, defaults to 3.
+            mkt (str): Market / language, defaults to en-US.
 
         Returns:
-            tuple: A tuple containing two lists - first list is search result URLs, second list is search result titles.
+            tuple: A tuple containing three lists - search result URLs, titles and snippets.
+        """
+        with span("search", query=query) as stage:
+            key = self.search_cache.key(query, mkt, page_num*10, self.searcher.names)
+            cached = await self.search_cache.aget(key)
+            stage.set("cache_hit", cached is not None)
+            CACHE_LOOKUPS.inc(cache="search", result="hit" if cached is not None else "miss")
+            if cached is not None:
+                return cached["urls"], cached["titles"], cached["snippets"]
 
-        Raises:
-            Exception: Catches and prints any exceptions that occur.
+            async def search():
+                async with self.search_cache.lease(key) as waited:
+                    # Another process sharing the cache may have run this search meanwhile
+                    cached = await self.search_cache.aget(key) if waited else None
+                    if cached is not None:
+                        return cached["urls"], cached["titles"], cached["snippets"]
+                    hits = await self.searcher.search(query, page_num*10, mkt)
+                    search_urls = [hit.url for hit in hits]
+                    titles = [hit.title for hit in hits]
+                    snippets = [hit.snippet for hit in hits]
+                    # Failed searches come back empty and are not worth caching
+                    if search_urls:
+                        await self.search_cache.aset(key, {"urls": search_urls, "titles": titles, "snippets": snippets})
+                    return search_urls, titles, snippets
+
+            search_urls, titles, snippets = await self.search_cache.single_flight.do(key, search)
+            stage.set("results", len(search_urls))
+            return search_urls, titles, snippets
 
+    @staticmethod
+    def html_to_text(html: str) -> str:
         """
-        subscription_key = os.environ.get("Bing_API_KEY")
-        endpoint = 'https://api.bing.microsoft.com/v7.0/search'
-        search_urls = []
-        titles = []
-        mkt = 'en-US'
-        params = {'q': query, 'mkt': mkt, 'count': page_num*10}
-        headers = {'Ocp-Apim-Subscription-Key': subscription_key}
-        try:
-            response = httpx.get(endpoint, headers=headers, params=params)
-            response.raise_for_status()
-            web_content = response.json()
-            search_urls = [single_page["url"]
-                            for single_page in web_content["webPages"]["value"]]
-            titles = [single_page["name"]
-                        for single_page in web_content["webPages"]["value"]]
-        except Exception as e:
-            print(e)
-        return search_urls, titles
+        Convert an HTML page to its main text, see extract.html_to_text.
+
+        Args:
+            html (str): Page markup.
 
-    def extract_url_content(self, url: str):
+        Returns:
+            str: Extracted plain text.
+        """
+        return html_to_text(html)
+
+    async def extract_url_content(self, url: str):
         """
         Extract plain text content from a specified URL.
 
+        Pages of an offline search index come from the index. Fresh pages are served from
+        content_cache; stale ones are revalidated with their ETag/Last-Modified before being
+        downloaded again. Processes sharing the cache directory download a page only once.
+
         Args:
             url (str): The URL to extract content from.
 
@@ -65,16 +216,49 @@ class WebSearchTool(ABC):
             str: Extracted plain text content, returns empty string if extraction fails.
 
         """
+        with span("fetch", url=url) as stage:
+            text = self.searcher.page_text(url)
+            if text is not None:
+                stage.set("local", True)
+                return text
+            text = await self.content_cache.get_page(url)
+            stage.set("cache_hit", text is not None)
+            CACHE_LOOKUPS.inc(cache="content", result="hit" if text is not None else "miss")
+            if text is not None:
+                return text
+
+            async with self.content_cache.lease(normalize_url(url)) as waited:
+                # Another process sharing the cache may have fetched the page meanwhile
+                text = await self.content_cache.get_page(url) if waited else None
+                if text is not None:
+                    stage.set("cache_hit", True)
+                    return text
+                return await self._download(url, stage)
+
+    async def _download(self, url: str, stage: Span) -> str:
+        """Fetch a page missing from content_cache (revalidating a stale copy), extract and cache its text."""
+        page = await self.fetcher.fetch(url, headers=await self.content_cache.conditional_headers(url))
+        if page.status_code == 304:
+            text = await self.content_cache.revalidated(url)
+            FETCHES.inc(result="not_modified")
+            stage.set("revalidated", text is not None)
+            if text is not None:
+                return text
+            page = await self.fetcher.fetch(url)
+        stage.set("status", page.status_code)
+        stage.set("bytes", page.bytes_downloaded)
+        FETCH_BYTES.inc(page.bytes_downloaded)
+        FETCHES.inc(result="ok" if page.ok else "error")
+        if not page.ok:
+            logger.info("page fetch failed", extra={"url": url, "error": page.error})
+            return ""
         try:
-            from bs4 import BeautifulSoup
-            import requests
-            r = requests.get(url)
-            soup = BeautifulSoup(r.text, 'html.parser')
-            text = soup.get_text().strip()
-            return text
+            text = await asyncio.to_thread(self.html_to_text, page.text)
         except Exception as e:
-            print(e)
+            logger.warning("text extraction failed", extra={"url": url, "error": str(e)})
             return ""
+        await self.content_cache.set_page(url, text, etag=page.etag, last_modified=page.last_modified)
+        return text
 
     async def reranker_by_gpt(self, user_question, search_title):
         """
@@ -94,61 +278,643 @@ class WebSearchTool(ABC):
                 "content": "You are a search engine. I give you a set of webpage titles and URLs. You need to determine if these titles are relevant to my query. If relevant, return the indices in JSON format, example: {\"releative_titles\":[0,1,2]} \n\nReference title list: {search_title} \n\nUser question: {user_question}".replace("{search_title}", str(search_title)).replace("{user_question}",str(user_question))
                 }
         ]
-        temp_response = await self.llm(temp_messages, model="gpt-4.1", temperature=0.7)
-        # print(temp_response)
-        # Quickly parse the "releative_titles" sequence list from temp_response
         try:
-            try:
-                temp_response= json.loads(str(temp_response.choices[0].message.content))["releative_titles"]
-            except:
-                # Find JSON string using regex
-                import re
-                temp_response = json.loads(re.findall(r'\{.*?\}', str(temp_response))[0])["releative_titles"]
-            return temp_response
+            relevant = await self.call_step("rerank", None, temp_messages, RelevantTitles)
+            return relevant.releative_titles
         except Exception as e:
-            # Print error line
-            import sys
-            print(f"Error: {e}\nLine: {sys.exc_info()[-1].tb_lineno}")
-
+            logger.warning("rerank failed, keeping search order", extra={"error": str(e)})
             # Return list [0,...n] with length matching search_titles
             return [i for i in range(len(search_title))]
 
-    async def search_by_bing(self, searchKeyWords: str, searchQuestion: str, page_num: int = 1)-> dict[str, Any] | None:
+    async def search_references(self, searchKeyWords: str, searchQuestion: str, page_num: int = 1,
+                                evidence: EvidenceStore | None = None) -> list[dict[str, str]]:
         """
-        Perform search using Bing and return results.
+        Search Bing, rerank the hits and fetch the content of the relevant pages.
 
         Args:
             searchKeyWords (str): Keywords to search for.
             searchQuestion (str): User's question for relevance filtering.
             page_num (int, optional): Number of pages to search, defaults to 1.
+            evidence (EvidenceStore, optional): Evidence of the research; keywords already searched
+                and pages already fetched in it are reused, new pages are added to it.
 
         Returns:
-            dict[str, Any] | None: Dictionary containing search results and related info, returns None if no results found.
+            list[dict[str, str]]: References with "url", "title" and "content", in rerank order.
+
+        """
+        if evidence is not None:
+            return await evidence.search(
+                searchKeyWords, lambda: self._search_references(searchKeyWords, searchQuestion, page_num, evidence))
+        return await self._search_references(searchKeyWords, searchQuestion, page_num)
+
+    async def _search_references(self, searchKeyWords: str, searchQuestion: str, page_num: int = 1,
+                                 evidence: EvidenceStore | None = None) -> list[dict[str, str]]:
+        references = [reference async for reference in self.stream_references(searchKeyWords, searchQuestion, page_num, evidence)]
+        rank = {reference["url"]: reference.pop("rank") for reference in references}
+        return sorted(references, key=lambda reference: rank[reference["url"]])
+
+    async def stream_references(self, searchKeyWords: str, searchQuestion: str, page_num: int = 1,
+                                evidence: EvidenceStore | None = None) -> AsyncIterator[dict[str, Any]]:
+        """
+        Search, rerank and fetch like search_references, yielding each reference as soon as its
+        page has been fetched, extracted and cut to its relevant passages.
+
+        Pages still downloading when the caller stops iterating are cancelled.
 
+        Args:
+            searchKeyWords (str): Keywords to search for.
+            searchQuestion (str): User's question for relevance filtering.
+            page_num (int, optional): Number of pages to search, defaults to 1.
+            evidence (EvidenceStore, optional): Evidence of the research; pages already fetched in
+                it are reused, new pages are added to it.
+
+        Yields:
+            dict[str, Any]: References with "url", "title", "content" and the hit's "rank" after
+                reranking, in the order their pages arrive.
         """
-        search_urls, search_title = self.web_search_bing(
-            searchKeyWords, page_num)
+        search_urls, search_title, snippets = await self.search_web(searchKeyWords, page_num)
         
         if len(search_urls) == 0:
-            return {}
+            return
         
-        # Add relevance filtering using gpt-4o-mini to check if titles match user's query in kwargs["input"], keep only relevant URLs
+        # Relevance filtering, keep only the hits the reranker considers relevant to the question
         user_question = searchQuestion
-        temp_response = await self.reranker_by_gpt(user_question, search_title)
-        # temp_response = await self.reranker_by_embedding(user_question, search_title)
+        with span("rerank", candidates=len(search_title)) as stage:
+            temp_response = await self.reranker.rerank(user_question, search_title, snippets)
+            stage.set("kept", len(temp_response))
         search_urls = [search_urls[idx] for idx in temp_response]
         search_title = [search_title[idx] for idx in temp_response]
-        
-        with ThreadPoolExecutor(max_workers=len(search_urls)/int(page_num)) as executor:
-            res = list(executor.map(self.extract_url_content, search_urls))
+        if len(search_urls) == 0:
+            return
 
-        respone_content = {}
-        for idx in range(len((res))):
-            if len(res[idx]) >=50 and len(res[idx]) < 10000:
-                respone_content[f"Reference {idx}"] = search_title[idx] + "\n" + str(res[idx])
+        def fetch(url: str, title: str):
+            if evidence is not None:
+                return evidence.page(url, title, lambda: self.extract_url_content(url))
+            return self.extract_url_content(url)
 
-        # return respone_content
-        return respone_content
+        # Long pages are cut down to their passages most relevant to the question instead of being dropped
+        page_budget = self.context_builder.budget("page", self.router.primary("summary"))
+        pending = {asyncio.ensure_future(fetch(url, title)): rank
+                   for rank, (url, title) in enumerate(zip(search_urls, search_title))}
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    rank = pending.pop(task)
+                    text = task.result()
+                    if len(text) >= 50:
+                        url = search_urls[rank]
+                        passages = self.context_builder.select({url: text}, searchQuestion, page_budget)
+                        yield {"url": url, "title": search_title[rank], "content": passages[url], "rank": rank}
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def collect_references(self, keywords: list[str], sub_question: str, evidence: EvidenceStore,
+                                 budget: ResearchBudget | None = None) -> list[dict[str, str]]:
+        """
+        Search all keywords of a sub-question concurrently and gather references until enough
+        have arrived.
+
+        References flow in as their pages are fetched. Collection stops once good_enough_sources
+        distinct pages are in, or source_deadline seconds after it started if at least one page
+        is in; the remaining downloads are cancelled, so the slowest page does not set the
+        latency of the sub-question.
+
+        Args:
+            keywords (list[str]): Search keywords.
+            sub_question (str): The sub-question they were extracted for.
+            evidence (EvidenceStore): Evidence of the research; keywords already searched in it are not searched again.
+            budget (ResearchBudget, optional): Budget of the research; collection also stops at its deadline.
+
+        Returns:
+            list[dict[str, str]]: References with "url", "title" and "content", merged in keyword order.
+        """
+        queue: asyncio.Queue[tuple[str, dict[str, Any]] | None] = asyncio.Queue()
+
+        async def pump(keyword: str):
+            try:
+                searched = evidence.searched(keyword)
+                if searched is not None:
+                    for reference in searched:
+                        queue.put_nowait((keyword, reference))
+                    return
+                question = "参考用户问题：["+str(sub_question)+"]\n\n请结合搜索关键词:[{temp_keyword}]\n总结搜索到的网页的内容".replace("{temp_keyword}", keyword)
+                collected = []
+                async for reference in self.stream_references(keyword, question, evidence=evidence):
+                    reference.pop("rank")
+                    collected.append(reference)
+                    queue.put_nowait((keyword, reference))
+                # Only a search that ran to the end is recorded; one cut off at the cutoff is searched again when asked for
+                evidence.add_search(keyword, collected)
+            finally:
+                queue.put_nowait(None)
+
+        deadline = time.monotonic() + self.source_deadline
+        if budget is not None:
+            deadline = min(deadline, time.monotonic() + budget.remaining_seconds())
+        by_keyword: dict[str, list[dict[str, Any]]] = {keyword: [] for keyword in keywords}
+        urls: set[str] = set()
+        tasks = [asyncio.create_task(pump(keyword)) for keyword in dict.fromkeys(keywords)]
+        running = len(tasks)
+        with span("sources", keywords=len(tasks)) as stage:
+            try:
+                while running and len(urls) < self.good_enough_sources:
+                    timeout = max(deadline - time.monotonic(), 0) if urls else None
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        stage.set("cutoff", "deadline")
+                        break
+                    if item is None:
+                        running -= 1
+                        continue
+                    keyword, reference = item
+                    by_keyword[keyword].append(reference)
+                    urls.add(reference["url"])
+                else:
+                    stage.set("cutoff", "enough" if running else "complete")
+            finally:
+                stage.set("sources", len(urls))
+                stage.set("searches_cancelled", sum(not task.done() for task in tasks))
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        return self.merge_references(list(by_keyword.values()))
+
+    @staticmethod
+    def merge_references(reference_lists: list[list[dict[str, str]]]) -> list[dict[str, str]]:
+        """
+        Merge the references of several searches, dropping duplicate URLs.
+
+        Args:
+            reference_lists (list[list[dict[str, str]]]): References per search, in keyword order.
+
+        Returns:
+            list[dict[str, str]]: Merged references, first occurrence of each URL wins.
+        """
+        merged, seen = [], set()
+        for references in reference_lists:
+            for reference in references:
+                if reference["url"] in seen:
+                    continue
+                seen.add(reference["url"])
+                merged.append(reference)
+        return merged
+
+    @staticmethod
+    def format_references(references: list[dict[str, str]]) -> dict[str, str]:
+        """
+        Format references for the summary prompt.
+
+        Args:
+            references (list[dict[str, str]]): References with "url", "title" and "content".
+
+        Returns:
+            dict[str, str]: Mapping of "Reference {idx}" to title, URL and page content.
+        """
+        return {
+            f"Reference {idx}": reference["title"] + "\n" + reference["url"] + "\n" + reference["content"]
+            for idx, reference in enumerate(references)
+        }
+
+    async def search_by_bing(self, searchKeyWords: str, searchQuestion: str, page_num: int = 1)-> dict[str, Any] | None:
+        """
+        Perform search using Bing and return results.
+
+        Args:
+            searchKeyWords (str): Keywords to search for.
+            searchQuestion (str): User's question for relevance filtering.
+            page_num (int, optional): Number of pages to search, defaults to 1.
+
+        Returns:
+            dict[str, Any] | None: Dictionary containing search results and related info, returns None if no results found.
+
+        """
+        references = await self.search_references(searchKeyWords, searchQuestion, page_num)
+        return self.format_references(references)
+
+    def schedule_plan(self, plan: list[dict[str, Any]]) -> tuple[list[list[dict[str, Any]]], bool]:
+        """
+        Split a plan into stages that can be executed one after another.
+
+        Items inside one stage are independent and may run concurrently. A new stage starts
+        whenever an item lists a step of the current stage in "depends_on". Planning stops at
+        the first rethink item, since everything after it has to be re-planned anyway.
+
+        Args:
+            plan (list[dict[str, Any]]): Plan items from the planner.
+
+        Returns:
+            tuple: The list of stages and whether a rethink item asked for re-planning.
+        """
+        stages = []
+        current, current_steps = [], set()
+        for item in plan:
+            if self.RETHINK_MARKER in item['sub_question']:
+                if current:
+                    stages.append(current)
+                return stages, True
+
+            depends_on = item.get('depends_on') or []
+            if not isinstance(depends_on, list):
+                depends_on = [depends_on]
+            depends_on = {str(step) for step in depends_on}
+            if current and (not self.concurrent or depends_on & current_steps):
+                stages.append(current)
+                current, current_steps = [], set()
+            current.append(item)
+            current_steps.add(str(item.get('step', len(current_steps))))
+
+        if current:
+            stages.append(current)
+        return stages, False
+
+    async def research_sub_question(self, sub_question: str, ref_content: str, emit: Emit = _ignore_event,
+                                    evidence: EvidenceStore | None = None, budget: ResearchBudget | None = None) -> str:
+        """
+        Extract keywords for a sub-question, search them and summarize the references.
+
+        When the evidence of the research already covers the sub-question, keyword extraction
+        and searching are skipped. Only the passages of the evidence that best match the
+        sub-question are sent to the summary prompt.
+
+        Args:
+            sub_question (str): The sub-question from the plan.
+            ref_content (str): Results gathered so far, used as context for keyword extraction.
+            emit (Emit, optional): Receives sub_question_started, sources_found and summary events.
+            evidence (EvidenceStore, optional): Evidence of the research, a new one if None.
+            budget (ResearchBudget, optional): Budget of the research, unlimited if None.
+
+        Returns:
+            str: Summary answering the sub-question.
+        """
+        emit(ResearchEvent("sub_question_started", {"sub_question": sub_question}))
+        evidence = evidence or EvidenceStore(self.context_builder)
+        if evidence.covers(sub_question):
+            evidence.stats.sub_questions_answered_from_store += 1
+            return await self.summarize(sub_question, self.retrieve_passages(evidence, [], sub_question), [], emit, budget)
+
+        # Combine sub-question with search results to extract keywords from sub_question
+        temp_keywords = await self.call_step("keyword", budget, [
+            {"role":"system","content": EXPERT_KEYWORD_SYSTEM.replace("{ref_content}",ref_content).replace("{question}",sub_question)},
+            {"role":"user","content": sub_question}
+            ], SearchKeywords)
+        temp_keywords = temp_keywords.keywords
+        # Search every keyword concurrently and summarize the merged, de-duplicated references
+        # as soon as enough of them have arrived
+        references = await self.collect_references(temp_keywords, sub_question, evidence, budget)
+        passages = self.retrieve_passages(evidence, references, sub_question + " " + " ".join(temp_keywords))
+        return await self.summarize(sub_question, passages, temp_keywords, emit, budget)
+
+    async def summarize(self, sub_question: str, passages: list[Passage], keywords: list[str], emit: Emit = _ignore_event,
+                        budget: ResearchBudget | None = None) -> str:
+        """
+        Summarize the retrieved passages into the answer of a sub-question.
+
+        When the passages come from several pages and add up to more than map_reduce_tokens,
+        all of them are condensed first (see condense); otherwise the best passages_per_summary
+        of them go to the summary prompt as they are.
+
+        Args:
+            sub_question (str): The sub-question from the plan.
+            passages (list[Passage]): Passages retrieved for it, best first.
+            keywords (list[str]): Keywords searched for it, empty if answered from the evidence.
+            emit (Emit, optional): Receives sources_found and summary events.
+            budget (ResearchBudget, optional): Budget of the research, unlimited if None.
+
+        Returns:
+            str: Summary answering the sub-question.
+        """
+        map_reduce = (len({passage.url for passage in passages}) > 1
+                      and sum(passage.tokens for passage in passages) > self.map_reduce_tokens)
+        if not map_reduce:
+            passages = passages[:self.passages_per_summary]
+        sources = {passage.url: passage.title for passage in passages}
+        emit(ResearchEvent("sources_found", {
+            "sub_question": sub_question,
+            "keywords": keywords,
+            "sources": [{"url": url, "title": title} for url, title in sources.items()],
+        }))
+        if map_reduce:
+            temp_search_result = await self.condense(sub_question, passages, budget)
+        else:
+            temp_search_result = PassageIndex.format_passages(passages)
+
+        summary = await self.call_step("summary", budget, [
+            {"role":"system","content": SUMMARY_SYSTEM.replace("{ref_content}", str(temp_search_result))
+                                    .replace("{question}", sub_question)},
+            {"role":"user","content": sub_question}
+            ])
+        emit(ResearchEvent("summary", {"sub_question": sub_question, "summary": summary}))
+        return summary
+
+    async def condense(self, sub_question: str, passages: list[Passage], budget: ResearchBudget | None = None) -> dict[str, str]:
+        """
+        Map step of map-reduce summarization: split the passages into groups of whole source
+        pages of up to the "condense" token budget and extract the facts relevant to the
+        sub-question from each group concurrently, with the small condense model. The notes
+        keep their source links, so the summary prompt can cite them as it cites pages.
+
+        Args:
+            sub_question (str): The sub-question from the plan.
+            passages (list[Passage]): Passages retrieved for it, best first.
+            budget (ResearchBudget, optional): Budget of the research, unlimited if None.
+
+        Returns:
+            dict[str, str]: Mapping of "Notes {idx}" to the notes of each group, for the summary prompt.
+        """
+        by_url: dict[str, list[Passage]] = {}
+        for passage in passages:
+            by_url.setdefault(passage.url, []).append(passage)
+        group_tokens = self.context_builder.budget("condense", self.router.primary("condense"))
+        groups, current, current_tokens = [], [], 0
+        for page in by_url.values():
+            page_tokens = sum(passage.tokens for passage in page)
+            if current and current_tokens + page_tokens > group_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.extend(page)
+            current_tokens += page_tokens
+        if current:
+            groups.append(current)
+
+        async def condense_group(group: list[Passage]) -> str:
+            return await self.call_step("condense", budget, [
+                {"role": "system", "content": CONDENSE_SYSTEM.replace("{ref_content}", str(PassageIndex.format_passages(group)))
+                                                            .replace("{question}", sub_question)},
+                {"role": "user", "content": sub_question}
+            ])
+
+        with span("map_reduce", groups=len(groups), sources=len(by_url)):
+            notes = await asyncio.gather(*(condense_group(group) for group in groups))
+        return {f"Notes {idx}": note for idx, note in enumerate(notes)}
+
+    def retrieve_passages(self, evidence: EvidenceStore, references: list[dict[str, str]], query: str) -> list[Passage]:
+        """
+        Pick the passages of all evidence gathered so far that are relevant to query, within the
+        summary token budget. summarize decides on this whole set whether to map-reduce it or
+        to keep only its best passages_per_summary passages.
+
+        Args:
+            evidence (EvidenceStore): Evidence of the research.
+            references (list[dict[str, str]]): References just found for query, used as fallback.
+            query (str): Sub-question and its keywords.
+
+        Returns:
+            list[Passage]: Relevant passages, best first.
+        """
+        index = evidence.index
+        for reference in references:
+            if reference["url"] not in index:
+                index.add(reference["url"], reference["title"], reference["content"])
+        budget = self.context_builder.budget("summary", self.router.primary("summary"))
+        passages = index.search(query, k=len(index.passages), budget=budget)
+        if not passages:
+            # Nothing matches lexically, fall back to the opening passage of every page just found
+            urls = [reference["url"] for reference in references]
+            passages = [index.passages[index.urls[url][0]] for url in urls if index.urls.get(url)]
+        return passages
+
+    async def call_llm(self, budget: ResearchBudget | None, messages: list[dict[str, str]],
+                       response_model: type[BaseModel] | None = None, **kwargs):
+        """
+        Call the LLM within the research budget.
+
+        Every request is charged to the budget, the repair retries of structured output
+        included, also when the reply never validates.
+
+        Args:
+            budget (ResearchBudget | None): Budget of the research, unlimited if None.
+            messages (list[dict[str, str]]): Chat messages.
+            response_model (type[BaseModel], optional): Request structured output validated against it.
+            **kwargs: Passed on to the LLM client.
+
+        Returns:
+            ChatCompletion: The completion.
+
+        Raises:
+            BudgetExhausted: If the budget is used up before or, for the deadline, during the call.
+            StructuredOutputError: If the reply does not validate against response_model.
+        """
+        if response_model is not None:
+            call = self.llm.parse(messages, response_model=response_model, **kwargs)
+        else:
+            call = self.llm(messages, **kwargs)
+        if budget is None:
+            return await call
+        try:
+            budget.check()
+        except BudgetExhausted:
+            call.close()
+            raise
+        try:
+            completion = await asyncio.wait_for(call, timeout=budget.remaining_seconds())
+        except asyncio.TimeoutError:
+            raise BudgetExhausted("deadline")
+        except StructuredOutputError as e:
+            budget.record(e)  # the caller may escalate to another model, these requests stay spent
+            raise
+        budget.record(completion)
+        return completion
+
+    async def call_step(self, step: str, budget: ResearchBudget | None, messages: list[dict[str, str]],
+                        response_model: type[BaseModel] | None = None, **kwargs) -> Any:
+        """
+        Call the model routed to a research step, escalating to the step's next model when its
+        reply does not validate against response_model even after repair retries.
+
+        Args:
+            step (str): Research step, see routing.STEPS.
+            budget (ResearchBudget | None): Budget of the research, unlimited if None.
+            messages (list[dict[str, str]]): Chat messages.
+            response_model (type[BaseModel], optional): Structured output model, plain text if None.
+            **kwargs: Passed on to the LLM client.
+
+        Returns:
+            Any: The validated response_model instance, or the reply text.
+
+        Raises:
+            StructuredOutputError: If no model's reply could be validated.
+        """
+        if step in DETERMINISTIC_STEPS:
+            kwargs.setdefault("temperature", 0)
+        error = None
+        with span(step) as stage:
+            for model in self.router.models(step):
+                stage.set("model", model)
+                try:
+                    completion = await self.call_llm(budget, messages, response_model=response_model, model=model, **kwargs)
+                except StructuredOutputError as e:
+                    logger.warning("unparseable reply, escalating", extra={"step": step, "model": model, "error": str(e)})
+                    stage.add("escalations", 1)
+                    error = e
+                    continue
+                if completion.usage is not None:
+                    stage.add("prompt_tokens", completion.usage.prompt_tokens)
+                    stage.add("completion_tokens", completion.usage.completion_tokens)
+                message = completion.choices[0].message
+                return message.parsed if response_model is not None else str(message.content)
+            raise error
+
+    async def run_stage(self, stage: list[dict[str, Any]], result: dict[str, Any], emit: Emit = _ignore_event,
+                        evidence: EvidenceStore | None = None, budget: ResearchBudget | None = None) -> None:
+        """
+        Research all sub-questions of one stage and merge the summaries into result.
+
+        Sub-questions run concurrently, at most max_concurrency at a time. Summaries are merged
+        in plan order so the result does not depend on which search finishes first. When the
+        budget runs out, sub-questions still running are cancelled and the finished ones kept.
+        A sub-question that fails otherwise is left out of result, reported with a
+        sub_question_failed event, and does not affect the others.
+
+        Args:
+            stage (list[dict[str, Any]]): Independent plan items.
+            result (dict[str, Any]): Accumulated results, updated in place.
+            emit (Emit, optional): Receives the events of every sub-question.
+            evidence (EvidenceStore, optional): Evidence of the research.
+            budget (ResearchBudget, optional): Budget of the research, unlimited if None.
+
+        Raises:
+            BudgetExhausted: If some sub-questions could not finish within the budget.
+        """
+        previous = dict(result)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(item):
+            async with semaphore:
+                ref_content = self.context_builder.results(previous, item['sub_question'], "keyword", self.router.primary("keyword"))
+                return await self.research_sub_question(item['sub_question'], ref_content, emit, evidence, budget)
+
+        tasks = [asyncio.ensure_future(run(item)) for item in stage]
+        try:
+            await asyncio.wait(tasks, timeout=budget.remaining_seconds() if budget is not None else None)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        exhausted = None
+        for item, task in zip(stage, tasks):
+            if task.cancelled():
+                exhausted = exhausted or BudgetExhausted("deadline")
+            elif isinstance(task.exception(), BudgetExhausted):
+                exhausted = exhausted or task.exception()
+            elif task.exception() is not None:
+                error = task.exception()
+                logger.warning("sub-question failed", exc_info=error, extra={"sub_question": item['sub_question']})
+                emit(ResearchEvent("sub_question_failed", {"sub_question": item['sub_question'], "error": f"{error}"}))
+            else:
+                result[item['sub_question']] = task.result()
+        if exhausted is not None:
+            raise exhausted
+
+    def should_continue(self, result: dict[str, Any], previous_size: int, evidence: EvidenceStore,
+                        budget: ResearchBudget, searchQuery: str) -> tuple[bool, str | None]:
+        """
+        Decide from cheap signals whether a research may need another iteration.
+
+        Args:
+            result (dict[str, Any]): Accumulated results.
+            previous_size (int): Number of results before the iteration.
+            evidence (EvidenceStore): Evidence of the research.
+            budget (ResearchBudget): Budget of the research.
+            searchQuery (str): The research question.
+
+        Returns:
+            tuple: False and the reason when the research should stop without asking the judge,
+                otherwise True and None.
+        """
+        reason = budget.next_iteration_fits()
+        if reason is not None:
+            return False, reason
+        if len(result) == previous_size:
+            return False, "no_progress"
+        if evidence.covers(searchQuery):
+            return False, "covered"
+        return True, None
+
+    def reuse_seed(self, plan: list[dict[str, Any]], seed: dict[str, Any], result: dict[str, Any]) -> list[dict[str, Any]]:
+        """
+        Answer the plan items that a seeding research already answered, from its results.
+
+        Only sub-questions that are near-duplicates of a seeded one (see ResearchCache.same_question)
+        are answered, so the results of a similar but different question are not carried over.
+
+        Args:
+            plan (list[dict[str, Any]]): Plan items from the planner.
+            seed (dict[str, Any]): Results of the seeding research, empty without one.
+            result (dict[str, Any]): Accumulated results, updated in place.
+
+        Returns:
+            list[dict[str, Any]]: The plan items left to research.
+        """
+        if not seed:
+            return plan
+        remaining = []
+        for item in plan:
+            answered = next((sub_question for sub_question in seed
+                             if self.research_cache.same_question(item['sub_question'], sub_question)), None)
+            if answered is None:
+                remaining.append(item)
+            else:
+                result[item['sub_question']] = seed[answered]
+        return remaining
+
+    async def lookup_research(self, query: str, stage: Span) -> ResearchMatch | None:
+        """
+        Look query up in research_cache, recording the similarity of the closest cached research.
+
+        Args:
+            query (str): Research question.
+            stage (Span): The research span, gets the cache mode and similarity.
+
+        Returns:
+            ResearchMatch | None: A hit or seed match, None on a miss or without a cache.
+        """
+        if self.research_cache is None:
+            return None
+        match = await self.research_cache.offload(self.research_cache.lookup, query)
+        mode = match.mode if match is not None else "miss"
+        CACHE_LOOKUPS.inc(cache="research", result=mode)
+        stage.set("cache", mode)
+        if match is None:
+            return None
+        RESEARCH_SIMILARITY.observe(match.similarity)
+        stage.set("similarity", round(match.similarity, 3))
+        if mode == "miss":
+            return None
+        logger.info("similar research cached", extra={"query": query, "cached_query": match.query, "mode": mode,
+                                                      "similarity": round(match.similarity, 3)})
+        return match
+
+    async def research(self, params: DeepResearchParams,
+                       budget_limits: BudgetLimits | None = None) -> AsyncIterator[ResearchEvent]:
+        """
+        Run a research and stream its progress.
+
+        Events from concurrently researched sub-questions are yielded as soon as they happen.
+        The last event is "result" (or "error"), carrying what __call__ would return.
+
+        Args:
+            params (DeepResearchParams): Class instance containing query parameters.
+            budget_limits (BudgetLimits, optional): Limits of this research, defaults to budget_limits.
+
+        Yields:
+            ResearchEvent: Progress events.
+        """
+        queue: asyncio.Queue[ResearchEvent | None] = asyncio.Queue()
+        task = asyncio.create_task(self.run_research(params, queue.put_nowait, budget_limits))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
 
     async def __call__(self, params: DeepResearchParams) -> dict[str, Any] | None:
         """
@@ -157,93 +923,131 @@ class WebSearchTool(ABC):
         Args:
             params (DeepResearchParams): Class instance containing query parameters.
 
+        Returns:
+            dict[str, Any] | None: Query result dictionary, or None for no results. Returns error dictionary if exceptions occur.
+        """
+        return await self.run_research(params)
+
+    async def run_research(self, params: DeepResearchParams, emit: Emit = _ignore_event,
+                           budget_limits: BudgetLimits | None = None) -> dict[str, Any] | None:
+        """
+        Run a research, reporting progress through emit.
+
+        Args:
+            params (DeepResearchParams): Class instance containing query parameters.
+            emit (Emit, optional): Receives the progress events, ending with "result" or "error".
+            budget_limits (BudgetLimits, optional): Limits of this research, defaults to budget_limits.
+
         Returns:
             dict[str, Any] | None: Query result dictionary, or None for no results. Returns error dictionary if exceptions occur.
 
-        The function first performs initial planning by calling GPT-4.1 model to get potential keywords.
+        The function first performs initial planning by calling the planning model to get potential keywords.
         Then it enters an iterative process where each potential keyword is processed - performing Bing search
-        and generating summaries. During iteration, GPT-4.1 model is called to judge if current results
-        sufficiently cover the original question. If not, planning continues and iteration repeats.
-        Maximum iteration count prevents infinite loops. Returns error dictionary if exceptions occur.
-        """
-        searchQuery = params.searchQuery
-  
-        # Initial planning phase
-        potential_keyword = await self.llm([
-            {"role":"system","content": EXPERT_PLANNING_SYSTEM},
-            {"role":"user","content": searchQuery}
-            ], model="gpt-4.1")
-        print(potential_keyword)
-        potential_keyword = ast.literal_eval(re.findall(r'\[\s*{.*?}\s*\]', str(potential_keyword.choices[0].message.content),re.DOTALL)[0])
-        result = {} # Dictionary to store final results
-        max_iterations = 3  # Max iterations to prevent infinite loops
-        iteration = 0  # Iteration count
-        IF_END = False # Flag to determine if finished
-        
-        while iteration < max_iterations and IF_END == False:
+        and generating summaries. Independent sub-questions are researched concurrently (see schedule_plan),
+        dependent ones wait for the stage they depend on. After each iteration cheap signals (budget left for
+        another iteration, progress made, evidence coverage; see should_continue) decide whether the judge model is asked
+        to judge if current results sufficiently cover the original question. If not, planning continues and
+        iteration repeats. The run is bounded by budget_limits (deadline, tokens, LLM calls, iterations); when a
+        limit is hit the results gathered so far are returned. Returns error dictionary if exceptions occur.
+        A cached research of a near-duplicate question (see research_cache) is returned at once; one of a
+        similar question is shown to the planner, and its answers are reused for the sub-questions asked again.
+        """
+        with span("research", query=params.searchQuery) as research_span:
+            searchQuery = params.searchQuery
+            budget = ResearchBudget(budget_limits or self.budget_limits)
+            result = {} # Dictionary to store final results
+
+            # A cached research of the same or a paraphrased question answers it or seeds this one
+            cached = await self.lookup_research(searchQuery, research_span)
+            cache_info, seed = None, {}
+            if cached is not None:
+                cache_info = {"mode": cached.mode, "query": cached.query, "similarity": round(cached.similarity, 3),
+                              "age": round(time.time() - cached.stored_at)}
+                if cached.mode == "hit":
+                    emit(ResearchEvent("result", {"result": cached.result, "evidence": asdict(EvidenceStats()),
+                                                  "budget": budget.report(), "cache": cache_info}))
+                    return cached.result
+                seed = cached.result
+
+            # Initial planning phase
+            if not seed:
+                planning_request = searchQuery
+            else:
+                planning_request = (searchQuery + "\n\nResults of a similar earlier research, plan only what they do not answer: "
+                                    + self.context_builder.results(seed, searchQuery, "plan", self.router.primary("plan")))
+            evidence = EvidenceStore(self.context_builder)  # Searches, pages and passages of this research
+            error = None
+
             try:
-                # Process search results
-                res_index = 0
-                for item in potential_keyword:
-                    if "<|RETHINK AND PLANNING>|" not in item['sub_question']:
-                        # continue
-                        # Combine sub-question with search results to extract keywords from item['sub_question']
-                        temp_keywords = await self.llm([
-                            {"role":"system","content": EXPERT_KEYWORD_SYSTEM.replace("{ref_content}",str(result)).replace("{question}",item['sub_question'])},
-                            {"role":"user","content": item['sub_question']}
-                            ], model="gpt-4.1")
-                        # 从temp_keyword.choices[0].message.content正则出列表
-                        print(temp_keywords.choices[0].message.content)
-                        try:
-                            temp_keywords = list(re.findall(r'\["(.*?)"\]', str(temp_keywords.choices[0].message.content),re.DOTALL))
-                        except:
-                            import sys
-                            print(temp_keywords)
-                            print(sys.exc_info()[-1].tb_lineno)
-                            temp_keywords = [temp_keywords]
-                        for temp_keyword in temp_keywords:
-                            temp_search_result = await self.search_by_bing(temp_keyword, "参考用户问题：["+str(item['sub_question'])+"]\n\n请结合搜索关键词:[{temp_keyword}]\n总结搜索到的网页的内容".replace("{temp_keyword}",temp_keyword))
-                            
-                        temp_summary = await self.llm([
-                            {"role":"system","content": SUMMARY_SYSTEM.replace("{ref_content}", str(temp_search_result))
-                                                    .replace("{question}", item['sub_question'])},
-                            {"role":"user","content": item['sub_question']}
-                            ], model="gpt-4.1")
-                        result[item['sub_question']] = temp_summary.choices[0].message.content
-                        res_index += 1
-                    
+                potential_keyword = await self.call_step("plan", budget, [
+                    {"role":"system","content": EXPERT_PLANNING_SYSTEM},
+                    {"role":"user","content": planning_request}
+                    ], ResearchPlan)
+                potential_keyword = [item.model_dump() for item in potential_keyword.plan]
+                emit(ResearchEvent("plan", {"iteration": 0, "plan": potential_keyword}))
+
+                while True:
+                    budget.start_iteration()
+                    previous_size = len(result)
+                    potential_keyword = self.reuse_seed(potential_keyword, seed, result)
+                    # Process search results stage by stage
+                    stages, need_rethink = self.schedule_plan(potential_keyword)
+                    for stage in stages:
+                        await self.run_stage(stage, result, emit, evidence, budget)
+                    budget.end_iteration()
+
+                    if not need_rethink:
+                        continue_research, budget.stop_reason = self.should_continue(
+                            result, previous_size, evidence, budget, searchQuery)
+                        if not continue_research:
+                            break
+                        # Call LLM to judge if result covers original question
+                        judgement = await self.call_step("judge", budget, [
+                            {"role":"system","content": EXPERT_JUDEGE_SYSTEM.replace("{ref_content}", self.context_builder.results(result, searchQuery, "judge", self.router.primary("judge"))).replace("{question}", str(params.searchQuery))}],
+                            Judgement)
+                        IF_END = judgement.finished
+                        emit(ResearchEvent("judge", {"iteration": budget.iterations - 1, "finished": IF_END}))
+                        if IF_END:
+                            budget.stop_reason = "judge"
+                            break
                     else:
-                        potential_keyword = await self.llm([
-                        {"role":"system","content": EXPERT_PLANNING_SYSTEM},
-                        {"role":"user","content": searchQuery+"\n\nTODO List completed but task not finished, please continue planning: " + str(result)}
-                        ], model="gpt-4.1")
-                        potential_keyword = ast.literal_eval(re.findall(r'\[\s*{.*?}\s*\]', str(potential_keyword.choices[0].message.content),re.DOTALL)[0])
-                        break
-                    
-                # Call LLM to judge if result covers original question
-                temp_if_end = await self.llm([
-                    {"role":"system","content": EXPERT_JUDEGE_SYSTEM.replace("{ref_content}", str(result)).replace("{question}", str(params.searchQuery))}], model="gpt-4.1")
-                IF_END = True if "True" in temp_if_end.choices[0].message.content else False
-                if IF_END == True:
-                    pass
-                else:
-                    potential_keyword = await self.llm([
+                        budget.stop_reason = budget.next_iteration_fits()
+                        if budget.stop_reason is not None:
+                            break
+
+                    potential_keyword = await self.call_step("plan", budget, [
                         {"role":"system","content": EXPERT_PLANNING_SYSTEM},
-                        {"role":"user","content": searchQuery+"\n\nTODO List completed but task not finished, please continue planning: " + str(result)}
-                        ], model="gpt-4.1")
-                    potential_keyword = ast.literal_eval(re.findall(r'\[\s*{.*?}\s*\]', str(potential_keyword.choices[0].message.content),re.DOTALL)[0])
+                        {"role":"user","content": searchQuery+"\n\nTODO List completed but task not finished, please continue planning: " + self.context_builder.results(result, searchQuery, "plan", self.router.primary("plan"))}
+                        ], ResearchPlan)
+                    potential_keyword = [item.model_dump() for item in potential_keyword.plan]
+                    emit(ResearchEvent("plan", {"iteration": budget.iterations, "plan": potential_keyword}))
 
-                
+            except BudgetExhausted as e:
+                # Out of time, tokens or calls: return whatever has been researched so far
+                budget.stop_reason = e.reason
             except Exception as e:
-                # Print error line
-                import sys
-                print(f"Error: {e}\nLine: {sys.exc_info()[-1].tb_lineno}")
-                return {"error": f"{e}"}
-            
-            iteration += 1
+                logger.exception("research failed", extra={"query": searchQuery})
+                if not result:
+                    emit(ResearchEvent("error", {"error": f"{e}"}))
+                    return {"error": f"{e}"}
+                # A failed judge or re-planning call ends the research with what it has found
+                budget.stop_reason, error = "error", f"{e}"
+
+            # Results cut short by the deadline, tokens, LLM calls or an error are not worth reusing
+            if (self.research_cache is not None and result
+                    and budget.stop_reason not in ("deadline", "tokens", "llm_calls", "error")):
+                await self.research_cache.offload(self.research_cache.store, searchQuery, result)
+            report = {"result": result, "evidence": asdict(evidence.stats), "budget": budget.report()}
+            if error is not None:
+                report["error"] = error
+            if cache_info is not None:
+                report["cache"] = cache_info
+            emit(ResearchEvent("result", report))
             return result
-        
+
+
 if __name__ == "__main__":
     import asyncio
+    configure_logging()
     response = asyncio.run(WebSearchTool().__call__(DeepResearchParams(searchQuery="llm加速推理引擎有哪些")))
     print(response)
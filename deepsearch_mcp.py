@@ -1,15 +1,74 @@
-from fastmcp import FastMCP
-from deepsearch import WebSearchTool, DeepResearchParams
+import os
+import json
+import asyncio
+import argparse
+import uvicorn
+from fastmcp import FastMCP, Context
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from deepsearch import WebSearchTool
+from jobs import JobManager, JobRejected
+from LLM import PRIORITY_INTERACTIVE
+from cache import DEFAULT_CACHE_DIR
+from telemetry import SharedMetrics, configure_logging, logger, metrics
 
 # Create MCP server
 mcp = FastMCP("DeepSearch Tools")
 
-# Initialize the search tool once
-search_tool = WebSearchTool()
+# One long-lived search tool per process, shared by all requests so connection pools, caches and
+# rate limits are reused, and the bounded job pool every research, blocking or submitted, runs on.
+# Built on first use (create_app for each worker) rather than at import, after main() has set
+# the environment of the stores they share with the other workers.
+_search_tool: WebSearchTool | None = None
+_jobs: JobManager | None = None
+
+def search_tool() -> WebSearchTool:
+    global _search_tool
+    if _search_tool is None:
+        _search_tool = WebSearchTool()
+    return _search_tool
+
+def jobs() -> JobManager:
+    global _jobs
+    if _jobs is None:
+        _jobs = JobManager(search_tool())
+    return _jobs
+
+metrics.collector("deepsearch_llm_waiting_requests", "LLM requests queued for rate-limit budget, by model",
+                  lambda: {(("model", model),): count for model, count in WebSearchTool.llm.scheduler.waiting().items()})
+metrics.collector("deepsearch_jobs_active", "Research jobs by state",
+                  lambda: {(("state", "queued"),): jobs().queued, (("state", "running"),): jobs().running})
+metrics.collector("deepsearch_cache_events", "Cache events (hits, misses, stale_hits, revalidations, "
+                  "memory_evictions, disk_evictions, coalesced) by cache",
+                  lambda: {(("cache", cache), ("event", event)): count
+                           for cache, stats in search_tool().cache_stats().items() for event, count in stats.as_dict().items()},
+                  kind="counter")
+
+# With several workers, set by create_app: every worker's metrics summed through DEEPSEARCH_METRICS_DB
+shared_metrics: SharedMetrics | None = None
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def prometheus_metrics(request: Request) -> PlainTextResponse:
+    """Prometheus scrape endpoint: stage timings, LLM requests and tokens, cache lookups, fetched bytes."""
+    body = await asyncio.to_thread(shared_metrics.render) if shared_metrics is not None else metrics.render()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+def client_of(ctx: Context) -> str:
+    """Who a request comes from, for sharing the job pool fairly."""
+    return ctx.client_id or ctx.session_id or "anonymous"
+
+def rejection(e: JobRejected) -> dict:
+    return {"error": e.reason, "retry_after": e.retry_after}
 
 @mcp.tool(name="web_deep_search",description="Perform a comprehensive web research on the given query.",timeout=60)
-async def web_deep_search(query: str) -> dict:
+async def web_deep_search(query: str, ctx: Context) -> dict:
     """Perform a comprehensive web research on the given query.
+
+    Progress (plan, sub-questions started, sources, partial summaries, judge verdicts) is
+    streamed to the client as progress notifications and log messages while the research runs.
+    Researches that may take longer than the timeout should use submit_research instead.
+    The research budget counts from the call, so time spent waiting for a worker is taken out
+    of it; the call is rejected up front when the expected wait alone would exceed it.
     
     Args:
         query: The research question or topic to investigate
@@ -17,9 +76,78 @@ async def web_deep_search(query: str) -> dict:
     Returns:
         Dictionary containing research results organized by sub-questions
     """
-    response = await WebSearchTool().__call__(DeepResearchParams(searchQuery=query))
+    try:
+        # The caller is waiting: its LLM calls go ahead of submitted researches
+        job = jobs().submit(query, client_of(ctx), priority=PRIORITY_INTERACTIVE,
+                            timeout=search_tool().budget_limits.deadline)
+    except JobRejected as e:
+        return rejection(e)
+    try:
+        async for event in jobs().events(job):
+            if event.type in ("result", "error"):
+                continue
+            await ctx.report_progress(job.done, job.total or None)
+            await ctx.info(json.dumps(event.as_dict(), ensure_ascii=False))
+    except BaseException:
+        # The client went away or the call timed out: stop the research too
+        jobs().cancel(job.id)
+        raise
+
+    if job.status == "done":
+        return job.result
+    return {"error": job.error or job.status}
+
+@mcp.tool(name="submit_research", description="Start a web research in the background and return its job id.")
+async def submit_research(query: str, ctx: Context) -> dict:
+    """Queue a research without waiting for it; poll research_status and fetch research_result.
+
+    Args:
+        query: The research question or topic to investigate
+
+    Returns:
+        The job id and status, or an error with retry_after seconds if the server is busy
+    """
+    try:
+        job = jobs().submit(query, client_of(ctx))
+    except JobRejected as e:
+        return rejection(e)
+    return jobs().status(job.id)
+
+@mcp.tool(name="research_status", description="Status, progress and queue position of a submitted research.")
+async def research_status(job_id: str) -> dict:
+    """Status of a submitted research.
 
-    return response
+    Args:
+        job_id: Id returned by submit_research
+
+    Returns:
+        Status (queued, running, done, failed, cancelled), progress, recent events and queue position
+    """
+    return jobs().status(job_id) or {"error": f"unknown job {job_id}"}
+
+@mcp.tool(name="research_result", description="Result of a submitted research, or its status while it runs.")
+async def research_result(job_id: str) -> dict:
+    """Result of a submitted research.
+
+    Args:
+        job_id: Id returned by submit_research
+
+    Returns:
+        The status with the research results organized by sub-questions once done
+    """
+    return jobs().status(job_id, with_result=True) or {"error": f"unknown job {job_id}"}
+
+@mcp.tool(name="cancel_research", description="Cancel a submitted research.")
+async def cancel_research(job_id: str) -> dict:
+    """Cancel a queued or running research, stopping its LLM calls and page fetches.
+
+    Args:
+        job_id: Id returned by submit_research
+
+    Returns:
+        Whether the job was cancelled
+    """
+    return {"job_id": job_id, "cancelled": jobs().cancel(job_id)}
 
 @mcp.resource("content://{url}")
 async def get_web_content(url: str) -> str:
@@ -31,9 +159,50 @@ async def get_web_content(url: str) -> str:
     Returns:
         Extracted text content
     """
-    return search_tool.extract_url_content(url)
+    return await search_tool().extract_url_content(url)
+
+
+def create_app():
+    """
+    ASGI app of one worker process, for uvicorn's factory mode.
+
+    A single worker serves the SSE transport. SSE sessions live in the process that opened
+    them, so several workers serve the stateless streamable HTTP transport at /mcp instead,
+    where any worker can answer any request.
+    """
+    global shared_metrics
+    configure_logging()
+    jobs()  # this worker's search tool and job pool, with the environment main() set
+    if int(os.environ.get("DEEPSEARCH_WORKERS", "1")) > 1:
+        if os.environ.get("DEEPSEARCH_METRICS_DB") and shared_metrics is None:
+            shared_metrics = SharedMetrics(metrics, os.environ["DEEPSEARCH_METRICS_DB"],
+                                           float(os.environ.get("DEEPSEARCH_METRICS_INTERVAL", "5")))
+            shared_metrics.start()
+        return mcp.http_app(transport="http", stateless_http=True)
+    return mcp.http_app(transport="sse")
+
+def main():
+    parser = argparse.ArgumentParser(description="DeepSearch MCP server")
+    parser.add_argument("--host", default=os.environ.get("DEEPSEARCH_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("DEEPSEARCH_PORT", "8080")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("DEEPSEARCH_WORKERS", "1")),
+                        help="worker processes, e.g. one per core")
+    args = parser.parse_args()
+    configure_logging()
+    if args.workers <= 1:
+        mcp.run(transport="sse", host=args.host, port=args.port)
+        # mcp.run(transport="stdio")
+        return
 
+    # Inherited by the workers: their caches already share the SQLite files under
+    # DEEPSEARCH_CACHE_DIR, their LLM rate limits, research jobs and metrics share these stores
+    os.environ["DEEPSEARCH_WORKERS"] = str(args.workers)
+    os.environ.setdefault("LLM_RATE_LIMIT_DB", os.path.join(DEFAULT_CACHE_DIR, "ratelimits.sqlite"))
+    os.environ.setdefault("DEEPSEARCH_JOB_DB", os.path.join(DEFAULT_CACHE_DIR, "jobs.sqlite"))
+    os.environ.setdefault("DEEPSEARCH_METRICS_DB", os.path.join(DEFAULT_CACHE_DIR, "metrics.sqlite"))
+    SharedMetrics.reset(os.environ["DEEPSEARCH_METRICS_DB"])
+    logger.info("starting workers", extra={"workers": args.workers, "transport": "http", "port": args.port})
+    uvicorn.run("deepsearch_mcp:create_app", factory=True, host=args.host, port=args.port, workers=args.workers)
 
 if __name__ == "__main__":
-    mcp.run(transport="sse", host="0.0.0.0", port=8080)
-    # mcp.run(transport="stdio") 
+    main()
@@ -0,0 +1,161 @@
+import re
+from typing import Optional
+
+try:
+    from lxml import html as lxml_html
+    HTML_PARSER = "lxml"
+except ImportError:  # lxml is several times faster, but BeautifulSoup's html.parser always works
+    lxml_html = None
+    HTML_PARSER = "html.parser"
+
+try:
+    from charset_normalizer import from_bytes
+except ImportError:
+    from_bytes = None
+
+BOILERPLATE_TAGS = ["script", "style", "noscript", "template", "svg", "canvas", "iframe", "form",
+                    "button", "select", "nav", "header", "footer", "aside"]
+CONTAINER_TAGS = ["div", "section", "ul", "ol", "table"]
+MAIN_CONTENT_TAGS = ["article", "main"]
+BLOCK_TAGS = {"p", "div", "section", "article", "main", "li", "ul", "ol", "table", "tr", "td", "th", "pre",
+              "blockquote", "h1", "h2", "h3", "h4", "h5", "h6", "dd", "dt", "br", "hr", "figcaption"}
+# A container whose text is mostly link text is a menu, tag cloud or link list
+MAX_LINK_DENSITY = 0.6
+# article/main is only trusted when it holds at least this share of the page text
+MIN_MAIN_SHARE = 0.25
+
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+_SPACES = re.compile(r"[ \t\r\f\v\xa0\u3000]+")
+# lxml refuses str input that starts with an XML declaration naming an encoding
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+def decode_body(body: bytes, charset: Optional[str] = None) -> str:
+    """
+    Decode a page body.
+
+    The charset from the Content-Type header wins, then a <meta charset> declaration, then
+    UTF-8, then charset_normalizer detection when installed.
+
+    Args:
+        body (bytes): Raw page body.
+        charset (str, optional): Charset from the Content-Type header.
+
+    Returns:
+        str: Decoded text, undecodable bytes replaced.
+    """
+    candidates = [charset]
+    match = _META_CHARSET.search(body[:4096])
+    if match:
+        candidates.append(match.group(1).decode("ascii", "ignore"))
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return body.decode(candidate)
+        except (LookupError, UnicodeDecodeError):
+            continue
+    try:
+        return body.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    if from_bytes is not None:
+        best = from_bytes(body).best()
+        if best is not None:
+            return str(best)
+    return body.decode("utf-8", errors="replace")
+
+def _link_density(tag) -> float:
+    text_length = len(tag.get_text(strip=True))
+    if text_length == 0:
+        return 0.0
+    link_length = sum(len(link.get_text(strip=True)) for link in tag.find_all("a"))
+    return link_length / text_length
+
+def _lines(text: str) -> str:
+    lines, previous = [], None
+    for line in text.splitlines():
+        line = _SPACES.sub(" ", line).strip()
+        if line and line != previous:
+            lines.append(line)
+            previous = line
+    return "\n".join(lines)
+
+def _html_to_text_lxml(html: str) -> Optional[str]:
+    try:
+        doc = lxml_html.document_fromstring(_XML_DECLARATION.sub("", html, count=1))
+    except Exception:  # lxml rejects empty documents and some malformed ones
+        return None
+    for tag in list(doc.iter(*BOILERPLATE_TAGS)):
+        tag.drop_tree()
+    root = doc.find("body")
+    if root is None:
+        root = doc
+
+    # One bottom-up pass: text and link-text length of every element
+    text_length, link_length = {}, {}
+    for tag in reversed(list(root.iter())):
+        if not isinstance(tag.tag, str):
+            continue
+        length = len((tag.text or "").strip())
+        links = 0
+        for child in tag:
+            length += text_length.get(child, 0) + len((child.tail or "").strip())
+            links += link_length.get(child, 0)
+        text_length[tag] = length
+        link_length[tag] = length if tag.tag == "a" else links
+
+    total = text_length.get(root, 0)
+    candidates = [tag for tag in root.iter(*MAIN_CONTENT_TAGS)]
+    if candidates:
+        main = max(candidates, key=lambda tag: text_length[tag])
+        if total and text_length[main] / total >= MIN_MAIN_SHARE:
+            root = main
+
+    for tag in list(root.iter(*CONTAINER_TAGS)):
+        if tag is not root and text_length[tag] and link_length[tag] / text_length[tag] > MAX_LINK_DENSITY:
+            tag.drop_tree()
+    for tag in root.iter(*BLOCK_TAGS):
+        tag.tail = "\n" + (tag.tail or "")
+        tag.text = "\n" + (tag.text or "")
+    return _lines(root.text_content())
+
+def html_to_text(html: str) -> str:
+    """
+    Extract the main text of an HTML page.
+
+    Scripts, styles, navigation, headers, footers and forms are dropped, as are containers
+    that consist mostly of links. When an <article> or <main> element holds a fair share of
+    the remaining text only that element is kept. Parsed with lxml when it is installed,
+    otherwise, or when lxml cannot parse the page, with BeautifulSoup's html.parser.
+
+    Args:
+        html (str): Page markup.
+
+    Returns:
+        str: Main text, one block per line with whitespace collapsed.
+    """
+    if HTML_PARSER == "lxml":
+        text = _html_to_text_lxml(html)
+        if text is not None:
+            return text
+    return _html_to_text_soup(html)
+
+def _html_to_text_soup(html: str) -> str:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup.find_all(BOILERPLATE_TAGS):
+        tag.decompose()
+    root = soup.body or soup
+
+    for tag in root.find_all(CONTAINER_TAGS):
+        if not getattr(tag, "decomposed", False) and _link_density(tag) > MAX_LINK_DENSITY:
+            tag.decompose()
+
+    total = len(root.get_text(strip=True))
+    candidates = [(len(tag.get_text(strip=True)), tag) for tag in root.find_all(MAIN_CONTENT_TAGS)]
+    if candidates:
+        length, main = max(candidates, key=lambda candidate: candidate[0])
+        if total and length / total >= MIN_MAIN_SHARE:
+            root = main
+
+    return _lines(root.get_text("\n"))
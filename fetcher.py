@@ -0,0 +1,175 @@
+import asyncio
+import httpx
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+from extract import decode_body
+
+DEFAULT_CONTENT_TYPES = ("text/html", "text/plain", "application/xhtml+xml")
+DEFAULT_USER_AGENT = "Mozilla/5.0 (compatible; Agentic-DeepSearch/1.0)"
+
+@dataclass
+class FetchResult:
+    """Result of fetching one page."""
+    url: str
+    status_code: int = 0
+    content_type: str = ""
+    text: str = ""
+    truncated: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    error: Optional[str] = None
+    bytes_downloaded: int = 0  # on the wire, before decompression
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status_code == 200
+
+class PageFetcher:
+    """
+    Async page fetcher sharing one connection pool across all requests.
+
+    Every fetch is bounded: connect/read timeouts plus an overall deadline, a per-host concurrency
+    limit, a redirect limit, a content-type allow-list checked before the body is read, and a body
+    size cap after which the stream is cut off. Failures are reported on the FetchResult instead of
+    raised, so one bad site never aborts a research run.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 10.0,
+        total_timeout: float = 20.0,
+        max_bytes: int = 2_000_000,
+        max_redirects: int = 5,
+        per_host_limit: int = 4,
+        max_connections: int = 64,
+        allowed_content_types: tuple[str, ...] = DEFAULT_CONTENT_TYPES,
+        user_agent: str = DEFAULT_USER_AGENT,
+    ):
+        """
+        Args:
+            connect_timeout (float): Seconds to establish a connection.
+            read_timeout (float): Seconds to wait for each chunk of the body.
+            total_timeout (float): Overall deadline for one fetch, including redirects.
+            max_bytes (int): Body size after which the download is cut off.
+            max_redirects (int): Max redirects followed per fetch.
+            per_host_limit (int): Max concurrent fetches against one host.
+            max_connections (int): Size of the shared connection pool.
+            allowed_content_types (tuple[str, ...]): Content types worth downloading.
+            user_agent (str): User-Agent header sent with every request.
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_bytes = max_bytes
+        self.max_redirects = max_redirects
+        self.per_host_limit = per_host_limit
+        self.max_connections = max_connections
+        self.allowed_content_types = allowed_content_types
+        self.user_agent = user_agent
+        self._client: Optional[httpx.AsyncClient] = None
+        self._hosts: dict[str, list] = {}  # host -> [semaphore, fetches using it]
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared connection pool, created on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                follow_redirects=True,
+                max_redirects=self.max_redirects,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections // 2,
+                ),
+                headers={"User-Agent": self.user_agent},
+            )
+        return self._client
+
+    def _content_type_allowed(self, content_type: str) -> bool:
+        if not content_type:
+            return True
+        mime = content_type.split(";")[0].strip().lower()
+        return mime in self.allowed_content_types
+
+    async def fetch(self, url: str, headers: Optional[dict[str, str]] = None) -> FetchResult:
+        """
+        Fetch one page.
+
+        Args:
+            url (str): Page URL.
+            headers (dict[str, str], optional): Extra request headers, e.g. conditional headers.
+
+        Returns:
+            FetchResult: The decoded page, or a result with error set.
+        """
+        try:
+            # The deadline includes waiting for the host's concurrency limit
+            return await asyncio.wait_for(self._fetch_limited(url, headers), timeout=self.total_timeout)
+        except asyncio.TimeoutError:
+            return FetchResult(url=url, error=f"timed out after {self.total_timeout}s")
+        except httpx.HTTPError as e:
+            return FetchResult(url=url, error=f"{type(e).__name__}: {e}")
+
+    async def _fetch_limited(self, url: str, headers: Optional[dict[str, str]]) -> FetchResult:
+        """Fetch under the per-host limit; a host's semaphore is dropped once no fetch uses it."""
+        host = urlsplit(url).netloc.lower()
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = self._hosts[host] = [asyncio.Semaphore(self.per_host_limit), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self._fetch(url, headers)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self._hosts.get(host) is entry:
+                del self._hosts[host]
+
+    async def _fetch(self, url: str, headers: Optional[dict[str, str]]) -> FetchResult:
+        async with self.client.stream("GET", url, headers=headers) as response:
+            result = FetchResult(
+                url=str(response.url),
+                status_code=response.status_code,
+                content_type=response.headers.get("content-type", ""),
+                etag=response.headers.get("etag"),
+                last_modified=response.headers.get("last-modified"),
+            )
+            if response.status_code != 200:
+                if response.status_code != 304:
+                    result.error = f"HTTP {response.status_code}"
+                return result
+            if not self._content_type_allowed(result.content_type):
+                result.error = f"unsupported content type {result.content_type}"
+                return result
+
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) >= self.max_bytes:
+                    del body[self.max_bytes:]
+                    result.truncated = True
+                    break
+            result.bytes_downloaded = response.num_bytes_downloaded
+            result.text = decode_body(bytes(body), response.charset_encoding)
+            return result
+
+    async def fetch_many(self, urls: list[str]) -> list[FetchResult]:
+        """
+        Fetch several pages concurrently.
+
+        Args:
+            urls (list[str]): Page URLs.
+
+        Returns:
+            list[FetchResult]: Results in the order of urls.
+        """
+        return list(await asyncio.gather(*(self.fetch(url) for url in urls)))
+
+    async def aclose(self):
+        """Close the shared connection pool."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,479 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, replace
+from typing import Any, AsyncIterator, Optional
+
+from deepsearch import WebSearchTool, DeepResearchParams, ResearchEvent
+from LLM import PRIORITY_BACKGROUND, request_priority
+from telemetry import logger, metrics
+
+FINISHED = ("done", "failed", "cancelled")
+# Events kept per job for status replies
+RECENT_EVENTS = 10
+
+JOBS = metrics.counter("deepsearch_jobs", "Research jobs by final state, including rejected submissions")
+JOB_QUEUE_SECONDS = metrics.histogram("deepsearch_job_queue_seconds", "Time research jobs waited in the queue")
+
+class JobRejected(Exception):
+    """Raised by JobManager.submit when the queue is too deep to take another job."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+@dataclass
+class Job:
+    """A research submitted to a JobManager."""
+    id: str
+    query: str
+    client: str
+    status: str = "queued"  # queued, running, done, failed or cancelled
+    priority: int = PRIORITY_BACKGROUND  # of its LLM calls
+    submitted: float = field(default_factory=time.time)
+    deadline: Optional[float] = None  # time its research has to end by, counted from submission
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    done: int = 0           # sub-questions summarized
+    total: int = 0          # sub-questions planned
+    events: list[dict[str, Any]] = field(default_factory=list)
+    result: Any = None
+    error: Optional[str] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+    listeners: list[asyncio.Queue] = field(default_factory=list, repr=False)
+
+    def as_dict(self, with_result: bool = False) -> dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "query": self.query,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "progress": {"done": self.done, "total": self.total},
+            "events": self.events,
+        }
+        if self.error is not None:
+            data["error"] = self.error
+        if with_result:
+            data["result"] = self.result
+        return data
+
+class JobStore:
+    """
+    Job states in a SQLite file shared by the worker processes of a server, so that any worker
+    can report on a job and pass on its cancellation to the worker running it.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): SQLite file, the same for every worker.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, status TEXT NOT NULL, "
+            "cancel INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL)"
+        )
+
+    @staticmethod
+    def row(job: Job) -> tuple[str, str, str, float]:
+        """The stored state of job, taken now so it can be written later from another thread."""
+        return job.id, json.dumps(job.as_dict(with_result=True), ensure_ascii=False, default=str), job.status, time.time()
+
+    def save(self, job: Job):
+        self.save_rows([self.row(job)])
+
+    def save_rows(self, rows: list[tuple[str, str, str, float]]):
+        """Write the job states taken with row in one transaction."""
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO jobs (id, data, status, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET data = excluded.data, status = excluded.status, updated = excluded.updated",
+                    rows)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load(self, job_id: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def request_cancel(self, job_id: str) -> bool:
+        """Flag an unfinished job for cancellation; False if it is unknown or already finished."""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET cancel = 1 WHERE id = ? AND status NOT IN ({','.join('?' * len(FINISHED))})",
+                (job_id, *FINISHED))
+        return cursor.rowcount == 1
+
+    def cancel_requested(self, job_ids: list[str]) -> list[str]:
+        """Those of job_ids flagged for cancellation."""
+        if not job_ids:
+            return []
+        with self._lock:
+            rows = self._conn.execute(f"SELECT id FROM jobs WHERE cancel = 1 AND id IN ({','.join('?' * len(job_ids))})",
+                                      job_ids).fetchall()
+        return [row[0] for row in rows]
+
+    def purge(self, before: float):
+        """Drop finished jobs last updated before the given time."""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM jobs WHERE updated < ? AND status IN ({','.join('?' * len(FINISHED))})",
+                               (before, *FINISHED))
+
+    def close(self):
+        self._conn.close()
+
+class JobManager:
+    """
+    Runs researches as jobs on a bounded pool of workers.
+
+    Submitted jobs wait in one queue per client; idle workers take the next job from the
+    clients in turn, so a client submitting a burst does not hold up the others. Submissions
+    are rejected with JobRejected once the queue, or the client's share of it, is full. Jobs
+    run their LLM calls at the priority they were submitted with, background by default; a job
+    with a timeout has its research deadline counted from submission.
+    Cancelling a running job cancels its research task and, with it, the LLM calls and page
+    fetches it is waiting for. Finished jobs are kept for retention seconds.
+    Job states are written to the store from a thread, off the event loop: state changes right
+    away, progress at most every save_interval seconds.
+    """
+
+    def __init__(self, tool: WebSearchTool, workers: int | None = None, max_queue: int | None = None,
+                 max_queued_per_client: int | None = None, retention: float | None = None,
+                 store: JobStore | None = None, save_interval: float = 1.0):
+        """
+        Args:
+            tool (WebSearchTool): Runs the researches.
+            workers (int | None): Researches run at once, defaults to DEEPSEARCH_JOB_WORKERS or 4.
+            max_queue (int | None): Jobs waiting at most, defaults to DEEPSEARCH_JOB_QUEUE or 32.
+            max_queued_per_client (int | None): Jobs one client may have waiting, defaults to
+                DEEPSEARCH_JOB_CLIENT_QUEUE or 8.
+            retention (float | None): Seconds finished jobs can still be queried, defaults to
+                DEEPSEARCH_JOB_RETENTION or 3600.
+            store (JobStore | None): Job states shared with other processes, defaults to a
+                JobStore at DEEPSEARCH_JOB_DB if set, else jobs are only known to this process.
+            save_interval (float): Seconds progress of running jobs may go unsaved in the store.
+        """
+        self.tool = tool
+        self.workers = workers or int(os.environ.get("DEEPSEARCH_JOB_WORKERS", "4"))
+        self.max_queue = max_queue or int(os.environ.get("DEEPSEARCH_JOB_QUEUE", "32"))
+        self.max_queued_per_client = max_queued_per_client or int(os.environ.get("DEEPSEARCH_JOB_CLIENT_QUEUE", "8"))
+        self.retention = retention or float(os.environ.get("DEEPSEARCH_JOB_RETENTION", "3600"))
+        if store is None and os.environ.get("DEEPSEARCH_JOB_DB"):
+            store = JobStore(os.environ["DEEPSEARCH_JOB_DB"])
+        self.store = store
+        self.save_interval = save_interval
+        self.jobs: dict[str, Job] = {}
+        self.running = 0
+        self._queues: OrderedDict[str, deque[Job]] = OrderedDict()  # per client, in serving order
+        self._ready: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: list[asyncio.Task] = []
+        self._unsaved: dict[str, Job] = {}  # jobs whose state the store is behind on
+        self._purge_before: Optional[float] = None
+        self._save_now: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._average_seconds = 60.0  # of finished researches, for retry_after estimates
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _start(self):
+        """Start the workers on the current event loop (again, if the manager moved to another loop)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._ready = asyncio.Condition()
+        self._save_now = asyncio.Event()
+        self._writer = None
+        self._queues.clear()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.store is not None:
+            self._tasks.append(asyncio.create_task(self._watch_cancellations()))
+
+    async def aclose(self):
+        """Cancel every job and stop the workers."""
+        for job in list(self.jobs.values()):
+            self.cancel(job.id)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._writer is not None:
+            self._save_now.set()
+            await self._writer
+        self._tasks, self._loop = [], None
+
+    def submit(self, query: str, client: str = "anonymous", priority: int = PRIORITY_BACKGROUND,
+               timeout: Optional[float] = None) -> Job:
+        """
+        Queue a research.
+
+        Args:
+            query (str): Research question.
+            client (str): Who submitted it, for sharing the workers fairly between clients.
+            priority (int): Priority of its LLM calls, PRIORITY_INTERACTIVE for a caller waiting on it.
+            timeout (float, optional): Seconds from now the research has to end within, queue wait
+                included; its deadline budget is cut to what is left when it starts.
+
+        Returns:
+            Job: The queued job.
+
+        Raises:
+            JobRejected: If the queue or the client's share of it is full, or the expected queue
+                wait exceeds timeout.
+        """
+        self._start()
+        self._purge()
+        queued = self.queued
+        retry_after = round(self._average_seconds * (queued // self.workers + 1))
+        if queued >= self.max_queue:
+            JOBS.inc(state="rejected")
+            raise JobRejected(f"server busy: {queued} researches waiting", retry_after)
+        if len(self._queues.get(client, ())) >= self.max_queued_per_client:
+            JOBS.inc(state="rejected")
+            raise JobRejected(f"too many researches waiting for this client ({self.max_queued_per_client})", retry_after)
+        if timeout is not None and self.expected_wait() >= timeout:
+            JOBS.inc(state="rejected")
+            raise JobRejected(f"server busy: expected wait exceeds the {timeout:g}s timeout", retry_after)
+
+        job = Job(id=uuid.uuid4().hex, query=query, client=client, priority=priority)
+        if timeout is not None:
+            job.deadline = job.submitted + timeout
+        self.jobs[job.id] = job
+        self._queues.setdefault(client, deque()).append(job)
+        self._save(job)
+        self._notify()
+        logger.info("research job queued", extra={"job": job.id, "client": client, "queued": queued + 1})
+        return job
+
+    def expected_wait(self) -> float:
+        """Seconds a job submitted now is expected to wait before a worker takes it."""
+        ahead = self.queued + self.running - self.workers + 1
+        if ahead <= 0:
+            return 0.0
+        return self._average_seconds * -(-ahead // self.workers)
+
+    def _notify(self):
+        async def notify():
+            async with self._ready:
+                self._ready.notify_all()
+        self._loop.create_task(notify())
+
+    def _next_job(self) -> Job:
+        """Take the first job of the next client in turn."""
+        client, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        del self._queues[client]
+        if queue:
+            self._queues[client] = queue  # back of the line
+        return job
+
+    def position(self, job: Job) -> Optional[int]:
+        """Jobs started before job if no other is submitted, None unless it is queued."""
+        queue = self._queues.get(job.client)
+        if job.status != "queued" or queue is None or job not in queue:
+            return None
+        index = queue.index(job)
+        # Each client ahead in turn starts up to index + 1 jobs before it, those behind up to index
+        ahead, before = index, True
+        for client, other in self._queues.items():
+            if client == job.client:
+                before = False
+                continue
+            ahead += min(len(other), index + 1 if before else index)
+        return ahead
+
+    async def _worker(self):
+        while True:
+            async with self._ready:
+                while not self._queues:
+                    await self._ready.wait()
+                job = self._next_job()
+            await self._run(job)
+
+    async def _run(self, job: Job):
+        if job.status in FINISHED:  # cancelled while being taken off the queue
+            return
+        if job.deadline is not None and time.time() >= job.deadline:
+            job.error = "timed out waiting in the queue"
+            self._finish(job)
+            return
+        job.status, job.started = "running", time.time()
+        JOB_QUEUE_SECONDS.observe(job.started - job.submitted)
+        self._save(job)
+        self.running += 1
+        # The research task inherits the priority of its LLM calls from this context
+        request_priority.set(job.priority)
+        job.task = asyncio.create_task(self._research(job))
+        try:
+            # wait() rather than await, so cancelling the job does not cancel the worker
+            await asyncio.wait({job.task})
+        except asyncio.CancelledError:
+            job.task.cancel()
+            raise
+        finally:
+            self.running -= 1
+            self._finish(job)
+
+    async def _research(self, job: Job):
+        limits = self.tool.budget_limits
+        if job.deadline is not None:
+            limits = replace(limits, deadline=min(limits.deadline, job.deadline - time.time()))
+        async for event in self.tool.research(DeepResearchParams(searchQuery=job.query), limits):
+            if event.type == "plan":
+                job.total += len(event.data["plan"])
+            elif event.type == "summary":
+                job.done += 1
+            elif event.type == "result":
+                job.result = event.data["result"]
+            elif event.type == "error":
+                job.error = event.data["error"]
+            job.events = (job.events + [event.as_dict()])[-RECENT_EVENTS:]
+            self._save(job, progress=True)
+            for listener in job.listeners:
+                listener.put_nowait(event)
+
+    def _finish(self, job: Job):
+        if job.status in FINISHED:
+            return
+        if job.task is None and job.error is not None:  # never started
+            job.status = "failed"
+        elif job.task is None or not job.task.done() or job.task.cancelled():
+            job.status = "cancelled"
+        elif job.task.exception() is not None or job.error is not None:
+            job.status = "failed"
+            job.error = job.error or str(job.task.exception())
+        else:
+            job.status = "done"
+        job.finished = time.time()
+        if job.started is not None and job.status == "done":
+            self._average_seconds = 0.8 * self._average_seconds + 0.2 * (job.finished - job.started)
+        JOBS.inc(state=job.status)
+        self._save(job)
+        for listener in job.listeners:
+            listener.put_nowait(None)
+        logger.info("research job finished", extra={"job": job.id, "status": job.status,
+                                                    "seconds": round(job.finished - job.submitted, 3)})
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job.
+
+        Args:
+            job_id (str): Job to cancel.
+
+        Returns:
+            bool: False if the job is unknown or already finished.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return self.store is not None and self.store.request_cancel(job_id)
+        if job.status in FINISHED:
+            return False
+        if job.status == "queued":
+            queue = self._queues.get(job.client)
+            if queue is not None and job in queue:
+                queue.remove(job)
+                if not queue:
+                    del self._queues[job.client]
+            self._finish(job)
+        elif job.task is not None:
+            job.task.cancel()
+        return True
+
+    async def _watch_cancellations(self, interval: float = 1.0):
+        """Cancel jobs of this process that another process was asked to cancel."""
+        while True:
+            await asyncio.sleep(interval)
+            unfinished = [job.id for job in self.jobs.values() if job.status not in FINISHED]
+            for job_id in await asyncio.to_thread(self.store.cancel_requested, unfinished):
+                self.cancel(job_id)
+
+    def status(self, job_id: str, with_result: bool = False) -> Optional[dict[str, Any]]:
+        """
+        Args:
+            job_id (str): Job to report on.
+            with_result (bool): Include the result of a finished job.
+
+        Returns:
+            dict[str, Any] | None: Status, progress, recent events and queue position of the job,
+                None if it is unknown.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return self.store.load(job_id) if self.store is not None else None
+        data = job.as_dict(with_result=with_result)
+        if job.status == "queued":
+            data["position"] = self.position(job)
+        return data
+
+    async def events(self, job: Job) -> AsyncIterator[ResearchEvent]:
+        """Progress events of job from now on, until it finishes."""
+        if job.status in FINISHED:
+            return
+        listener: asyncio.Queue[ResearchEvent | None] = asyncio.Queue()
+        job.listeners.append(listener)
+        try:
+            while (event := await listener.get()) is not None:
+                yield event
+        finally:
+            job.listeners.remove(listener)
+
+    def _save(self, job: Job, progress: bool = False):
+        """Have the writer store job, right away unless only its progress changed."""
+        if self.store is None:
+            return
+        self._unsaved[job.id] = job
+        self._schedule_write(now=not progress)
+
+    def _schedule_write(self, now: bool):
+        if now:
+            self._save_now.set()
+        if self._writer is None or self._writer.done():
+            self._writer = self._loop.create_task(self._write())
+
+    async def _write(self):
+        """Write the unsaved job states and purges to the store in a thread until none are left."""
+        while self._unsaved or self._purge_before is not None:
+            if not self._save_now.is_set():
+                try:
+                    await asyncio.wait_for(self._save_now.wait(), self.save_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._save_now.clear()
+            rows = [JobStore.row(job) for job in self._unsaved.values()]
+            before, self._unsaved, self._purge_before = self._purge_before, {}, None
+            try:
+                await asyncio.to_thread(self.store.save_rows, rows)
+                if before is not None:
+                    await asyncio.to_thread(self.store.purge, before)
+            except sqlite3.Error:
+                logger.exception("saving research jobs failed")
+
+    def _purge(self):
+        before = time.time() - self.retention
+        for job_id in [job.id for job in self.jobs.values() if job.status in FINISHED and job.finished < before]:
+            del self.jobs[job_id]
+        if self.store is not None:
+            self._purge_before = before
+            self._schedule_write(now=True)
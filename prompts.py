@@ -31,6 +31,20 @@ Annotation:
 ```
 """
 
+# Prompt for condensing one group of web pages before the summary (map step of map-reduce summarization)
+CONDENSE_SYSTEM = """
+Process the following input information:
+1. {ref_content}
+2. Question: {question}
+
+##**Requirements**
+- Extract every fact, figure, date and name from the webpages that helps answer the question; leave out everything else.
+- Keep each fact with the title and URL of the webpage it comes from (e.g. "- fact ([webpage title](URL))").
+- Do not answer the question and do not combine facts from different webpages; another step merges them.
+- If no webpage is relevant to the question, output "No relevant information."
+- Be concise: short bullet points, no introduction or conclusion.
+"""
+
 # Prompt for expert planning
 EXPERT_PLANNING_SYSTEM = """
 ### 🧠 Role Description: Task Planning Agent  
@@ -55,15 +69,16 @@ You are a **Task Planning Agent**, specializing in **task decomposition and sear
 
 ### ✅ Output Format Requirements  
 
-Output should be a unified JSON array, with each task item containing the following fields:
+Output should be a JSON object whose "plan" field is the TODO List, with each task item containing the following fields:
 
 ```json
-[
+{"plan": [
   {
     "step": "Task step number (e.g. 1, 2, 3...)",
     "sub_question": "Task description explaining what needs to be retrieved from the web",
+    "depends_on": ["Optional: step numbers whose results this step needs, omit if the step is independent"]
   }
-]
+]}
 ```
 
 ---
@@ -82,24 +97,24 @@ Output should be a unified JSON array, with each task item containing the follow
 
 **Output**:
 ```json
-[
+{"plan": [
   {
     "step": "1",
-    "sub_question": "Find and summarize Gemini AI's basic features and product positioning",
+    "sub_question": "Find and summarize Gemini AI's basic features and product positioning"
   },
   {
     "step": "2",
-    "sub_question": "Find and summarize Gemini AI usage tutorials or official guides",
+    "sub_question": "Find and summarize Gemini AI usage tutorials or official guides"
   },
   {
     "step": "3",
-    "sub_question": "Find and summarize Gemini AI's practical application scenarios",
+    "sub_question": "Find and summarize Gemini AI's practical application scenarios"
   },
   {
     "step": "4",
-    "sub_question": "Find and summarize Gemini AI's common issues and user feedback",
+    "sub_question": "Find and summarize Gemini AI's common issues and user feedback"
   }
-]
+]}
 ```
 
 ---
@@ -114,24 +129,24 @@ Output should be a unified JSON array, with each task item containing the follow
 
 **Output**:
 ```json
-[
+{"plan": [
   {
     "step": "1",
-    "sub_question": "Obtain and summarize Geekbang Technology's company background and founding date",
+    "sub_question": "Obtain and summarize Geekbang Technology's company background and founding date"
   },
   {
     "step": "2",
-    "sub_question": "Obtain and summarize Geekbang Technology's main business and core products",
+    "sub_question": "Obtain and summarize Geekbang Technology's main business and core products"
   },
   {
     "step": "3",
-    "sub_question": "Find and summarize the company's role in tech communities or developer ecosystems",
+    "sub_question": "Find and summarize the company's role in tech communities or developer ecosystems"
   },
   {
     "step": "4",
-    "sub_question": "Obtain and summarize recent news, financing, partnerships etc.",
+    "sub_question": "Obtain and summarize recent news, financing, partnerships etc."
   }
-]
+]}
 ```
 
 ---
@@ -146,24 +161,24 @@ Output should be a unified JSON array, with each task item containing the follow
 
 **Output**:
 ```json
-[
+{"plan": [
   {
     "step": "1",
-    "sub_question": "Find and understand Agentic Workflow's basic concepts and definitions",
+    "sub_question": "Find and understand Agentic Workflow's basic concepts and definitions"
   },
   {
     "step": "2",
-    "sub_question": "Find and understand Agentic Workflow's design principles and characteristics",
+    "sub_question": "Find and understand Agentic Workflow's design principles and characteristics"
   },
   {
     "step": "3",
-    "sub_question": "Search and summarize typical Agentic Workflow application examples",
+    "sub_question": "Search and summarize typical Agentic Workflow application examples"
   },
   {
     "step": "4",
-    "sub_question": "Search and compare differences between Agentic Workflow and traditional workflows",
+    "sub_question": "Search and compare differences between Agentic Workflow and traditional workflows"
   }
-]
+]}
 ```
 
 ---
@@ -178,16 +193,16 @@ Output should be a unified JSON array, with each task item containing the follow
 
 **Output**:
 ```json
-[
+{"plan": [
   {
     "step": "1",
-    "sub_question": "Find the most relevant papers on LLM accelerated inference tools",
+    "sub_question": "Find the most relevant papers on LLM accelerated inference tools"
   },
   {
     "step": "2",
-    "sub_question": "<|RETHINK AND PLANNING>| Based on the previous step, Rethink and plan the next step to search.",
+    "sub_question": "<|RETHINK AND PLANNING>| Based on the previous step, Rethink and plan the next step to search."
   }
-]
+]}
 ```
 """
 
@@ -204,7 +219,7 @@ Context: User is an automotive industry analyst focusing on Chinese NEV's overse
 For each core point, only output one set of optimal search keywords.
 
 Output:
-["2024 China new energy vehicle export data main export countries"]
+{"keywords": ["2024 China new energy vehicle export data main export countries"]}
 
 ## Example 2:
 User requirement: Help me find the latest price and user reviews for iPhone 15 Pro Max on US Amazon.
@@ -212,7 +227,7 @@ Context: User plans to purchase iPhone 15 Pro Max in US, cares about price and a
 For each core point, only output one set of optimal search keywords.
 
 Output:
-["iPhone 15 Pro Max US Amazon price user reviews"]
+{"keywords": ["iPhone 15 Pro Max US Amazon price user reviews"]}
 
 ## Example 3:
 User requirement: Want to know Munich Germany May weather and suitable clothing.
@@ -220,7 +235,7 @@ Context: User plans to visit Munich in May, concerned about weather impact on cl
 For each core point, only output one set of optimal search keywords.
 
 Output:
-["Munich May weather clothing recommendations"]
+{"keywords": ["Munich May weather clothing recommendations"]}
 
 ## Example 4:
 User requirement: What are the inference acceleration engines for large language models?
@@ -228,7 +243,7 @@ Context: LLM acceleration engines are essential for large language models. Eclud
 For each core point, only output one set of optimal search keywords.
 
 Output:
-["vllm", "SGL", "Deepspeed", .......]
+{"keywords": ["vllm", "SGL", "Deepspeed", .......]}
 """
 
 # Judge whether the reference text satisfies the original user requirement
@@ -239,9 +254,9 @@ You are a task completion assessment expert. Carefully review:
 2. **Reference text**: {ref_content}
 
 Determine: Does the reference text fully satisfy the original user requirement?
-- If reference text completely and accurately answers the question, return True.
-- If reference text has missing information, incomplete content, or cannot directly satisfy the requirement, return False.
-- Only return True or False, no other output.
+- If reference text completely and accurately answers the question, return {"finished": true}.
+- If reference text has missing information, incomplete content, or cannot directly satisfy the requirement, return {"finished": false}.
+- Only return this JSON object, no other output.
 
 ---
 
@@ -254,7 +269,7 @@ Provide China's 2023 new energy vehicle export volume and main export countries.
 In 2023, China exported 1.2 million new energy vehicles, mainly to Belgium, UK, Thailand and Philippines.
 
 **Your output should be:**  
-True
+{"finished": true}
 
 ---
 
@@ -265,8 +280,8 @@ Provide China's 2023 new energy vehicle export volume and main export countries.
 In 2023, China exported 1.2 million new energy vehicles.
 
 **Your output should be:**  
-False
+{"finished": false}
 
 ---
 
-Strictly follow these requirements and only output True or False."""
+Strictly follow these requirements and only output {"finished": true} or {"finished": false}."""
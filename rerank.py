@@ -0,0 +1,162 @@
+import math
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Awaitable, Callable
+
+from context import text_terms
+
+try:
+    import numpy as np
+except ImportError:  # Only needed by EmbeddingReranker
+    np = None
+
+class Reranker(ABC):
+    """
+    Pick the search hits worth fetching.
+
+    Implementations return hit indices, most relevant first, keeping at most top_k hits that
+    score above threshold.
+    """
+
+    def __init__(self, top_k: int | None = None, threshold: float = 0.0):
+        """
+        Args:
+            top_k (int | None): Max hits kept, all if None.
+            threshold (float): Hits scoring at or below it are dropped.
+        """
+        self.top_k = top_k
+        self.threshold = threshold
+
+    @abstractmethod
+    async def rerank(self, query: str, titles: list[str], snippets: list[str]) -> list[int]:
+        """
+        Args:
+            query (str): The question the hits should answer.
+            titles (list[str]): Hit titles.
+            snippets (list[str]): Hit snippets, same length as titles.
+
+        Returns:
+            list[int]: Indices of the kept hits, most relevant first.
+        """
+
+    def cut(self, scores: list[float]) -> list[int]:
+        """
+        Order hits by score and apply threshold and top_k.
+
+        When no hit scores above threshold the search engine's order is kept instead, since
+        an empty lexical overlap (e.g. a query in another language) says little about relevance.
+        """
+        ranked = sorted(range(len(scores)), key=lambda idx: (-scores[idx], idx))
+        kept = [idx for idx in ranked if scores[idx] > self.threshold] or list(range(len(scores)))
+        return kept[:self.top_k] if self.top_k is not None else kept
+
+class BM25Reranker(Reranker):
+    """Local BM25 over title and snippet, scored against the other hits of the same search."""
+
+    def __init__(self, top_k: int | None = 8, threshold: float = 0.0, k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            top_k (int | None): Max hits kept, all if None.
+            threshold (float): Hits scoring at or below it are dropped.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 length normalization.
+        """
+        super().__init__(top_k, threshold)
+        self.k1 = k1
+        self.b = b
+
+    def scores(self, query: str, documents: list[str]) -> list[float]:
+        """
+        Args:
+            query (str): Query text.
+            documents (list[str]): Documents forming the corpus.
+
+        Returns:
+            list[float]: BM25 score of every document.
+        """
+        docs = [Counter(text_terms(document)) for document in documents]
+        if not docs:
+            return []
+        lengths = [sum(doc.values()) for doc in docs]
+        avg_length = sum(lengths) / len(docs) or 1.0
+        scores = [0.0] * len(docs)
+        for term in set(text_terms(query)):
+            df = sum(1 for doc in docs if term in doc)
+            if df == 0:
+                continue
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            for idx, doc in enumerate(docs):
+                tf = doc.get(term, 0)
+                if tf:
+                    norm = self.k1 * (1 - self.b + self.b * lengths[idx] / avg_length)
+                    scores[idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    async def rerank(self, query: str, titles: list[str], snippets: list[str]) -> list[int]:
+        documents = [title + "\n" + snippet for title, snippet in zip(titles, snippets)]
+        return self.cut(self.scores(query, documents))
+
+class EmbeddingReranker(Reranker):
+    """
+    Cosine similarity between query and hit embeddings, computed in one NumPy batch.
+
+    Embeddings come from embed, an async function mapping texts to vectors; they are cached by
+    text so repeated titles are only embedded once.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[list[str]], Awaitable[list[list[float]]]],
+        top_k: int | None = 8,
+        threshold: float = 0.3,
+        cache_size: int = 50_000,
+    ):
+        """
+        Args:
+            embed (Callable[[list[str]], Awaitable[list[list[float]]]]): Embedding function.
+            top_k (int | None): Max hits kept, all if None.
+            threshold (float): Hits with cosine similarity at or below it are dropped.
+            cache_size (int): Max cached embeddings.
+        """
+        if np is None:
+            raise ImportError("EmbeddingReranker requires numpy")
+        super().__init__(top_k, threshold)
+        self.embed = embed
+        self.cache_size = cache_size
+        self._cache: dict[str, "np.ndarray"] = {}
+
+    async def vectors(self, texts: list[str]) -> "np.ndarray":
+        """Unit-normalized embeddings of texts, embedding only the ones not cached yet."""
+        missing = list(dict.fromkeys(text for text in texts if text not in self._cache))
+        if missing:
+            if len(self._cache) + len(missing) > self.cache_size:
+                self._cache.clear()
+            vectors = np.asarray(await self.embed(missing), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+            self._cache.update(zip(missing, vectors))
+        return np.stack([self._cache[text] for text in texts])
+
+    async def rerank(self, query: str, titles: list[str], snippets: list[str]) -> list[int]:
+        if not titles:
+            return []
+        documents = [title + "\n" + snippet for title, snippet in zip(titles, snippets)]
+        vectors = await self.vectors([query] + documents)
+        return self.cut((vectors[1:] @ vectors[0]).tolist())
+
+class GPTReranker(Reranker):
+    """Let an LLM pick relevant titles, see WebSearchTool.reranker_by_gpt."""
+
+    def __init__(self, rerank_titles: Callable[[str, list[str]], Awaitable[list[int]]], top_k: int | None = None):
+        """
+        Args:
+            rerank_titles (Callable[[str, list[str]], Awaitable[list[int]]]): Maps question and
+                titles to the relevant title indices.
+            top_k (int | None): Max hits kept, all if None.
+        """
+        super().__init__(top_k)
+        self.rerank_titles = rerank_titles
+
+    async def rerank(self, query: str, titles: list[str], snippets: list[str]) -> list[int]:
+        indices = [idx for idx in await self.rerank_titles(query, titles)
+                   if isinstance(idx, int) and 0 <= idx < len(titles)]
+        return indices[:self.top_k] if self.top_k is not None else indices
@@ -0,0 +1,293 @@
+import math
+import asyncio
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from context import ContextBuilder, query_terms, text_terms
+
+@dataclass
+class Passage:
+    """A passage of a fetched page."""
+    id: int
+    url: str
+    title: str
+    position: int
+    text: str
+    tokens: int
+
+class PassageIndex:
+    """
+    In-memory BM25 inverted index over the passages of the pages fetched in one research.
+
+    Pages are split into passages with the ContextBuilder's chunking and can be added at any
+    time; a page already indexed is not indexed again.
+    """
+
+    def __init__(self, context_builder: ContextBuilder | None = None, k1: float = 1.2, b: float = 0.75,
+                 model: str = "gpt-4.1", min_score: float = 0.25):
+        """
+        Args:
+            context_builder (ContextBuilder, optional): Splits pages into passages.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 length normalization.
+            model (str): Model whose tokenizer sizes the passages.
+            min_score (float): Passages scoring below this fraction of the best one are not
+                returned by search.
+        """
+        self.context_builder = context_builder or ContextBuilder()
+        self.k1 = k1
+        self.b = b
+        self.min_score = min_score
+        self.model = model
+        self.passages: list[Passage] = []
+        self.urls: dict[str, list[int]] = {}
+        self._postings: dict[str, dict[int, int]] = defaultdict(dict)
+        self._lengths: list[int] = []
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.urls
+
+    def add(self, url: str, title: str, text: str) -> list[int]:
+        """
+        Index a page.
+
+        Args:
+            url (str): Page URL, identifies the page.
+            title (str): Page title.
+            text (str): Page text.
+
+        Returns:
+            list[int]: Ids of the page's passages.
+        """
+        if url in self.urls:
+            return self.urls[url]
+        ids = []
+        for chunk in self.context_builder.chunks(url, text, self.model):
+            passage = Passage(id=len(self.passages), url=url, title=title, position=chunk.position,
+                              text=chunk.text, tokens=chunk.tokens)
+            terms = Counter(text_terms(title + "\n" + chunk.text))
+            for term, tf in terms.items():
+                self._postings[term][passage.id] = tf
+            length = sum(terms.values())
+            self._lengths.append(length)
+            self._total_length += length
+            self.passages.append(passage)
+            ids.append(passage.id)
+        self.urls[url] = ids
+        return ids
+
+    def search(self, query: str, k: int = 12, budget: int | None = None, urls: list[str] | None = None) -> list[Passage]:
+        """
+        Find the passages most relevant to query.
+
+        Stopwords of the query are ignored and passages scoring below min_score of the best
+        one are left out, so pages sharing only a few common words with query do not match.
+
+        Args:
+            query (str): Query text.
+            k (int): Max passages returned.
+            budget (int, optional): Max total tokens of the returned passages.
+            urls (list[str], optional): Only search the passages of these pages.
+
+        Returns:
+            list[Passage]: Passages, best first.
+        """
+        allowed = None if urls is None else {pid for url in urls for pid in self.urls.get(url, [])}
+        if not self.passages or allowed == set():
+            return []
+        avg_length = self._total_length / len(self.passages) or 1.0
+        scores: dict[int, float] = defaultdict(float)
+        for term in query_terms(query):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.passages) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for pid, tf in postings.items():
+                if allowed is not None and pid not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[pid] / avg_length)
+                scores[pid] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        cutoff = self.min_score * max(scores.values(), default=0.0)
+        results, used = [], 0
+        for pid in sorted(scores, key=lambda pid: (-scores[pid], pid)):
+            if scores[pid] < cutoff:
+                break
+            passage = self.passages[pid]
+            if budget is not None and used + passage.tokens > budget:
+                continue
+            results.append(passage)
+            used += passage.tokens
+            if len(results) >= k:
+                break
+        return results
+
+    @staticmethod
+    def format_passages(passages: list[Passage]) -> dict[str, str]:
+        """
+        Format passages for the summary prompt, grouped by source page.
+
+        Args:
+            passages (list[Passage]): Retrieved passages, best first.
+
+        Returns:
+            dict[str, str]: Mapping of "Reference {idx}" to title, URL and the page's passages in
+                page order; pages are ordered by their best passage.
+        """
+        by_url: dict[str, list[Passage]] = {}
+        for passage in passages:
+            by_url.setdefault(passage.url, []).append(passage)
+        formatted = {}
+        for idx, page in enumerate(by_url.values()):
+            page.sort(key=lambda passage: passage.position)
+            formatted[f"Reference {idx}"] = (page[0].title + "\n" + page[0].url + "\n"
+                                             + "\n...\n".join(passage.text for passage in page))
+        return formatted
+
+@dataclass
+class EvidenceStats:
+    """How much work an evidence store saved in one research."""
+    searches: int = 0
+    searches_avoided: int = 0
+    fetches: int = 0
+    fetches_avoided: int = 0
+    sub_questions_answered_from_store: int = 0
+
+class EvidenceStore:
+    """
+    Everything one research has found so far: references per searched keyword, cleaned page
+    text per URL and a passage index over all pages.
+
+    Sub-questions and re-planning iterations consult it before searching or fetching again;
+    concurrent sub-questions asking for the same keyword or URL share one search or fetch.
+    """
+
+    def __init__(self, context_builder: ContextBuilder | None = None, min_sources: int = 3,
+                 min_term_coverage: float = 0.7):
+        """
+        Args:
+            context_builder (ContextBuilder, optional): Splits pages into passages.
+            min_sources (int): Pages that must match a question before it counts as covered.
+            min_term_coverage (float): Share of the question's terms those pages must contain.
+        """
+        self.index = PassageIndex(context_builder)
+        self.min_sources = min_sources
+        self.min_term_coverage = min_term_coverage
+        self.pages: dict[str, str] = {}
+        self.searches: dict[str, list[dict[str, str]]] = {}
+        self.stats = EvidenceStats()
+        self._inflight: dict[tuple[str, str], list] = {}  # [task, waiting callers]
+
+    async def _shared(self, kind: str, key: str, run: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """
+        Run run once per (kind, key) at a time; returns its result and whether it was shared.
+
+        When every caller waiting for it has been cancelled the run is cancelled too.
+        """
+        entry = self._inflight.get((kind, key))
+        shared = entry is not None
+        if entry is None:
+            entry = self._inflight[(kind, key)] = [asyncio.ensure_future(run()), 0]
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            if entry[1] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            entry[1] -= 1
+            if (task.done() or entry[1] == 0) and self._inflight.get((kind, key)) is entry:
+                del self._inflight[(kind, key)]
+
+    @staticmethod
+    def _search_key(keywords: str) -> str:
+        return " ".join(keywords.casefold().split())
+
+    def searched(self, keywords: str) -> list[dict[str, str]] | None:
+        """References already found for keywords in this research, None if not searched yet."""
+        references = self.searches.get(self._search_key(keywords))
+        if references is not None:
+            self.stats.searches_avoided += 1
+        return references
+
+    def add_search(self, keywords: str, references: list[dict[str, str]]):
+        """Record the references found for keywords."""
+        self.stats.searches += 1
+        self.searches[self._search_key(keywords)] = references
+
+    async def search(self, keywords: str, run: Callable[[], Awaitable[list[dict[str, str]]]]) -> list[dict[str, str]]:
+        """
+        References for keywords, searching only if this research has not searched them yet.
+
+        Args:
+            keywords (str): Search keywords.
+            run (Callable[[], Awaitable[list[dict[str, str]]]]): Performs the search.
+
+        Returns:
+            list[dict[str, str]]: References with "url", "title" and "content".
+        """
+        searched = self.searched(keywords)
+        if searched is not None:
+            return searched
+        references, shared = await self._shared("search", self._search_key(keywords), run)
+        if shared:
+            self.stats.searches_avoided += 1
+        else:
+            self.add_search(keywords, references)
+        return references
+
+    async def page(self, url: str, title: str, fetch: Callable[[], Awaitable[str]]) -> str:
+        """
+        Cleaned text of a page, fetching only if this research has not fetched it yet.
+
+        Fetched pages are indexed for passage retrieval.
+
+        Args:
+            url (str): Page URL.
+            title (str): Page title.
+            fetch (Callable[[], Awaitable[str]]): Fetches and cleans the page.
+
+        Returns:
+            str: Page text, empty if the fetch failed.
+        """
+        if url in self.pages:
+            self.stats.fetches_avoided += 1
+            return self.pages[url]
+        text, shared = await self._shared("page", url, fetch)
+        if shared:
+            self.stats.fetches_avoided += 1
+        else:
+            self.stats.fetches += 1
+            self.pages[url] = text
+            if text:
+                self.index.add(url, title, text)
+        return text
+
+    def covers(self, query: str) -> bool:
+        """
+        Whether the stored pages already answer query well enough to skip searching.
+
+        Args:
+            query (str): Sub-question.
+
+        Returns:
+            bool: True when at least min_sources pages match and their best passages contain
+                min_term_coverage of the query's terms.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return False
+        passages = self.index.search(query, k=4 * self.min_sources)
+        if len({passage.url for passage in passages}) < self.min_sources:
+            return False
+        found = set()
+        for passage in passages:
+            found |= terms & set(text_terms(passage.text))
+        return len(found) / len(terms) >= self.min_term_coverage
@@ -0,0 +1,45 @@
+import os
+
+STEPS = ("plan", "keyword", "rerank", "condense", "summary", "judge")
+# First model of each step is tried first; the following ones are escalations when its output fails to parse
+DEFAULT_MODELS = {
+    "plan": ["gpt-4.1"],
+    "keyword": ["gpt-4.1-mini", "gpt-4.1"],
+    "rerank": ["gpt-4.1-mini", "gpt-4.1"],
+    "condense": ["gpt-4.1-mini", "gpt-4.1"],
+    "summary": ["gpt-4.1"],
+    "judge": ["gpt-4.1-mini", "gpt-4.1"],
+}
+# Steps whose reply is a decision rather than prose run at temperature 0, so the LLM response cache can serve them
+DETERMINISTIC_STEPS = ("plan", "keyword", "rerank", "judge")
+
+class ModelRouter:
+    """
+    Per-step model routing: small, fast models for keyword extraction, reranking, condensing sources and judging,
+    the large model for planning and summaries.
+
+    Each step maps to a list of models. The first is used normally; the next one is tried
+    when a model's reply cannot be parsed. A step can be configured with the environment
+    variable DEEPSEARCH_MODEL_<STEP>, e.g. DEEPSEARCH_MODEL_JUDGE="gpt-4.1-nano,gpt-4.1".
+    """
+
+    def __init__(self, models: dict[str, list[str]] | None = None):
+        """
+        Args:
+            models (dict[str, list[str]], optional): Models per step, merged over the environment
+                configuration and DEFAULT_MODELS.
+        """
+        self._models = dict(DEFAULT_MODELS)
+        for step in STEPS:
+            configured = os.environ.get(f"DEEPSEARCH_MODEL_{step.upper()}")
+            if configured:
+                self._models[step] = [model.strip() for model in configured.split(",") if model.strip()]
+        self._models.update(models or {})
+
+    def models(self, step: str) -> list[str]:
+        """Models for step, in escalation order."""
+        return self._models[step]
+
+    def primary(self, step: str) -> str:
+        """The model normally used for step."""
+        return self._models[step][0]
@@ -0,0 +1,262 @@
+import os
+import json
+import asyncio
+import httpx
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+from cache import normalize_url
+from retrieval import PassageIndex
+from telemetry import logger
+
+DEFAULT_BING_ENDPOINT = "https://api.bing.microsoft.com/v7.0/search"
+# Reciprocal-rank fusion constant; 60 is the usual choice and damps the weight of the very top ranks
+RRF_K = 60
+
+@dataclass
+class SearchHit:
+    """One search result."""
+    url: str
+    title: str
+    snippet: str = ""
+    provider: str = ""
+
+class SearchProvider(ABC):
+    """
+    A search backend.
+
+    Implementations return hits best first and raise on failure; FederatedSearch turns failures
+    and timeouts of one provider into an empty result list.
+    """
+    name = "provider"
+
+    def __init__(self, timeout: float = 5.0):
+        """
+        Args:
+            timeout (float): Seconds FederatedSearch waits for this provider.
+        """
+        self.timeout = timeout
+
+    @abstractmethod
+    async def search(self, query: str, count: int = 10, mkt: str = "en-US") -> list[SearchHit]:
+        """
+        Args:
+            query (str): Search keywords.
+            count (int): Max hits returned.
+            mkt (str): Market / language, e.g. en-US.
+
+        Returns:
+            list[SearchHit]: Hits, best first.
+        """
+
+    def page_text(self, url: str) -> Optional[str]:
+        """Text of a page this provider holds itself (offline indexes), None to fetch it from the web."""
+        return None
+
+    async def aclose(self):
+        pass
+
+class _HTTPProvider(SearchProvider):
+    """Provider with a lazily created connection pool."""
+
+    def __init__(self, timeout: float = 5.0):
+        super().__init__(timeout)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+class BingProvider(_HTTPProvider):
+    """Bing Web Search API v7."""
+    name = "bing"
+
+    def __init__(self, api_key: Optional[str] = None, endpoint: Optional[str] = None, timeout: float = 5.0):
+        """
+        Args:
+            api_key (str, optional): Subscription key, defaults to the Bing_API_KEY environment variable.
+            endpoint (str, optional): API URL, defaults to BING_ENDPOINT or the public endpoint.
+            timeout (float): Seconds FederatedSearch waits for this provider.
+        """
+        super().__init__(timeout)
+        self.api_key = api_key or os.environ.get("Bing_API_KEY", "")
+        self.endpoint = endpoint or os.environ.get("BING_ENDPOINT", DEFAULT_BING_ENDPOINT)
+
+    async def search(self, query: str, count: int = 10, mkt: str = "en-US") -> list[SearchHit]:
+        response = await self.client.get(self.endpoint, params={"q": query, "mkt": mkt, "count": count},
+                                         headers={"Ocp-Apim-Subscription-Key": self.api_key})
+        response.raise_for_status()
+        pages = response.json().get("webPages", {}).get("value", [])
+        return [SearchHit(url=page["url"], title=page.get("name", ""), snippet=page.get("snippet", ""), provider=self.name)
+                for page in pages[:count]]
+
+class SearxngProvider(_HTTPProvider):
+    """A self-hosted SearXNG instance (its JSON output format must be enabled)."""
+    name = "searxng"
+
+    def __init__(self, base_url: Optional[str] = None, timeout: float = 5.0):
+        """
+        Args:
+            base_url (str, optional): Instance URL, defaults to the SEARXNG_URL environment variable.
+            timeout (float): Seconds FederatedSearch waits for this provider.
+        """
+        super().__init__(timeout)
+        self.base_url = (base_url or os.environ.get("SEARXNG_URL", "http://localhost:8888")).rstrip("/")
+
+    async def search(self, query: str, count: int = 10, mkt: str = "en-US") -> list[SearchHit]:
+        response = await self.client.get(f"{self.base_url}/search",
+                                         params={"q": query, "format": "json", "language": mkt})
+        response.raise_for_status()
+        results = response.json().get("results", [])
+        return [SearchHit(url=result["url"], title=result.get("title", ""), snippet=result.get("content", ""),
+                          provider=self.name)
+                for result in results[:count] if result.get("url")]
+
+class LocalIndexProvider(SearchProvider):
+    """
+    Offline search over a local document collection with BM25 (retrieval.PassageIndex).
+
+    Documents are loaded from a JSON Lines file with "url", "title" and "text" per line, or added
+    with add(). Their text is served by page_text, so researches over the index need no network.
+    """
+    name = "local"
+
+    def __init__(self, path: Optional[str] = None, timeout: float = 5.0):
+        """
+        Args:
+            path (str, optional): JSON Lines file, defaults to the DEEPSEARCH_LOCAL_INDEX environment variable.
+            timeout (float): Seconds FederatedSearch waits for this provider.
+        """
+        super().__init__(timeout)
+        self.index = PassageIndex()
+        self.documents: dict[str, tuple[str, str]] = {}
+        path = path or os.environ.get("DEEPSEARCH_LOCAL_INDEX")
+        if path:
+            self.load(path)
+
+    def load(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    document = json.loads(line)
+                    self.add(document["url"], document.get("title", ""), document["text"])
+
+    def add(self, url: str, title: str, text: str):
+        self.documents[url] = (title, text)
+        self.index.add(url, title, text)
+
+    async def search(self, query: str, count: int = 10, mkt: str = "en-US") -> list[SearchHit]:
+        hits, seen = [], set()
+        for passage in self.index.search(query, k=4 * count):
+            if passage.url in seen:
+                continue
+            seen.add(passage.url)
+            hits.append(SearchHit(url=passage.url, title=passage.title, snippet=passage.text[:300], provider=self.name))
+            if len(hits) >= count:
+                break
+        return hits
+
+    def page_text(self, url: str) -> Optional[str]:
+        document = self.documents.get(url)
+        return document[1] if document is not None else None
+
+def reciprocal_rank_fusion(result_lists: list[list[SearchHit]], k: int = RRF_K) -> list[SearchHit]:
+    """
+    Merge ranked hit lists: each hit scores sum(1 / (k + rank)) over the lists it appears in.
+
+    Hits are identified by normalized URL; the first provider's title and snippet are kept.
+
+    Args:
+        result_lists (list[list[SearchHit]]): Hits of each provider, best first.
+        k (int): Rank damping constant.
+
+    Returns:
+        list[SearchHit]: Fused hits, best first; ties keep provider order.
+    """
+    scores: dict[str, float] = {}
+    hits: dict[str, SearchHit] = {}
+    for hits_of_provider in result_lists:
+        for rank, hit in enumerate(hits_of_provider, start=1):
+            key = normalize_url(hit.url)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            hits.setdefault(key, hit)
+    order = {key: position for position, key in enumerate(hits)}
+    return [hits[key] for key in sorted(scores, key=lambda key: (-scores[key], order[key]))]
+
+class FederatedSearch:
+    """
+    Queries every configured provider concurrently and fuses their results with reciprocal-rank
+    fusion. A provider that fails or exceeds its timeout contributes nothing instead of delaying
+    or failing the search.
+    """
+
+    def __init__(self, providers: list[SearchProvider]):
+        """
+        Args:
+            providers (list[SearchProvider]): Providers, in tie-breaking order.
+        """
+        self.providers = providers
+
+    @property
+    def names(self) -> list[str]:
+        return [provider.name for provider in self.providers]
+
+    @classmethod
+    def from_env(cls) -> "FederatedSearch":
+        """
+        Providers named in DEEPSEARCH_SEARCH_PROVIDERS (comma-separated: bing, searxng, local;
+        default bing), each with the DEEPSEARCH_SEARCH_TIMEOUT timeout (seconds, default 5).
+        """
+        timeout = float(os.environ.get("DEEPSEARCH_SEARCH_TIMEOUT", 5))
+        factories = {"bing": BingProvider, "searxng": SearxngProvider, "local": LocalIndexProvider}
+        names = [name.strip() for name in os.environ.get("DEEPSEARCH_SEARCH_PROVIDERS", "bing").split(",") if name.strip()]
+        unknown = [name for name in names if name not in factories]
+        if unknown:
+            raise ValueError(f"unknown search providers {unknown}, expected some of {list(factories)}")
+        return cls([factories[name](timeout=timeout) for name in names])
+
+    async def _search_one(self, provider: SearchProvider, query: str, count: int, mkt: str) -> list[SearchHit]:
+        try:
+            return await asyncio.wait_for(provider.search(query, count, mkt), timeout=provider.timeout)
+        except asyncio.TimeoutError:
+            logger.warning("search provider timed out", extra={"provider": provider.name, "query": query,
+                                                               "timeout": provider.timeout})
+        except Exception as e:
+            logger.warning("search provider failed", extra={"provider": provider.name, "query": query, "error": str(e)})
+        return []
+
+    async def search(self, query: str, count: int = 10, mkt: str = "en-US") -> list[SearchHit]:
+        """
+        Search all providers.
+
+        Args:
+            query (str): Search keywords.
+            count (int): Max hits requested from each provider and returned.
+            mkt (str): Market / language, e.g. en-US.
+
+        Returns:
+            list[SearchHit]: Fused hits, best first.
+        """
+        if len(self.providers) == 1:
+            return (await self._search_one(self.providers[0], query, count, mkt))[:count]
+        result_lists = await asyncio.gather(*(self._search_one(provider, query, count, mkt) for provider in self.providers))
+        return reciprocal_rank_fusion(result_lists)[:count]
+
+    def page_text(self, url: str) -> Optional[str]:
+        """Page text held by a provider (see SearchProvider.page_text), None if it must be fetched."""
+        for provider in self.providers:
+            text = provider.page_text(url)
+            if text is not None:
+                return text
+        return None
+
+    async def aclose(self):
+        await asyncio.gather(*(provider.aclose() for provider in self.providers))
@@ -0,0 +1,369 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+
+try:
+    from opentelemetry import trace as otel_trace
+    from opentelemetry.trace import Status, StatusCode
+except ImportError:  # spans are still timed and counted, just not exported
+    otel_trace = None
+
+logger = logging.getLogger("deepsearch")
+
+# Buckets in seconds, from cache hits to whole researches
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_string(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels) + "}"
+
+class Counter:
+    """Monotonic counter with labels."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[tuple[tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(tuple(sorted((k, str(v)) for k, v in labels.items())), 0.0)
+
+    def samples(self) -> Iterator[tuple[str, tuple, float]]:
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield self.name + "_total", labels, value
+
+class Histogram:
+    """Cumulative-bucket histogram with labels."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._values: dict[tuple[tuple[str, str], ...], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            counts = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self) -> Iterator[tuple[str, tuple, float]]:
+        with self._lock:
+            items = [(labels, list(counts)) for labels, counts in self._values.items()]
+        for labels, counts in items:
+            for bound, count in zip(self.buckets, counts):
+                yield self.name + "_bucket", labels + (("le", repr(bound)),), count
+            yield self.name + "_bucket", labels + (("le", "+Inf"),), counts[-2]
+            yield self.name + "_count", labels, counts[-2]
+            yield self.name + "_sum", labels, counts[-1]
+
+@dataclass
+class _Collector:
+    name: str
+    help: str
+    kind: str
+    collect: Callable[[], dict[tuple[tuple[str, str], ...], float]]
+
+    def samples(self) -> Iterator[tuple[str, tuple, float]]:
+        name = self.name + "_total" if self.kind == "counter" else self.name
+        for labels, value in self.collect().items():
+            yield name, labels, value
+
+class MetricsRegistry:
+    """
+    Process-wide metrics rendered in the Prometheus text exposition format.
+
+    Counters and histograms are updated as work happens; collectors are callbacks read at scrape
+    time, for values other objects already keep (e.g. cache statistics).
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, Any] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, buckets))
+
+    def collector(self, name: str, help: str, collect: Callable[[], dict[tuple[tuple[str, str], ...], float]],
+                  kind: str = "gauge"):
+        """Register (or replace) a metric whose samples collect() returns, keyed by label tuples."""
+        self._metrics[name] = _Collector(name, help, kind, collect)
+
+    def samples(self) -> list[tuple[str, str, tuple, float]]:
+        """Current samples of every metric as (metric name, sample name, labels, value)."""
+        return [(metric.name, name, labels, value)
+                for metric in list(self._metrics.values()) for name, labels, value in metric.samples()]
+
+    def render(self, samples: Optional[list[tuple[str, str, tuple, float]]] = None) -> str:
+        """
+        Args:
+            samples (list, optional): Samples to render in place of this process's own, e.g. summed
+                over worker processes by SharedMetrics; metrics are described by this registry.
+        """
+        by_metric: dict[str, list[tuple[str, tuple, float]]] = {}
+        for metric_name, name, labels, value in (self.samples() if samples is None else samples):
+            by_metric.setdefault(metric_name, []).append((name, labels, value))
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in by_metric.get(metric.name, []):
+                lines.append(f"{name}{_label_string(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def kind(self, name: str) -> Optional[str]:
+        metric = self._metrics.get(name)
+        return metric.kind if metric is not None else None
+
+class SharedMetrics:
+    """
+    Metrics of several worker processes summed through a SQLite file.
+
+    Each worker publishes a snapshot of its registry every interval seconds (and on every
+    scrape it answers); render sums the latest snapshot of every worker, so a scrape reports
+    the whole server whichever worker answers it. Counters and histograms of workers that
+    have exited stay in the sum; their gauges are dropped once they stop publishing.
+    """
+
+    def __init__(self, registry: MetricsRegistry, path: str, interval: float = 5.0):
+        """
+        Args:
+            registry (MetricsRegistry): This worker's metrics.
+            path (str): SQLite file, the same for every worker.
+            interval (float): Seconds between snapshots.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.registry = registry
+        self.interval = interval
+        # pid alone could be reused by a later worker and overwrite the totals of an exited one
+        self.worker = f"{os.getpid()}-{time.time():.6f}"
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS samples ("
+            "worker TEXT NOT NULL, metric TEXT NOT NULL, name TEXT NOT NULL, labels TEXT NOT NULL, "
+            "value REAL NOT NULL, PRIMARY KEY (worker, name, labels))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS workers (worker TEXT PRIMARY KEY, updated REAL NOT NULL)")
+
+    @staticmethod
+    def reset(path: str):
+        """Forget the snapshots of earlier server runs, before the workers start."""
+        if not os.path.exists(path):
+            return
+        conn = sqlite3.connect(path, timeout=10)
+        with conn:
+            for table in ("samples", "workers"):
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.close()
+
+    def publish(self):
+        """Replace this worker's snapshot with its current samples."""
+        rows = [(self.worker, metric, name, json.dumps(labels), value)
+                for metric, name, labels, value in self.registry.samples()]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM samples WHERE worker = ?", (self.worker,))
+                self._conn.executemany(
+                    "INSERT INTO samples (worker, metric, name, labels, value) VALUES (?, ?, ?, ?, ?)", rows)
+                self._conn.execute("INSERT OR REPLACE INTO workers (worker, updated) VALUES (?, ?)",
+                                   (self.worker, time.time()))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def render(self) -> str:
+        """Prometheus text of all workers' metrics summed, with this worker's taken fresh."""
+        self.publish()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.metric, s.name, s.labels, s.value, w.updated FROM samples s "
+                "JOIN workers w ON w.worker = s.worker").fetchall()
+        live = time.time() - 3 * self.interval
+        totals: dict[tuple[str, str, str], float] = {}
+        for metric, name, labels, value, updated in rows:
+            if self.registry.kind(metric) == "gauge" and updated < live:
+                continue
+            totals[(metric, name, labels)] = totals.get((metric, name, labels), 0.0) + value
+        # Keep this worker's sample order, which has histogram buckets in ascending order
+        order = {(metric, name, json.dumps(labels)): i for i, (metric, name, labels, _) in enumerate(self.registry.samples())}
+        samples = [(metric, name, tuple(tuple(pair) for pair in json.loads(labels)), value)
+                   for (metric, name, labels), value in sorted(totals.items(), key=lambda item: order.get(item[0], len(order)))]
+        return self.registry.render(samples)
+
+    def start(self):
+        """Publish snapshots in a daemon thread until close."""
+        def run():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.publish()
+                except sqlite3.Error:
+                    logger.warning("metrics snapshot failed", exc_info=True)
+        threading.Thread(target=run, name="metrics-publisher", daemon=True).start()
+
+    def close(self):
+        self._stop.set()
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram("deepsearch_stage_seconds", "Duration of research stages")
+STAGE_ERRORS = metrics.counter("deepsearch_stage_errors", "Research stages that raised")
+LLM_REQUESTS = metrics.counter("deepsearch_llm_requests", "LLM HTTP requests by model and outcome")
+LLM_TOKENS = metrics.counter("deepsearch_llm_tokens", "LLM tokens reported in usage, by model and kind")
+LLM_RETRIES = metrics.counter("deepsearch_llm_retries", "LLM requests retried after rate limits or server errors")
+CACHE_LOOKUPS = metrics.counter("deepsearch_cache_lookups", "Search and page lookups by cache and result")
+FETCH_BYTES = metrics.counter("deepsearch_fetch_bytes", "Bytes downloaded by the page fetcher")
+FETCHES = metrics.counter("deepsearch_fetches", "Page fetches by outcome")
+RESEARCH_SIMILARITY = metrics.histogram("deepsearch_research_cache_similarity",
+                                        "Similarity of the closest cached research to each new query",
+                                        buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0))
+
+@dataclass
+class Span:
+    """A timed stage of a research; attributes end up on the exported span and in the log."""
+    name: str
+    attributes: dict[str, Any] = field(default_factory=dict)
+    start: float = field(default_factory=time.perf_counter)
+    _otel: Any = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+        if self._otel is not None and value is not None:
+            self._otel.set_attribute(f"deepsearch.{key}", value if isinstance(value, (str, bool, int, float)) else str(value))
+
+    def add(self, key: str, amount: int | float):
+        self.set(key, self.attributes.get(key, 0) + amount)
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("deepsearch_span", default=None)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Time a research stage.
+
+    The duration goes to deepsearch_stage_seconds{stage=name}, errors to
+    deepsearch_stage_errors_total; with the OpenTelemetry API installed the stage is also a span
+    of the current trace (exported by whatever SDK the process configured). A stage nested in
+    a stage of the same name is merged into the outer one.
+
+    Args:
+        name (str): Stage name, e.g. "plan", "search", "fetch".
+        **attributes: Initial span attributes.
+
+    Yields:
+        Span: The stage, for adding attributes such as tokens or cache hits.
+    """
+    parent = _current_span.get()
+    if parent is not None and parent.name == name:
+        for key, value in attributes.items():
+            parent.set(key, value)
+        yield parent
+        return
+
+    current = Span(name)
+    otel_context = otel_trace.get_tracer("deepsearch").start_as_current_span(f"deepsearch.{name}") if otel_trace else None
+    if otel_context is not None:
+        current._otel = otel_context.__enter__()
+    for key, value in attributes.items():
+        current.set(key, value)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current_span.reset(token)
+        duration = time.perf_counter() - current.start
+        STAGE_SECONDS.observe(duration, stage=name)
+        if error is not None and not isinstance(error, GeneratorExit):
+            STAGE_ERRORS.inc(stage=name, error=type(error).__name__)
+            if current._otel is not None:
+                current._otel.record_exception(error)
+                current._otel.set_status(Status(StatusCode.ERROR, str(error)))
+        if otel_context is not None:
+            otel_context.__exit__(None, None, None)
+        logger.debug("stage finished", extra={"stage": name, "duration": round(duration, 4),
+                                              "error": type(error).__name__ if error else None,
+                                              **current.attributes})
+
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats the fields passed with extra={...} alongside the message, as JSON or key=value text.
+    The current stage, if any, is added as "stage".
+    """
+
+    def __init__(self, json_output: bool = False):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+        self.json_output = json_output
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS and value is not None}
+        stage = current_span()
+        if stage is not None:
+            fields.setdefault("stage", stage.name)
+        if self.json_output:
+            payload = {"time": self.formatTime(record), "level": record.levelname, "logger": record.name,
+                       "message": record.getMessage(), **fields}
+            if record.exc_info:
+                payload["exception"] = self.formatException(record.exc_info)
+            return json.dumps(payload, ensure_ascii=False, default=str)
+        text = super().format(record)
+        if fields:
+            text += " " + " ".join(f"{key}={value!r}" if isinstance(value, str) and " " in value else f"{key}={value}"
+                                   for key, value in fields.items())
+        return text
+
+def configure_logging(level: str | None = None, json_output: bool | None = None):
+    """
+    Set up the "deepsearch" logger.
+
+    Args:
+        level (str, optional): Log level, defaults to DEEPSEARCH_LOG_LEVEL or INFO.
+        json_output (bool, optional): One JSON object per line, defaults to DEEPSEARCH_LOG_FORMAT == "json".
+    """
+    level = level or os.environ.get("DEEPSEARCH_LOG_LEVEL", "INFO")
+    if json_output is None:
+        json_output = os.environ.get("DEEPSEARCH_LOG_FORMAT", "text") == "json"
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(json_output))
+    logger.handlers[:] = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
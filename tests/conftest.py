@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import asyncio
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+# Before the modules under test read them at import time
+os.environ.setdefault("OPEN_AI_KEY", "test")
+os.environ.setdefault("Bing_API_KEY", "test")
+os.environ["DEEPSEARCH_CACHE_DIR"] = tempfile.mkdtemp(prefix="deepsearch-test-")
+
+from LLM.openai import StructuredOutputError, _extract_json
+from cache import ContentCache, SearchCache
+from prompts import EXPERT_PLANNING_SYSTEM, EXPERT_JUDEGE_SYSTEM
+
+def completion(content: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+    usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                            total_tokens=prompt_tokens + completion_tokens)
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content, parsed=None))], usage=usage)
+
+class FakeLLM:
+    """
+    Stands in for WebSearchTool.llm: replies are chosen by reply(messages, kwargs), and every
+    call is recorded as (step, kwargs) with step guessed from the system prompt.
+    """
+
+    def __init__(self, reply=None, latency: float = 0.0):
+        self.reply = reply or self.default_reply
+        self.latency = latency
+        self.response_cache = None
+        self.calls: list[tuple[str, dict]] = []
+
+    @staticmethod
+    def step(messages: list[dict]) -> str:
+        system = str(messages[0]["content"])
+        if system == EXPERT_PLANNING_SYSTEM:
+            return "plan"
+        if system.startswith(EXPERT_JUDEGE_SYSTEM[:40]):
+            return "judge"
+        if "Do not answer the question" in system:
+            return "condense"
+        if "Process the following" in system:
+            return "summary"
+        return "keyword"
+
+    @staticmethod
+    def default_reply(messages: list[dict], kwargs: dict) -> str:
+        step = FakeLLM.step(messages)
+        if step == "plan":
+            return json.dumps({"plan": [{"step": 1, "sub_question": "first"}, {"step": 2, "sub_question": "second"}]})
+        if step == "judge":
+            return json.dumps({"finished": True})
+        if step == "keyword":
+            return json.dumps({"keywords": ["alpha", "beta"]})
+        return f"{step} text"
+
+    async def __call__(self, messages, **kwargs):
+        self.calls.append((self.step(messages), kwargs))
+        await asyncio.sleep(self.latency)
+        return completion(self.reply(messages, kwargs))
+
+    async def parse(self, messages, response_model, **kwargs):
+        result = await self(messages, **kwargs)
+        try:
+            result.choices[0].message.parsed = response_model.model_validate_json(_extract_json(result.choices[0].message.content))
+        except Exception as e:
+            raise StructuredOutputError(str(e))
+        return result
+
+    def steps(self) -> list[str]:
+        return [step for step, _ in self.calls]
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    from deepsearch import WebSearchTool
+    llm = FakeLLM()
+    monkeypatch.setattr(WebSearchTool, "llm", llm)
+    return llm
+
+@pytest.fixture
+def make_tool(fake_llm):
+    """WebSearchTool with in-memory caches, canned search results and page texts."""
+    from deepsearch import WebSearchTool
+
+    def make(pages: dict[str, str] | None = None, **kwargs):
+        kwargs.setdefault("content_cache", ContentCache(disk_path=None))
+        kwargs.setdefault("search_cache", SearchCache(disk_path=None))
+        tool = WebSearchTool(**kwargs)
+
+        async def search_web(query, page_num=3, mkt="en-US"):
+            urls = list(pages) if pages else [f"http://example.com/{query}"]
+            return urls, [f"title {url}" for url in urls], ["snippet"] * len(urls)
+
+        async def extract_url_content(url):
+            return (pages or {}).get(url, "content about alpha and beta " * 20)
+
+        tool.search_web = search_web
+        tool.extract_url_content = extract_url_content
+        return tool
+    return make
+
+@pytest.fixture(scope="session")
+def backend():
+    """The benchmark's fake OpenAI/Bing/web backend on a local port."""
+    from fake_backend import BackendConfig, FakeBackend
+    with FakeBackend(BackendConfig(llm_latency=0.0, llm_tokens_per_second=0, search_latency=0.0,
+                                   page_latency=0.0, pages=20, page_paragraphs=5)) as server:
+        yield server
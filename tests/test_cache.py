@@ -0,0 +1,109 @@
+import time
+import asyncio
+
+import pytest
+
+from cache import CacheEntry, CacheStats, ContentCache, SingleFlight, SQLiteStore, TieredCache
+
+def entry(size: int) -> CacheEntry:
+    return CacheEntry(value="x", stored_at=time.time(), size=size)
+
+def test_sqlite_byte_total_is_kept_on_insert_replace_and_evict(tmp_path):
+    stats = CacheStats()
+    store = SQLiteStore(str(tmp_path / "c.sqlite"), max_bytes=100, stats=stats)
+    total = lambda: store._conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+    summed = lambda: store._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    store.set("a", entry(40))
+    store.set("b", entry(40))
+    store.set("a", entry(30))
+    assert total() == summed() == 70
+    store.set("c", entry(50))
+    assert store.get("b") is None and store.get("c") is not None
+    assert total() == summed() == 80
+    assert stats.disk_evictions == 1
+    store.delete("c")
+    assert total() == summed() == 30
+    store.close()
+
+    reopened = SQLiteStore(str(tmp_path / "c.sqlite"), max_bytes=100, stats=stats)
+    assert reopened._conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0] == 30
+
+def test_memory_and_disk_evictions_are_counted_apart(tmp_path):
+    cache = TieredCache(memory_bytes=10, disk_path=str(tmp_path / "t.sqlite"), disk_bytes=1000)
+    for i in range(5):
+        cache.set(f"k{i}", "value")
+    assert cache.stats.memory_evictions > 0 and cache.stats.disk_evictions == 0
+    assert cache.get("k0") == "value"
+
+def test_async_get_and_set_go_through_the_disk_tier(tmp_path):
+    path = str(tmp_path / "content.sqlite")
+
+    async def main():
+        cache = ContentCache(disk_path=path)
+        await cache.set_page("http://example.com/a?utm_source=x", "text", etag='"1"')
+        fresh = ContentCache(disk_path=path)
+        return await fresh.get_page("http://example.com/a"), await fresh.conditional_headers("http://example.com/a")
+
+    text, headers = asyncio.run(main())
+    assert text == "text"
+    assert headers == {"If-None-Match": '"1"'}
+
+def test_stale_page_is_revalidated(tmp_path):
+    async def main():
+        cache = ContentCache(ttl=60, disk_path=None)
+        await cache.set_page("http://example.com/", "old")
+        cache.memory.get("http://example.com/").stored_at -= 120
+        stale = await cache.get_page("http://example.com/")
+        return stale, await cache.revalidated("http://example.com/"), await cache.get_page("http://example.com/")
+
+    assert asyncio.run(main()) == (None, "old", "old")
+
+def test_single_flight_shares_one_call():
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+        return results, flight
+
+    results, flight = asyncio.run(main())
+    assert results == [1] * 5
+    assert flight.stats.coalesced == 4 and flight._inflight == {}
+
+def test_single_flight_survives_one_cancelled_caller_and_stops_when_all_are():
+    async def main():
+        flight = SingleFlight()
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(0.05)
+                return "done"
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        first = asyncio.ensure_future(flight.do("k", slow))
+        second = asyncio.ensure_future(flight.do("k", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "done"
+
+        third = asyncio.ensure_future(flight.do("j", slow))
+        await asyncio.sleep(0)
+        third.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await third
+        await asyncio.sleep(0)
+        return cancelled, flight
+
+    cancelled, flight = asyncio.run(main())
+    assert cancelled == [True]
+    assert flight._inflight == {}
@@ -0,0 +1,20 @@
+import context
+from context import ContextBuilder, count_tokens
+
+def test_token_counts_are_not_keyed_by_text():
+    page = "word " * 5000
+    tokens = count_tokens(page)
+    assert count_tokens(page) == tokens
+    assert all(not any(isinstance(part, str) and len(part) > 100 for part in key) for key in context._TOKEN_COUNTS)
+    assert len(context._TOKEN_COUNTS) <= context._TOKEN_COUNTS_SIZE
+
+def test_chunks_are_reused_and_bounded():
+    builder = ContextBuilder(chunk_tokens=16, cache_size=2)
+    text = "\n".join(f"line {i} about alpha and beta" for i in range(40))
+    chunks = builder.chunks("source", text)
+    assert builder.chunks("source", text) is chunks
+    assert sum(chunk.tokens for chunk in chunks) >= count_tokens(text) - len(chunks)
+    assert all(text not in key for key in builder._chunks)
+    builder.chunks("other", text)
+    builder.chunks("third", text)
+    assert len(builder._chunks) == 2
@@ -0,0 +1,26 @@
+import extract
+from extract import decode_body, html_to_text
+
+PAGE = """<html><body>
+<nav><a href="/">Home</a> <a href="/a">About</a></nav>
+<article><h1>Title</h1><p>First paragraph of the article.</p><p>Second paragraph.</p></article>
+<footer>Copyright</footer>
+</body></html>"""
+
+def test_main_text_without_boilerplate():
+    assert html_to_text(PAGE) == "Title\nFirst paragraph of the article.\nSecond paragraph."
+
+def test_xhtml_with_xml_declaration():
+    xhtml = '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n<html xmlns="http://www.w3.org/1999/xhtml">' + PAGE[6:]
+    assert "First paragraph of the article." in html_to_text(xhtml)
+    assert "First paragraph of the article." in html_to_text(decode_body(xhtml.encode("utf-8")))
+
+def test_lxml_failure_falls_back_to_beautifulsoup(monkeypatch):
+    def broken(html):
+        return None
+    monkeypatch.setattr(extract, "_html_to_text_lxml", broken)
+    monkeypatch.setattr(extract, "HTML_PARSER", "lxml")
+    assert "Second paragraph." in html_to_text(PAGE)
+
+def test_empty_page():
+    assert html_to_text("") == ""
@@ -0,0 +1,49 @@
+import time
+import asyncio
+
+import httpx
+
+from fetcher import PageFetcher
+
+def slow_fetcher(delay: float, **kwargs) -> PageFetcher:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(delay)
+        return httpx.Response(200, headers={"content-type": "text/html"}, content=b"<html><p>page</p></html>")
+
+    fetcher = PageFetcher(**kwargs)
+    fetcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return fetcher
+
+def test_fetch_page(backend):
+    async def main():
+        fetcher = PageFetcher()
+        try:
+            page = await fetcher.fetch(f"{backend.url}/pages/1")
+            missing = await fetcher.fetch(f"{backend.url}/pages/999")
+        finally:
+            await fetcher.aclose()
+        return page, missing
+
+    page, missing = asyncio.run(main())
+    assert page.ok and "<article>" in page.text and page.etag == '"page-1"'
+    assert not missing.ok and missing.error == "HTTP 404"
+
+def test_host_limit_wait_counts_against_deadline():
+    async def main():
+        fetcher = slow_fetcher(0.15, per_host_limit=1, total_timeout=0.25)
+        start = time.perf_counter()
+        results = await asyncio.gather(fetcher.fetch("http://a.test/1"), fetcher.fetch("http://a.test/2"))
+        return results, time.perf_counter() - start, fetcher
+
+    (first, second), elapsed, fetcher = asyncio.run(main())
+    assert first.ok
+    assert second.error and "timed out" in second.error
+    assert elapsed < 0.35
+
+def test_host_semaphores_are_dropped_when_idle():
+    async def main():
+        fetcher = slow_fetcher(0.01, per_host_limit=2)
+        await asyncio.gather(*(fetcher.fetch(f"http://host{i}.test/") for i in range(50)))
+        return fetcher
+
+    assert asyncio.run(main())._hosts == {}
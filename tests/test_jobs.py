@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from conftest import FakeLLM
+from jobs import JobManager, JobRejected, JobStore
+from LLM import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, request_priority
+
+def record_priorities(fake_llm) -> list[int]:
+    priorities = []
+
+    def reply(messages, kwargs):
+        priorities.append(request_priority.get())
+        return FakeLLM.default_reply(messages, kwargs)
+    fake_llm.reply = reply
+    return priorities
+
+async def finish(manager: JobManager, *jobs):
+    while any(job.status not in ("done", "failed", "cancelled") for job in jobs):
+        await asyncio.sleep(0.01)
+    await manager.aclose()
+
+def test_submitted_jobs_run_at_background_priority(make_tool, fake_llm):
+    priorities = record_priorities(fake_llm)
+
+    async def main():
+        manager = JobManager(make_tool(), workers=1)
+        background = manager.submit("first")
+        await finish(manager, background)
+        split = len(priorities)
+        interactive = manager.submit("second", priority=PRIORITY_INTERACTIVE)
+        await finish(manager, interactive)
+        return background, interactive, split
+
+    background, interactive, split = asyncio.run(main())
+    assert background.status == interactive.status == "done"
+    assert set(priorities[:split]) == {PRIORITY_BACKGROUND}
+    assert set(priorities[split:]) == {PRIORITY_INTERACTIVE}
+
+def test_timeout_counts_queue_wait(make_tool, fake_llm):
+    fake_llm.latency = 0.05
+
+    async def main():
+        manager = JobManager(make_tool(), workers=1)
+        manager._average_seconds = 0.01
+        first = manager.submit("first")
+        second = manager.submit("second", timeout=0.1)
+        await finish(manager, first, second)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first.status == "done"
+    assert second.status == "failed" and second.error == "timed out waiting in the queue"
+
+def test_expected_wait_beyond_timeout_is_rejected(make_tool, fake_llm):
+    fake_llm.latency = 0.05
+
+    async def main():
+        manager = JobManager(make_tool(), workers=1)
+        manager._average_seconds = 30
+        manager.submit("first")
+        await asyncio.sleep(0.01)
+        try:
+            with pytest.raises(JobRejected):
+                manager.submit("second", timeout=10)
+            assert manager.submit("third", timeout=60).status == "queued"
+        finally:
+            await manager.aclose()
+
+    asyncio.run(main())
+
+def test_clients_are_served_in_turn(make_tool, fake_llm):
+    async def main():
+        manager = JobManager(make_tool(), workers=1)
+        burst = [manager.submit(f"a{i}", client="a") for i in range(3)]
+        other = manager.submit("b", client="b")
+        assert manager.position(other) == 1
+        await finish(manager, *burst, other)
+        return burst, other
+
+    burst, other = asyncio.run(main())
+    order = sorted(burst + [other], key=lambda job: job.started)
+    assert order.index(other) == 1
+
+def test_cancel_queued_and_running_jobs(make_tool, fake_llm):
+    fake_llm.latency = 0.05
+
+    async def main():
+        manager = JobManager(make_tool(), workers=1)
+        running = manager.submit("first")
+        queued = manager.submit("second")
+        await asyncio.sleep(0.02)
+        assert manager.cancel(queued.id) and manager.cancel(running.id)
+        await finish(manager, running, queued)
+        return running, queued, manager
+
+    running, queued, manager = asyncio.run(main())
+    assert running.status == queued.status == "cancelled"
+    assert manager.running == 0 and manager.queued == 0
+
+def test_job_states_reach_the_store_without_a_write_per_event(make_tool, fake_llm, tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    writes = []
+    save_rows = store.save_rows
+    store.save_rows = lambda rows: (writes.append([row[2] for row in rows]), save_rows(rows))
+
+    async def main():
+        manager = JobManager(make_tool(), workers=1, store=store, save_interval=60)
+        job = manager.submit("question")
+        await finish(manager, job)
+        return job
+
+    job = asyncio.run(main())
+    saved = store.load(job.id)
+    assert saved["status"] == "done" and saved["result"] == job.result
+    assert saved["events"] == job.events
+    # Queued, running and done are written as they happen; progress in between waits for the interval
+    assert len(writes) < len(job.events)
+
+def test_server_builds_its_job_pool_when_the_worker_starts(monkeypatch, tmp_path):
+    import deepsearch_mcp
+    monkeypatch.setattr(deepsearch_mcp, "_search_tool", None)
+    monkeypatch.setattr(deepsearch_mcp, "_jobs", None)
+    # Set after import, as main() does before starting the workers
+    monkeypatch.setenv("DEEPSEARCH_JOB_DB", str(tmp_path / "jobs.sqlite"))
+    deepsearch_mcp.create_app()
+    assert deepsearch_mcp._jobs is deepsearch_mcp.jobs()
+    assert deepsearch_mcp.jobs().store is not None and deepsearch_mcp.jobs().tool is deepsearch_mcp.search_tool()
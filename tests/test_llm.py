@@ -0,0 +1,114 @@
+import json
+import asyncio
+
+import httpx
+import pytest
+from pydantic import BaseModel
+
+from LLM.openai import OpenAI, ResponseCache, StructuredOutputError
+from budget import BudgetLimits, ResearchBudget
+from deepsearch import DeepResearchParams, SearchKeywords
+from routing import ModelRouter
+
+class Answer(BaseModel):
+    answer: int
+
+def mock_client(replies: list[str], latency: float = 0.0) -> tuple[OpenAI, list[dict]]:
+    """Client whose chat completions answer with replies in turn; requests are recorded."""
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        await asyncio.sleep(latency)
+        content = replies[min(len(requests), len(replies)) - 1]
+        return httpx.Response(200, json={
+            "id": "mock", "object": "chat.completion", "created": 0, "model": "m",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    client = OpenAI(api_key="test", base_url="http://llm.test/v1", response_cache=ResponseCache(disk_path=None))
+    client._async_http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client, requests
+
+def test_invalid_structured_reply_is_not_cached():
+    client, requests = mock_client(["not json", '{"answer": 1}'])
+    messages = [{"role": "user", "content": "question"}]
+
+    async def main():
+        first = await client.parse(messages, Answer, model="m", temperature=0)
+        cached = len(client.response_cache.memory._entries)
+        second = await client.parse(messages, Answer, model="m", temperature=0)
+        third = await client.parse(messages, Answer, model="m", temperature=0)
+        return cached, [reply.choices[0].message.parsed.answer for reply in (first, second, third)]
+
+    cached, answers = asyncio.run(main())
+    assert answers == [1, 1, 1]
+    # Only the repaired reply was stored, so the second parse asked again and its valid reply was kept
+    assert cached == 1
+    assert len(requests) == 3
+
+def test_identical_deterministic_calls_share_one_request():
+    client, requests = mock_client(["same"], latency=0.05)
+    messages = [{"role": "user", "content": "question"}]
+
+    async def main():
+        calls = [client(messages, model="m", temperature=0) for _ in range(5)]
+        return await asyncio.gather(*calls), await client(messages, model="m", temperature=0)
+
+    replies, later = asyncio.run(main())
+    assert [reply.choices[0].message.content for reply in replies] == ["same"] * 5
+    assert later.choices[0].message.content == "same"
+    assert len(requests) == 1
+    assert client.response_cache.stats.coalesced == 4 and client.response_cache.stats.hits == 1
+
+def test_temperature_above_zero_is_not_cached_by_default():
+    client, requests = mock_client(["a", "b"])
+    messages = [{"role": "user", "content": "question"}]
+
+    async def main():
+        return [await client(messages, model="m", temperature=0.5) for _ in range(2)]
+
+    asyncio.run(main())
+    assert len(requests) == 2
+
+def test_decision_steps_run_at_temperature_zero(make_tool, fake_llm):
+    tool = make_tool()
+    asyncio.run(tool.run_research(DeepResearchParams(searchQuery="question")))
+    temperatures = {step: kwargs.get("temperature") for step, kwargs in fake_llm.calls}
+    assert temperatures["plan"] == 0 and temperatures["keyword"] == 0 and temperatures["judge"] == 0
+    assert temperatures["summary"] is None
+
+def test_default_client_reads_the_environment_when_first_used(monkeypatch, tmp_path):
+    from deepsearch import WebSearchTool, default_llm
+    default_llm.cache_clear()
+    monkeypatch.setenv("LLM_RATE_LIMIT_DB", str(tmp_path / "limits.sqlite"))
+    try:
+        assert WebSearchTool.llm is WebSearchTool().llm is default_llm()
+        assert WebSearchTool.llm.scheduler.store is not None
+    finally:
+        default_llm.cache_clear()
+
+def test_repair_retries_are_counted_in_the_reply_and_the_error():
+    client, requests = mock_client(["not json", '{"answer": 1}', "not json"])
+    messages = [{"role": "user", "content": "question"}]
+
+    async def main():
+        repaired = await client.parse(messages, Answer, model="m", temperature=0)
+        with pytest.raises(StructuredOutputError) as failed:
+            await client.parse([{"role": "user", "content": "other"}], Answer, model="m", temperature=0, max_repairs=1)
+        return repaired, failed.value
+
+    repaired, failed = asyncio.run(main())
+    assert repaired.attempts == 2 and repaired.usage.total_tokens == 4
+    assert failed.attempts == 2 and failed.usage.total_tokens == 4
+
+def test_escalations_and_repairs_are_charged_to_the_budget(make_tool, fake_llm):
+    replies = iter(["not json", '{"keywords": ["alpha"]}'])
+    fake_llm.reply = lambda messages, kwargs: next(replies)
+    tool = make_tool(router=ModelRouter({"keyword": ["small", "large"]}))
+    budget = ResearchBudget(BudgetLimits())
+    keywords = asyncio.run(tool.call_step("keyword", budget, [{"role": "system", "content": "keywords"}],
+                                          response_model=SearchKeywords))
+    assert keywords.keywords == ["alpha"]
+    assert budget.llm_calls == 2
@@ -0,0 +1,48 @@
+import asyncio
+
+from budget import BudgetLimits
+from conftest import FakeLLM
+from deepsearch import DeepResearchParams
+
+def run(tool, query: str = "question"):
+    events = []
+    result = asyncio.run(tool.run_research(DeepResearchParams(searchQuery=query), events.append))
+    return result, events
+
+def test_budget_running_out_during_planning_stops_cleanly(make_tool, fake_llm):
+    fake_llm.latency = 0.2
+    tool = make_tool(budget_limits=BudgetLimits(deadline=0.05))
+    result, events = run(tool)
+    assert result == {}
+    assert events[-1].type == "result"
+    assert events[-1].data["budget"]["stop_reason"] == "deadline"
+
+def test_unparseable_plan_is_reported_as_an_error_event(make_tool, fake_llm):
+    fake_llm.reply = lambda messages, kwargs: "not json"
+    result, events = run(make_tool())
+    assert "error" in result
+    assert events[-1].type == "error"
+
+def test_failed_sub_question_keeps_the_others(make_tool, fake_llm):
+    def reply(messages, kwargs):
+        if FakeLLM.step(messages) == "keyword" and "second" in str(messages[-1]["content"]):
+            raise RuntimeError("keyword service down")
+        return FakeLLM.default_reply(messages, kwargs)
+    fake_llm.reply = reply
+    result, events = run(make_tool())
+    assert list(result) == ["first"]
+    failed = [event.data for event in events if event.type == "sub_question_failed"]
+    assert failed == [{"sub_question": "second", "error": "keyword service down"}]
+    assert events[-1].type == "result"
+
+def test_failed_judge_returns_the_results_so_far(make_tool, fake_llm):
+    def reply(messages, kwargs):
+        if FakeLLM.step(messages) == "judge":
+            raise RuntimeError("judge down")
+        return FakeLLM.default_reply(messages, kwargs)
+    fake_llm.reply = reply
+    result, events = run(make_tool())
+    assert list(result) == ["first", "second"]
+    assert events[-1].type == "result"
+    assert events[-1].data["error"] == "judge down"
+    assert events[-1].data["budget"]["stop_reason"] == "error"
@@ -0,0 +1,70 @@
+import json
+import time
+import asyncio
+
+from cache import ResearchCache
+from conftest import FakeLLM
+from deepsearch import DeepResearchParams
+
+def cache(**kwargs) -> ResearchCache:
+    kwargs.setdefault("disk_path", None)
+    return ResearchCache(**kwargs)
+
+def test_reordered_query_is_a_hit():
+    research = cache()
+    research.store("China NEV exports in 2023", {"q": "answer"})
+    match = research.lookup("in 2023 China NEV exports")
+    assert match.mode == "hit" and match.result == {"q": "answer"}
+
+def test_different_numbers_or_names_never_match():
+    research = cache()
+    research.store("What were the NEV exports of China in 2023 by main destination country", {"q": "2023"})
+    research.store("What were the smartphone sales of Apple in Europe", {"q": "Apple"})
+    assert research.lookup("What were the NEV exports of China in 2024 by main destination country") is None
+    assert research.lookup("What were the smartphone sales of Samsung in Europe") is None
+
+def test_one_different_word_is_not_a_hit():
+    research = cache()
+    research.store("What were the NEV exports of China in 2023 by main destination country", {"q": "exports"})
+    match = research.lookup("What were the NEV imports of China in 2023 by main destination country")
+    assert match.mode == "seed"
+
+def test_seed_only_reuses_answers_to_the_same_sub_questions(make_tool, fake_llm):
+    research = cache()
+    research.store("What were China's NEV exports in 2023?", {
+        "Find China's NEV export volume in 2023": "1.2 million exported",
+        "Find the main destinations of China's NEV exports": "Belgium and Thailand",
+    })
+
+    def reply(messages, kwargs):
+        if FakeLLM.step(messages) == "plan":
+            return json.dumps({"plan": [{"step": 1, "sub_question": "Find China's NEV export volume in 2023"},
+                                        {"step": 2, "sub_question": "Find China's NEV import volume in 2023"}]})
+        return FakeLLM.default_reply(messages, kwargs)
+    fake_llm.reply = reply
+
+    tool = make_tool(research_cache=research)
+    result = asyncio.run(tool.run_research(DeepResearchParams(searchQuery="What were China's NEV imports in 2023?")))
+    assert result == {"Find China's NEV export volume in 2023": "1.2 million exported",
+                      "Find China's NEV import volume in 2023": "summary text"}
+    assert fake_llm.steps().count("summary") == 1
+    assert research.lookup("What were China's NEV imports in 2023?").result == result
+
+def test_band_index_drops_evicted_and_expired_entries():
+    research = cache(memory_bytes=2000)
+    for i in range(50):
+        research.store(f"question number {i} about topic {i}", {"q": "x" * 200})
+    assert set(research._key_bands) <= set(research.memory._entries)
+    assert {key for keys in research._bands.values() for key in keys} == set(research._key_bands)
+
+    research = cache(ttl=60)
+    research.store("an old question", {"q": "x"})
+    research.memory.get(research.key("an old question")).stored_at -= 120
+    assert research.lookup("an old question") is None
+    assert research._bands == {} and research._key_bands == {}
+
+def test_research_cache_is_opt_in(make_tool, monkeypatch):
+    monkeypatch.delenv("DEEPSEARCH_RESEARCH_CACHE", raising=False)
+    assert make_tool().research_cache is None
+    monkeypatch.setenv("DEEPSEARCH_RESEARCH_CACHE", "1")
+    assert make_tool().research_cache is not None
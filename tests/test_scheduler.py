@@ -0,0 +1,74 @@
+import json
+import asyncio
+
+import httpx
+
+from LLM import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from LLM.openai import OpenAI, RateLimit, RequestScheduler, SharedRateLimitStore, TokenBucket
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_token_bucket_refills_and_carries_debt():
+    clock = Clock()
+    bucket = TokenBucket(60, clock=clock)  # one per second
+    bucket.consume(60)
+    assert bucket.wait_time(1) == 1.0
+    clock.now = 0.5
+    assert bucket.wait_time(1) == 0.5
+    bucket.adjust(10)  # used ten more than estimated
+    assert bucket.wait_time(1) == 10.5
+    assert bucket.wait_time(1000) == 69.5  # capped at the capacity
+
+def test_interactive_requests_go_first():
+    scheduler = RequestScheduler(default_limit=RateLimit(rpm=600))
+    order = []
+
+    async def request(name: str, priority: int):
+        await scheduler.acquire("m", 1, priority)
+        order.append(name)
+
+    async def main():
+        await scheduler.acquire("m", 1)
+        scheduler._state("m").requests.level = 0  # every further request waits its turn, 0.1 s apart
+        background = [asyncio.create_task(request(f"background {i}", PRIORITY_BACKGROUND)) for i in range(3)]
+        await asyncio.sleep(0)
+        interactive = [asyncio.create_task(request(f"interactive {i}", PRIORITY_INTERACTIVE)) for i in range(2)]
+        await asyncio.gather(*background, *interactive)
+
+    asyncio.run(main())
+    # Interactive requests arriving later still overtake every background one waiting for budget
+    assert order == ["interactive 0", "interactive 1", "background 0", "background 1", "background 2"]
+    assert scheduler.waiting() == {"m": 0}
+
+def test_rate_limited_request_is_retried_after_retry_after():
+    replies = [httpx.Response(429, headers={"retry-after-ms": "50"}, json={"error": {"message": "slow down"}}),
+               httpx.Response(200, json={"id": "x", "object": "chat.completion", "created": 0, "model": "m",
+                                         "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}}],
+                                         "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}})]
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        return replies[len(requests) - 1]
+
+    client = OpenAI(api_key="test", base_url="http://llm.test/v1", scheduler=RequestScheduler(max_retries=2))
+    client._async_http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    reply = asyncio.run(client([{"role": "user", "content": "hi"}], model="m"))
+    assert reply.choices[0].message.content == "ok"
+    assert len(requests) == 2 and client.scheduler.retries == 1
+    assert client.scheduler._state("m").paused_until > 0
+
+def test_shared_store_splits_the_limit_between_processes(tmp_path):
+    path = str(tmp_path / "ratelimits.sqlite")
+    first, second = SharedRateLimitStore(path), SharedRateLimitStore(path)
+    limit = RateLimit(rpm=2)
+    assert first.try_acquire("m", limit, 10) == 0
+    assert second.try_acquire("m", limit, 10) == 0
+    assert first.try_acquire("m", limit, 10) > 0
+    second.pause("other", 30)
+    assert first.try_acquire("other", RateLimit(), 10) > 29
@@ -0,0 +1,36 @@
+import asyncio
+
+from rerank import Reranker
+from retrieval import EvidenceStore
+
+class KeepAll(Reranker):
+    async def rerank(self, query, titles, snippets):
+        return list(range(len(titles)))
+
+PAGES = {f"http://example.com/{i}": f"page {i} about alpha and beta " * 10 for i in range(4)}
+
+def slow_pages(tool, fast: set[str], delay: float):
+    async def extract_url_content(url):
+        if url not in fast:
+            await asyncio.sleep(delay)
+        return PAGES[url]
+    tool.extract_url_content = extract_url_content
+
+def test_search_cut_off_at_good_enough_is_not_recorded(make_tool):
+    tool = make_tool(PAGES, reranker=KeepAll(), good_enough_sources=1)
+    slow_pages(tool, {"http://example.com/0"}, delay=10)
+    evidence = EvidenceStore(tool.context_builder)
+
+    async def main():
+        first = await tool.collect_references(["alpha"], "question", evidence)
+        tool.good_enough_sources = len(PAGES)
+        slow_pages(tool, set(PAGES), delay=0)
+        searched_after_cutoff = evidence.searched("alpha")
+        second = await tool.collect_references(["alpha"], "question", evidence)
+        return first, searched_after_cutoff, second
+
+    first, searched_after_cutoff, second = asyncio.run(main())
+    assert [reference["url"] for reference in first] == ["http://example.com/0"]
+    assert searched_after_cutoff is None
+    assert len(second) == len(PAGES)
+    assert len(evidence.searched("alpha")) == len(PAGES)
@@ -0,0 +1,41 @@
+import asyncio
+
+from rerank import Reranker
+from retrieval import EvidenceStore
+
+class KeepAll(Reranker):
+    async def rerank(self, query, titles, snippets):
+        return list(range(len(titles)))
+
+def page(number: int, lines: int) -> str:
+    return "\n".join(f"alpha beta fact {i} of page {number}, with a few more words to fill the line" for i in range(lines))
+
+def research(tool, sub_question: str = "what about alpha and beta"):
+    evidence = EvidenceStore(tool.context_builder)
+    return asyncio.run(tool.research_sub_question(sub_question, "", evidence=evidence))
+
+def test_large_source_set_is_map_reduced(make_tool, fake_llm):
+    pages = {f"http://example.com/{i}": page(i, 150) for i in range(6)}
+    tool = make_tool(pages, reranker=KeepAll())
+    summary = research(tool)
+    steps = fake_llm.steps()
+    assert steps.count("condense") >= 2
+    assert steps[-1] == "summary" and summary == "summary text"
+
+def test_small_source_set_is_summarized_in_one_call(make_tool, fake_llm):
+    pages = {f"http://example.com/{i}": page(i, 5) for i in range(3)}
+    tool = make_tool(pages, reranker=KeepAll())
+    research(tool)
+    assert "condense" not in fake_llm.steps()
+    assert fake_llm.steps().count("summary") == 1
+
+def test_pages_sharing_only_stopwords_do_not_trigger_map_reduce(make_tool, fake_llm):
+    pages = {"http://example.com/france": "Paris is the capital of France and the seat of its government."}
+    for i in range(6):
+        pages[f"http://example.com/pasta{i}"] = "\n".join(
+            f"The history of the pasta {j} is one of the oldest in the kitchens of Italy, and it is what we cook"
+            for j in range(150))
+    tool = make_tool(pages, reranker=KeepAll())
+    research(tool, "What is the capital of France")
+    assert "condense" not in fake_llm.steps()
+    assert fake_llm.steps().count("summary") == 1
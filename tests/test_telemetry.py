@@ -0,0 +1,51 @@
+import time
+import asyncio
+
+from telemetry import MetricsRegistry, SharedMetrics
+
+def worker(path: str, requests: int, queued: int) -> SharedMetrics:
+    registry = MetricsRegistry()
+    counter = registry.counter("requests", "Requests")
+    histogram = registry.histogram("seconds", "Seconds", buckets=(0.1, 1.0))
+    registry.collector("queued", "Queued", lambda: {(): queued})
+    counter.inc(requests, model="m")
+    histogram.observe(0.5)
+    return SharedMetrics(registry, path, interval=60)
+
+def test_metrics_are_summed_over_workers(tmp_path):
+    path = str(tmp_path / "metrics.sqlite")
+    first, second = worker(path, 3, 1), worker(path, 4, 2)
+    second.publish()
+    rendered = first.render()
+    assert 'requests_total{model="m"} 7' in rendered
+    assert 'seconds_bucket{le="0.1"} 0' in rendered and 'seconds_bucket{le="1.0"} 2' in rendered
+    assert rendered.index('le="0.1"') < rendered.index('le="1.0"') < rendered.index('le="+Inf"')
+    assert "queued 3" in rendered
+    # Answering again does not count this worker twice
+    assert 'requests_total{model="m"} 7' in first.render()
+
+def test_gauges_of_workers_that_stopped_publishing_are_dropped(tmp_path):
+    path = str(tmp_path / "metrics.sqlite")
+    first, gone = worker(path, 3, 1), worker(path, 4, 2)
+    gone.publish()
+    gone._conn.execute("UPDATE workers SET updated = ? WHERE worker = ?", (time.time() - 3600, gone.worker))
+    rendered = first.render()
+    assert "queued 1" in rendered
+    assert 'requests_total{model="m"} 7' in rendered
+
+def test_reset_forgets_earlier_runs(tmp_path):
+    path = str(tmp_path / "metrics.sqlite")
+    worker(path, 3, 1).publish()
+    SharedMetrics.reset(path)
+    assert 'requests_total{model="m"} 4' in worker(path, 4, 0).render()
+
+def test_cache_statistics_are_exported():
+    import deepsearch_mcp
+    content_cache = deepsearch_mcp.search_tool().content_cache
+    asyncio.run(content_cache.get_page("http://example.com/missing"))
+    content_cache.stats.memory_evictions += 2
+    body = asyncio.run(deepsearch_mcp.prometheus_metrics(None)).body.decode()
+    assert "# TYPE deepsearch_cache_events counter" in body
+    assert f'deepsearch_cache_events_total{{cache="content",event="misses"}} {content_cache.stats.misses}' in body
+    assert f'deepsearch_cache_events_total{{cache="content",event="memory_evictions"}} {content_cache.stats.memory_evictions}' in body
+    assert 'deepsearch_cache_events_total{cache="search",event="disk_evictions"} 0' in body